@@ -1,5 +1,14 @@
+import numpy as np
+
 import group_recipes
+import instrumentation
+from binary_pack import BinaryPackWriter
+import encoder
 from flame import Flame, FlamePack
+from mobius_array import MobiusArray
+from pipeline import Pipeline
+import render
+import views
 
 class FractalAnimation(object):
     """
@@ -8,27 +17,102 @@ class FractalAnimation(object):
     This is an abstract class
     """
     SIZE = "500 500"
-    def __init__(self, num_frames, palette, curve_zoom):
+    def __init__(self, num_frames, palette, curve_zoom, weighted=False):
         """
         Set up generic animation parameters
         num_frames: number of frames in the animation.
+        weighted: if True, weight each xform by how much it stretches the
+            visible part of the attractor (see Flame.set_contraction_weights)
+            so renders converge in fewer samples
         """
         self.num_frames = num_frames
         self.palette = palette
         self.curve_zoom = curve_zoom
+        self.weighted = weighted
 
     def make_animation(self, pack_name, fname):
-        flames = list(self.make_flames())
-        pack = FlamePack(pack_name, flames)
-        pack.save(fname)
-    
+        """
+        Compute and save the animation. Frame parameters, flame
+        construction, serialization and disk writes run as a pipeline
+        (see pipeline.py) so writing the file overlaps with computing it.
+        The pipeline is kept in self.pipeline for its stage statistics,
+        which also go in the report when instrumentation is enabled (see
+        instrumentation.py)
+        """
+        self.pipeline = Pipeline()
+        self.pipeline.add_source('params', self.frame_params())
+        self.pipeline.add_stage('flames', self.make_flame)
+        if self.weighted:
+            self.pipeline.add_stage('weights', self.weight_flame)
+        self.pipeline.add_stage('serialize', lambda flame: flame.text)
+        self.pipeline.add_sink(
+            'write',
+            lambda texts: FlamePack.save_texts(pack_name, texts, fname))
+        with instrumentation.run('make_animation', fname) as stats:
+            self.pipeline.run()
+            stats.add_pipeline(self.pipeline)
+
+    def make_video(
+            self, fname, delay=encoder.DELAY, warm_start=True, **kwargs):
+        """
+        Render the animation natively and encode it as an animated GIF or
+        APNG depending on the extension of fname. Frames are encoded as
+        soon as they are rendered, so only a few frames are ever in
+        memory. Each frame starts from the points of the previous one
+        unless warm_start is False (see render.WarmStart). Other keyword
+        arguments are passed to render.render_flame()
+        """
+        self.warm_start = render.WarmStart() if warm_start else None
+
+        def render_frame(flame):
+            image = render.render_flame(
+                flame, warm_start=self.warm_start, **kwargs)
+            return (image, flame.palette)
+
+        width, height = [int(x) for x in self.SIZE.split()]
+        self.pipeline = Pipeline(max_queued=2)
+        self.pipeline.add_source('params', self.frame_params())
+        self.pipeline.add_stage('flames', self.make_flame)
+        if self.weighted:
+            self.pipeline.add_stage('weights', self.weight_flame)
+        self.pipeline.add_stage('render', render_frame)
+        self.pipeline.add_sink(
+            'encode',
+            lambda frames: encoder.save_animation(
+                fname, frames, width, height, delay))
+        self.pipeline.run()
+
     def make_flames(self):
         raise NotImplementedError("Implement in subclass!")
 
+    def frame_params(self):
+        """
+        Generate the per-frame inputs to make_flame(). By default these are
+        just the finished flames from make_flames()
+        """
+        return self.make_flames()
+
+    def make_flame(self, params):
+        """
+        Turn one item from frame_params() into a Flame, or return None to
+        skip the frame
+        """
+        return params
+
+    def weight_flame(self, flame):
+        flame.set_contraction_weights()
+        return flame
+
 class GrandmasAnimation(FractalAnimation):
     """
     Animation using "Grandma's recipe" from the book Indra's Pearls
     """
+    # Same as the names in make_flames, in the form BinaryPack expects
+    NAME_FORMAT = (
+        "frame_{index:04}_zoom_{zoom:.3f}"
+        "_tr_a_{trace_a.real:.3f}_{trace_a.imag:.3f}i"
+        "_tr_b_{trace_b.real:.3f}_{trace_b.imag:.3f}i")
+
     def __init__(self, curve_trace_a, curve_trace_b, plus_root=True, **kwargs):
         """
         Two new parameters:
@@ -45,23 +129,66 @@ class GrandmasAnimation(FractalAnimation):
         self.plus_root = plus_root
 
     def make_flames(self):
-        for i, zoom, trace_a, trace_b in self.animate_params():
-            flame_name = "frame_{:04}_zoom_{:.3f}_tr_a_{}_tr_b_{}".format(
-                i, 
-                zoom, 
-                self.format_complex(trace_a), 
-                self.format_complex(trace_b))
-            try:
-                xforms = group_recipes.grandmas_recipe(
-                    trace_a, trace_b, self.plus_root)
-                yield Flame(
-                    flame_name,
-                    xforms,
-                    palette=self.palette,
-                    zoom=zoom,
-                    size=self.SIZE)
-            except ZeroDivisionError as e:
-                print("Warning: skipping invalid frame {}".format(flame_name))
+        for params in self.animate_params():
+            flame = self.make_flame(params)
+            if flame is not None:
+                yield flame
+
+    def frame_params(self):
+        return self.animate_params()
+
+    def make_flame(self, params):
+        """
+        Run the recipe for one frame of animate_params()
+        """
+        i, zoom, trace_a, trace_b = params
+        flame_name = "frame_{:04}_zoom_{:.3f}_tr_a_{}_tr_b_{}".format(
+            i, 
+            zoom, 
+            self.format_complex(trace_a), 
+            self.format_complex(trace_b))
+        try:
+            xforms = group_recipes.grandmas_recipe(
+                trace_a, trace_b, self.plus_root)
+            return Flame(
+                flame_name,
+                xforms,
+                palette=self.palette,
+                zoom=zoom,
+                size=self.SIZE)
+        except ZeroDivisionError as e:
+            print("Warning: skipping invalid frame {}".format(flame_name))
+            instrumentation.count('frames_skipped')
+            return None
+
+    def make_binary_pack(self, pack_name, dirname):
+        """
+        Save the animation as a binary pack (see binary_pack.py) instead
+        of a .flame file
+        """
+        writer = BinaryPackWriter(
+            dirname,
+            pack_name,
+            self.num_frames,
+            num_generators=2,
+            size=self.SIZE,
+            name_format=self.NAME_FORMAT)
+        with writer:
+            for i, zoom, trace_a, trace_b in self.animate_params():
+                try:
+                    xforms = group_recipes.grandmas_recipe(
+                        trace_a, trace_b, self.plus_root)
+                    weights = None
+                    if self.weighted:
+                        flame = self.weight_flame(Flame(
+                            None, xforms, self.palette, zoom, self.SIZE))
+                        weights = flame.weights
+                    writer.write(
+                        i, xforms, zoom, self.palette, trace_a, trace_b,
+                        weights)
+                except ZeroDivisionError as e:
+                    print("Warning: skipping invalid frame {}".format(i))
+                    writer.skip(i, trace_a, trace_b)
 
     def animate_params(self):
         """
@@ -83,3 +210,108 @@ class GrandmasAnimation(FractalAnimation):
         Format a complex number for use in a filename
         """
         return "{:.3f}_{:.3f}i".format(z.real, z.imag)
+
+class KeyframeAnimation(FractalAnimation):
+    """
+    Animation that moves smoothly between keyframe groups. Each generator
+    is interpolated along a one-parameter subgroup of SL(2, C)
+
+    g(t) = g0 * (g0^-1 * g1)^t
+
+    (i.e. with a matrix log/exp), so the recipes only need to be
+    evaluated once per keyframe, and every frame is computed in a single
+    batched MobiusArray.power call.
+    """
+    def __init__(self, keyframes, **kwargs):
+        """
+        One new parameter:
+        keyframes - a list of at least 2 groups (lists of Mobius maps in the
+        format returned by group_recipes.make_group). The keyframes are
+        spaced evenly over the animation. To make a loop, repeat the first
+        keyframe at the end.
+        """
+        super(KeyframeAnimation, self).__init__(**kwargs)
+        if len(keyframes) < 2:
+            raise ValueError("Need at least 2 keyframes!")
+        self.keyframes = keyframes
+
+    @property
+    def generators(self):
+        """
+        Pack the generators (not the inverses) of every keyframe into a
+        MobiusArray of shape (keyframes, generators)
+        """
+        gens = [group[:len(group) // 2] for group in self.keyframes]
+        if len(set(len(g) for g in gens)) != 1:
+            raise ValueError("Keyframes must have the same number of generators")
+        return MobiusArray([
+            MobiusArray.from_mobius(g).normalize.matrices for g in gens])
+
+    def interpolate_frames(self):
+        """
+        Compute the generators for every frame at once. This returns
+        (keys, xforms) where keys is the fractional keyframe index of each
+        frame and xforms is a MobiusArray of shape (frames, generators)
+        """
+        gens = self.generators
+        num_segments = len(self.keyframes) - 1
+        keys = np.arange(self.num_frames) * (num_segments / self.num_frames)
+        segment = np.minimum(np.floor(keys).astype(int), num_segments - 1)
+        local_t = keys - segment
+
+        start = gens[:-1]
+        step = start.inv * gens[1:]
+        xforms = start[segment] * step[segment].power(local_t[:, np.newaxis])
+        return (keys, xforms)
+
+    def make_flames(self):
+        keys, xforms = self.interpolate_frames()
+        inverses = xforms.inv
+        dt = 1.0 / self.num_frames
+        for i, key in enumerate(keys):
+            zoom = self.curve_zoom(i * dt)
+            flame_name = "frame_{:04}_zoom_{:.3f}_key_{:.3f}".format(
+                i, zoom, key)
+            yield Flame(
+                flame_name,
+                xforms[i].to_list() + inverses[i].to_list(),
+                palette=self.palette,
+                zoom=zoom,
+                size=self.SIZE)
+
+class CameraAnimation(FractalAnimation):
+    """
+    Animation of a fixed group viewed from a moving camera. Rotating the
+    Riemann sphere by V is the same as conjugating every transformation by
+    V, so all the frames are computed with one batched conjugation.
+    """
+    def __init__(
+            self,
+            group,
+            curve_rotate_x=None,
+            curve_rotate_y=None,
+            curve_rotate_z=None,
+            **kwargs):
+        """
+        New parameters:
+        group - the list of Mobius transformations to display
+        curve_rotate_x/y/z - ParametricCurves of [0, 1] -> angle in radians
+            for rotations about each axis. See views.CameraPath
+        """
+        super(CameraAnimation, self).__init__(**kwargs)
+        self.group = group
+        self.camera = views.CameraPath(
+            curve_rotate_x, curve_rotate_y, curve_rotate_z)
+
+    def make_flames(self):
+        times = np.arange(self.num_frames) / float(self.num_frames)
+        frames = self.camera.conjugate(self.group, times)
+        for i, t in enumerate(times):
+            zoom = self.curve_zoom(t)
+            flame_name = "frame_{:04}_zoom_{:.3f}".format(i, zoom)
+            yield Flame(
+                flame_name,
+                frames[i].to_list(),
+                palette=self.palette,
+                zoom=zoom,
+                size=self.SIZE)
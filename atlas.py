@@ -1,20 +1,26 @@
 #!/usr/bin/env python
+import random
+
 from mobius import Mobius
 import mobius_recipes
 import group_recipes
+import instrumentation
 from flame import Flame, FlamePack, Palette
+from binary_pack import BinaryPackWriter
+from pipeline import Pipeline
 
 # This determines the size of the grid. This is a 4D grid, so be very
 # careful, the space complexity is O(R^4)
 RADIUS = 4
 
-def make_flame(trace_a, trace_b, plus_root=False):
+def make_flame(trace_a, trace_b, plus_root=False, palette=None):
     """
     Make a flame in a standard format
     """
     return Flame(
         'Grandma_a_{}_b_{}'.format(trace_a, trace_b),
         group_recipes.grandmas_recipe(trace_a, trace_b, plus_root),
+        palette=palette,
         zoom=0.5,
         size="500 500")
 
@@ -36,15 +42,32 @@ def b_then_a(lattice_points):
             yield (trace_a, trace_b)
 
 
-def make_atlas(outer_loop_a=True, plus_root=False):
-    # Generate gaussian integers (complex numbers with integer coordinates)
-    # in a square centered around the origin
-    int_range = range(-RADIUS, RADIUS + 1)
-    lattice_points = [
+def make_lattice(radius=RADIUS):
+    """
+    Generate gaussian integers (complex numbers with integer coordinates)
+    in a square centered around the origin
+    """
+    int_range = range(-radius, radius + 1)
+    return [
         complex(i, j) 
         for i in int_range 
         for j in int_range]
 
+def make_atlas(
+        outer_loop_a=True,
+        plus_root=False,
+        seed=None,
+        radius=RADIUS,
+        dirname='output',
+        verbose=False):
+    """
+    Make a .flame file with one flame for every pair of traces in the grid.
+    Each flame gets a random palette. Pass a seed to make the palettes
+    reproducible. verbose prints the pipeline stage timings, which are
+    also in the instrumentation report when that is enabled
+    """
+    lattice_points = make_lattice(radius)
+
     # Select settings
     loop_order = a_then_b if outer_loop_a else b_then_a
     order = 'ab' if outer_loop_a else 'ba'
@@ -52,27 +75,76 @@ def make_atlas(outer_loop_a=True, plus_root=False):
 
     print("-------------------------")
     print("Making atlas radius {}, order {}, root {}".format(
-        RADIUS, order, root)) 
+        radius, order, root))
 
     # Generate fractal settings for all of the combinations
-    # Yes, all (2 * RADIUS + 1)^4 of them O.o
-    flames = []
-    invalid_count = 0
-    for trace_a, trace_b in loop_order(lattice_points):
+    # Yes, all (2 * radius + 1)^4 of them O.o
+    invalid_count = [0]
+    palette_rng = random.Random(seed)
+    def recipe(traces):
+        trace_a, trace_b = traces
         try:
-            flame = make_flame(trace_a, trace_b, plus_root)
-            flames.append(flame)
+            palette = Palette.random(palette_rng)
+            return make_flame(trace_a, trace_b, plus_root, palette)
         except ZeroDivisionError as e:
-            invalid_count += 1
+            invalid_count[0] += 1
+            instrumentation.count('frames_skipped')
             msg = "Divide by zero at Ta = {}, Tb = {}, sum = {}, diff = {}"  
             print(msg.format(
                 trace_a, trace_b, trace_a + trace_b, trace_a - trace_b))
-    print("invalid count: {}".format(invalid_count))
+            return None
+
+    # generate one *very* big .flame file. The recipe, serialization and
+    # disk writes run as a pipeline so writing overlaps with computing
+    fname = '{}/atlas_{}_{}_{}_root.flame'.format(
+        dirname, radius, order, root)
+    pipeline = Pipeline()
+    pipeline.add_source('traces', loop_order(lattice_points))
+    pipeline.add_stage('recipe', recipe)
+    pipeline.add_stage('serialize', lambda flame: flame.text)
+    pipeline.add_sink(
+        'write', lambda texts: FlamePack.save_texts('Atlas', texts, fname))
+    with instrumentation.run('make_atlas', fname) as stats:
+        pipeline.run()
+        stats.add_pipeline(pipeline)
+    print("invalid count: {}".format(invalid_count[0]))
+    if verbose:
+        print(pipeline.report())
+
+def make_binary_atlas(
+        outer_loop_a=True,
+        plus_root=False,
+        seed=None,
+        radius=RADIUS,
+        dirname='output'):
+    """
+    Same as make_atlas, but save a binary pack (see binary_pack.py).
+    Use BinaryPack(...).export() to get the .flame file, or a range of it
+    """
+    lattice_points = make_lattice(radius)
+    loop_order = a_then_b if outer_loop_a else b_then_a
+    order = 'ab' if outer_loop_a else 'ba'
+    root = 'plus' if plus_root else 'minus'
 
-    # generate one *very* big .flame file
-    pack = FlamePack('Atlas', flames)
-    pack.save('output/atlas_{}_{}_{}_root.flame'.format(RADIUS, order, root))
+    writer = BinaryPackWriter(
+        '{}/atlas_{}_{}_{}_root.npack'.format(dirname, radius, order, root),
+        'Atlas',
+        num_frames=len(lattice_points) ** 2,
+        num_generators=2,
+        size="500 500",
+        name_format="Grandma_a_{trace_a}_b_{trace_b}")
 
+    palette_rng = random.Random(seed)
+    with writer:
+        pairs = loop_order(lattice_points)
+        for i, (trace_a, trace_b) in enumerate(pairs):
+            try:
+                palette = Palette.random(palette_rng)
+                xforms = group_recipes.grandmas_recipe(
+                    trace_a, trace_b, plus_root)
+                writer.write(i, xforms, 0.5, palette, trace_a, trace_b)
+            except ZeroDivisionError as e:
+                writer.skip(i, trace_a, trace_b)
 
 if __name__ == '__main__':
     make_atlas(False, False)
@@ -19,8 +19,8 @@ def rotate(theta):
     Rotation of theta radians about the origin.
     This is normalized to have determinant 1
     """
-    a = cmath.exp(theta)
-    return Mobius(a, 0, 0, a.conj)
+    a = cmath.exp(0.5j * theta)
+    return Mobius(a, 0, 0, a.conjugate())
 
 def scale(k):
     """
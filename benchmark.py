@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+"""
+Benchmarks for the hot paths, with a stored baseline to catch regressions
+
+Covers the Mobius and Cline arithmetic, Grandma's recipe, palettes, flame
+serialization at several pack sizes, a whole radius 2 atlas and every
+animation in params/. Each benchmark reports the best time per call over
+a few repeats, since the minimum is the least noisy estimate.
+
+python benchmark.py                  # run everything and print the times
+python benchmark.py -k flame         # only benchmarks with 'flame' in the name
+python benchmark.py --save           # record the baseline
+python benchmark.py --compare        # compare against the baseline
+
+With --compare, anything more than --threshold slower than the baseline is
+flagged and the exit status is 1. Every result also records the spread of
+its repeats, and a slowdown is only flagged if it is larger than the
+spread of both runs as well, and benchmarks that look slower are run a
+second time to confirm it. Baselines are only comparable on the same
+machine, so the file records where it was made and --save starts a new
+baseline on a different machine.
+"""
+import argparse
+import contextlib
+import datetime
+import glob
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+
+import atlas
+import group_recipes
+from cline import Cline
+from flame import FlamePack, Palette
+from mobius import Mobius
+import param_parser
+
+BASELINE = 'benchmark_baseline.json'
+
+# Relative slowdown that counts as a regression
+THRESHOLD = 0.2
+
+# Timings are the best of REPEAT runs. Each run calls the benchmark
+# enough times to take at least 0.2 seconds (see timeit.Timer.autorange).
+# Whole atlases, animations and big packs are only called once or a few
+# times per run, so they get more runs
+REPEAT = 5
+LARGE_REPEAT = 9
+
+# Pack sizes for the serialization benchmarks
+PACK_SIZES = (10, 1000, 10000)
+
+# Atlas radius, (2 * 2 + 1)^4 = 625 flames
+ATLAS_RADIUS = 2
+
+class Benchmark(object):
+    """
+    A named benchmark. setup() is called once, untimed, and returns the
+    function to time
+    """
+    def __init__(self, name, setup, repeat=REPEAT):
+        self.name = name
+        self.setup = setup
+        self.repeat = repeat
+
+    def run(self):
+        """
+        Best time per call in seconds, the number of calls per run and the
+        spread of the runs: how much slower the median run was than the
+        best one, relative to the best
+        """
+        timer = timeit.Timer(self.setup())
+        number, total = timer.autorange()
+        times = [total / number]
+        while len(times) < self.repeat:
+            times.append(timer.timeit(number) / number)
+        best = min(times)
+        return (best, number, float(np.median(times)) / best - 1)
+
+def quiet(function):
+    """
+    Run function without its print statements
+    """
+    def wrapped():
+        with contextlib.redirect_stdout(io.StringIO()):
+            function()
+    return wrapped
+
+def random_mobius(rng):
+    return Mobius(*[
+        complex(rng.gauss(0, 1), rng.gauss(0, 1)) for _ in range(4)])
+
+def random_flames(num_flames, seed=0):
+    """
+    Grandma's recipe flames at random traces near the interesting region
+    """
+    rng = random.Random(seed)
+    flames = []
+    while len(flames) < num_flames:
+        trace_a = complex(rng.uniform(1.8, 2.2), rng.uniform(-0.2, 0.2))
+        trace_b = complex(rng.uniform(1.8, 3.0), rng.uniform(-0.2, 0.2))
+        flames.append(atlas.make_flame(
+            trace_a, trace_b, palette=Palette.random(rng)))
+    return flames
+
+def make_benchmarks(dirname):
+    """
+    All benchmarks, writing any files to dirname
+    """
+    rng = random.Random(0)
+    m1 = random_mobius(rng)
+    m2 = random_mobius(rng)
+    cline = Cline.from_circle(0.5 + 0.25j, 1.5)
+    benchmarks = [
+        Benchmark('Mobius.__mul__', lambda: lambda: m1 * m2),
+        Benchmark('Mobius.inv', lambda: lambda: m1.inv),
+        Benchmark('Mobius.normalize', lambda: lambda: m1.normalize),
+        Benchmark('Cline.transform', lambda: lambda: cline.transform(m1)),
+        Benchmark(
+            'grandmas_recipe',
+            lambda: lambda: group_recipes.grandmas_recipe(
+                1.87 + 0.1j, 1.87 - 0.1j)),
+        Benchmark(
+            'Palette.random', lambda: lambda: Palette.random(rng)),
+    ]
+
+    def lines_setup(num_flames):
+        flames = random_flames(num_flames)
+        return lambda: [flame.lines for flame in flames]
+
+    def save_setup(num_flames):
+        pack = FlamePack('Benchmark', random_flames(num_flames))
+        fname = os.path.join(dirname, 'pack_{}.flame'.format(num_flames))
+        return lambda: pack.save(fname)
+
+    for size in PACK_SIZES:
+        repeat = REPEAT if size < 10000 else LARGE_REPEAT
+        benchmarks.append(Benchmark(
+            'Flame.lines[{}]'.format(size),
+            lambda size=size: lines_setup(size),
+            repeat))
+        benchmarks.append(Benchmark(
+            'FlamePack.save[{}]'.format(size),
+            lambda size=size: save_setup(size),
+            repeat))
+
+    benchmarks.append(Benchmark(
+        'make_atlas[radius={}]'.format(ATLAS_RADIUS),
+        lambda: quiet(lambda: atlas.make_atlas(
+            seed=0, radius=ATLAS_RADIUS, dirname=dirname)),
+        repeat=LARGE_REPEAT))
+
+    def animation_setup(param_fname):
+        parser = param_parser.ParamParser(param_fname)
+        fname = os.path.join(dirname, parser.params['fname'])
+
+        def run():
+            # A fresh animator every time, like main.py
+            anim = parser.animator_type(**parser.animator_params)
+            anim.make_animation(parser.params['pack_name'], fname)
+        return quiet(run)
+
+    param_dir = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'params')
+    for param_fname in sorted(glob.glob(os.path.join(param_dir, '*.json'))):
+        name = os.path.splitext(os.path.basename(param_fname))[0]
+        benchmarks.append(Benchmark(
+            'animation[{}]'.format(name),
+            lambda param_fname=param_fname: animation_setup(param_fname),
+            repeat=LARGE_REPEAT))
+    return benchmarks
+
+def run_benchmarks(pattern=None, names=None):
+    """
+    Run every benchmark whose name contains pattern, or only those in
+    names. Returns a dict of {name: {'seconds', 'number', 'spread'}}
+    """
+    dirname = tempfile.mkdtemp(prefix='benchmark')
+    results = {}
+    try:
+        for benchmark in make_benchmarks(dirname):
+            if pattern and pattern not in benchmark.name:
+                continue
+            if names is not None and benchmark.name not in names:
+                continue
+            seconds, number, spread = benchmark.run()
+            results[benchmark.name] = {
+                'seconds': seconds, 'number': number, 'spread': spread}
+            print("{:<32} {}  +/-{:5.1%}".format(
+                benchmark.name, format_time(seconds), spread))
+            sys.stdout.flush()
+    finally:
+        shutil.rmtree(dirname)
+    return results
+
+def format_time(seconds):
+    for unit, scale in (('s', 1.0), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return "{:8.3f} {}".format(seconds / scale, unit)
+    return "{:8.3f} ns".format(seconds / 1e-9)
+
+def machine_info():
+    return {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+    }
+
+def same_machine(a, b):
+    """
+    Whether two machine_info() dicts describe the same setup
+    """
+    keys = ('platform', 'processor', 'python', 'numpy')
+    return all(a.get(key) == b.get(key) for key in keys)
+
+def save_baseline(results, fname=BASELINE):
+    """
+    Write the results as the new baseline. Entries of benchmarks that
+    weren't run this time are kept if the old baseline is from the same
+    machine, and dropped otherwise
+    """
+    baseline = {'machine': machine_info(), 'results': {}}
+    if os.path.exists(fname):
+        with open(fname) as f:
+            old = json.load(f)
+        if same_machine(old['machine'], baseline['machine']):
+            baseline['results'] = old['results']
+    baseline['results'].update(results)
+    with open(fname, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+def compare(results, fname=BASELINE, threshold=THRESHOLD):
+    """
+    Print every result against the baseline and return the names of the
+    benchmarks that got slower by more than threshold and by more than
+    the spread of the two runs together. Baselines saved without a spread
+    count as having none
+    """
+    with open(fname) as f:
+        baseline = json.load(f)
+    print("Baseline from {} ({}, Python {}, NumPy {})".format(
+        baseline['machine']['date'],
+        baseline['machine']['platform'],
+        baseline['machine']['python'],
+        baseline['machine']['numpy']))
+    if not same_machine(baseline['machine'], machine_info()):
+        print("Warning: the baseline was made on a different machine")
+
+    regressions = []
+    for name, result in sorted(results.items()):
+        if name not in baseline['results']:
+            print("{:<32} {}   (no baseline)".format(
+                name, format_time(result['seconds'])))
+            continue
+        old = baseline['results'][name]['seconds']
+        ratio = result['seconds'] / old
+        tolerance = max(
+            threshold,
+            baseline['results'][name].get('spread', 0.0) + result['spread'])
+        flag = ''
+        if ratio > 1 + tolerance:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print("{:<32} {} -> {}  {:+7.1%} (limit {:+.0%}){}".format(
+            name, format_time(old), format_time(result['seconds']),
+            ratio - 1, tolerance, flag))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time the hot paths and compare with a baseline")
+    parser.add_argument(
+        '-k', dest='pattern', help="only run benchmarks containing this")
+    parser.add_argument(
+        '--save', action='store_true', help="record the results as baseline")
+    parser.add_argument(
+        '--compare', action='store_true', help="compare with the baseline")
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.pattern)
+    if args.compare:
+        # Confirm apparent slowdowns, keeping the faster of the two runs
+        with contextlib.redirect_stdout(io.StringIO()):
+            suspects = compare(results, args.baseline, args.threshold)
+        if suspects:
+            print()
+            print("Running {} slower benchmark(s) again".format(
+                len(suspects)))
+            rerun = run_benchmarks(names=suspects)
+            for name in suspects:
+                if rerun[name]['seconds'] < results[name]['seconds']:
+                    results[name] = rerun[name]
+        print()
+        regressions = compare(results, args.baseline, args.threshold)
+        if regressions:
+            print("{} regression(s) above {:.0%}: {}".format(
+                len(regressions), args.threshold, ", ".join(regressions)))
+            sys.exit(1)
+    if args.save:
+        save_baseline(results, args.baseline)
+
+if __name__ == '__main__':
+    main()
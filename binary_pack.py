@@ -0,0 +1,232 @@
+"""
+Compact binary storage for generated groups
+
+A .flame file repeats the same header, palette and formatting for every
+flame, but only a handful of numbers actually vary from frame to frame.
+A binary pack stores just those numbers in a structured NumPy array on
+disk, plus a table of the distinct palettes:
+
+pack_dir/
+    frames.npy    one record per frame, see frame_dtype()
+    palettes.npy  uint8 array of shape (palettes, 256, 3)
+    meta.json     pack name, image size, flame name format, etc.
+
+frames.npy is memory-mapped when reading, so any frame or range of frames
+can be accessed (and exported to .flame) without loading the whole pack.
+"""
+import json
+import os
+
+import numpy as np
+
+from mobius import Mobius
+from flame import Flame, FlamePack, Palette
+
+FRAMES_FILE = 'frames.npy'
+PALETTES_FILE = 'palettes.npy'
+META_FILE = 'meta.json'
+
+def frame_dtype(num_generators, num_xforms=None):
+    """
+    The record stored for each frame. Only the generators are stored when
+    the groups were built with group_recipes.make_group, the inverses are
+    recomputed on export. weights holds one weight per xform (by default
+    twice the generators, for the inverses), NaN for the default weights
+    """
+    num_xforms = num_xforms or 2 * num_generators
+    return np.dtype([
+        ('trace_a', np.complex128),
+        ('trace_b', np.complex128),
+        ('generators', np.complex128, (num_generators, 2, 2)),
+        ('weights', np.float64, (num_xforms,)),
+        ('zoom', np.float64),
+        ('palette', np.int32),
+        ('valid', np.bool_),
+    ])
+
+class BinaryPackWriter(object):
+    """
+    Write a binary pack frame by frame. The number of frames must be known
+    up front so frames.npy can be preallocated and filled in place
+
+    with BinaryPackWriter('output/gears.npack', 'Gears', 200, 2) as writer:
+        writer.write(0, xforms, zoom, palette, trace_a, trace_b)
+        ...
+    """
+    def __init__(
+            self,
+            dirname,
+            name,
+            num_frames,
+            num_generators,
+            size="500 500",
+            name_format="frame_{index:04}",
+            inverses=True):
+        """
+        name_format is a str.format template for the flame names on export.
+        It can use the fields index, zoom, trace_a and trace_b.
+
+        inverses: if True, the xforms passed to write() are in the format
+        returned by make_group, so only the first half needs storing
+        """
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        self.dirname = dirname
+        self.meta = {
+            'name': name,
+            'size': size,
+            'name_format': name_format,
+            'inverses': inverses,
+        }
+        self.num_generators = num_generators
+        self.num_xforms = 2 * num_generators if inverses else num_generators
+        self.frames = np.lib.format.open_memmap(
+            os.path.join(dirname, FRAMES_FILE),
+            mode='w+',
+            dtype=frame_dtype(num_generators, self.num_xforms),
+            shape=(num_frames,))
+        self.frames['valid'] = False
+        self.frames['palette'] = -1
+        self.frames['weights'] = np.nan
+
+        # Palettes are shared by reference, so identify them by id()
+        self.palette_ids = {}
+        self.palettes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def palette_id(self, palette):
+        key = id(palette)
+        if key not in self.palette_ids:
+            self.palette_ids[key] = len(self.palettes)
+            self.palettes.append(palette)
+        return self.palette_ids[key]
+
+    def write(
+            self,
+            index,
+            xforms,
+            zoom,
+            palette,
+            trace_a=0,
+            trace_b=0,
+            weights=None):
+        """
+        Store a single valid frame. weights are the Flame.weights of the
+        frame, one per xform including the inverses, or None for the
+        default weights
+        """
+        generators = xforms[:self.num_generators]
+        frame = self.frames[index]
+        frame['trace_a'] = trace_a
+        frame['trace_b'] = trace_b
+        frame['generators'] = [[[x.a, x.b], [x.c, x.d]] for x in generators]
+        if weights is not None:
+            if len(weights) != self.num_xforms:
+                raise ValueError('Expected {} weights, got {}'.format(
+                    self.num_xforms, len(weights)))
+            frame['weights'] = weights
+        frame['zoom'] = zoom
+        frame['palette'] = self.palette_id(palette)
+        frame['valid'] = True
+
+    def skip(self, index, trace_a=0, trace_b=0):
+        """
+        Record a frame that could not be computed
+        """
+        frame = self.frames[index]
+        frame['trace_a'] = trace_a
+        frame['trace_b'] = trace_b
+        frame['valid'] = False
+
+    def close(self):
+        self.frames.flush()
+        del self.frames
+
+        palettes = np.array(
+            [p.colors for p in self.palettes], dtype=np.uint8).reshape(
+                (len(self.palettes), Palette.TOTAL_COLORS, 3))
+        np.save(os.path.join(self.dirname, PALETTES_FILE), palettes)
+
+        with open(os.path.join(self.dirname, META_FILE), 'w') as f:
+            json.dump(self.meta, f, indent=4)
+
+class BinaryPack(object):
+    """
+    Read a binary pack. Frames are memory-mapped, so opening a pack is
+    instant regardless of its size
+    """
+    def __init__(self, dirname):
+        self.dirname = dirname
+        with open(os.path.join(dirname, META_FILE), 'r') as f:
+            self.meta = json.load(f)
+        self.frames = np.load(
+            os.path.join(dirname, FRAMES_FILE), mmap_mode='r')
+        palettes = np.load(os.path.join(dirname, PALETTES_FILE))
+        self.palettes = [
+            Palette([tuple(rgb) for rgb in colors])
+            for colors in palettes.tolist()]
+
+    @property
+    def name(self):
+        return self.meta['name']
+
+    def __len__(self):
+        return len(self.frames)
+
+    def flame(self, index):
+        """
+        Rebuild the Flame for a single frame, or None if the frame is
+        invalid
+        """
+        frame = self.frames[index]
+        if not frame['valid']:
+            return None
+
+        xforms = [
+            Mobius(m[0][0], m[0][1], m[1][0], m[1][1])
+            for m in frame['generators'].tolist()]
+        if self.meta['inverses']:
+            xforms += [x.inv for x in xforms]
+
+        # Packs written before weights were stored have no weights field
+        weights = None
+        if 'weights' in frame.dtype.names:
+            weights = frame['weights']
+            weights = None if np.isnan(weights).any() else weights.tolist()
+
+        zoom = float(frame['zoom'])
+        name = self.meta['name_format'].format(
+            index=index,
+            zoom=zoom,
+            trace_a=complex(frame['trace_a']),
+            trace_b=complex(frame['trace_b']))
+        return Flame(
+            name,
+            xforms,
+            palette=self.palettes[frame['palette']],
+            zoom=zoom,
+            size=self.meta['size'],
+            weights=weights)
+
+    def flames(self, start=0, stop=None):
+        """
+        Iterate over the valid flames in a range of frames
+        """
+        stop = len(self) if stop is None else stop
+        for i in range(start, stop):
+            flame = self.flame(i)
+            if flame is not None:
+                yield flame
+
+    def export(self, fname, start=0, stop=None, compression=None, level=None):
+        """
+        Write a range of frames (by default the whole pack) to a
+        .flame file. See FlamePack.save for the compression options
+        """
+        pack = FlamePack(self.name, self.flames(start, stop))
+        pack.save(fname, compression, level)
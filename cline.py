@@ -121,7 +121,7 @@ class Cline(object):
 
             # Compute the radius
             disc = self.discriminant
-            radius = cmath.sqrt(-disc / self.a)
+            radius = cmath.sqrt(-disc) / abs(self.a)
             return ('circle', center, radius)
         elif cline_type == 'point':
             center = -self.c / self.a
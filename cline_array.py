@@ -0,0 +1,200 @@
+"""
+Batches of generalized circles (Clines) stored in a single NumPy array.
+
+See cline.Cline for the math. Each cline is stored in matrix form
+
+[A B]
+[C D]
+
+so a batch is a complex array of shape (..., 2, 2), the same layout as
+mobius_array.MobiusArray. This lets a whole circle packing be transformed
+with a couple of batched matrix products instead of building temporary
+Mobius objects for every circle.
+"""
+import numpy as np
+
+from cline import Cline
+from mobius_array import MobiusArray, complex_dtype
+
+# Integer codes returned by ClineArray.classify. Use TYPE_NAMES to convert
+# them to the strings returned by Cline.classify. NON_FINITE has no
+# counterpart there; it marks clines whose entries overflowed or are NaN
+CIRCLE = 0
+POINT = 1
+IMAG_CIRCLE = 2
+LINE = 3
+NOT_CIRCLE = 4
+INVALID = 5
+NON_FINITE = 6
+TYPE_NAMES = (
+    'circle', 'point', 'imag_circle', 'line', 'not_circle', 'invalid',
+    'non_finite')
+
+class ClineArray(object):
+    """
+    An array of generalized circles. Like MobiusArray, any complex dtype
+    can be used
+    """
+    def __init__(self, matrices, dtype=None):
+        matrices = np.asarray(matrices)
+        matrices = matrices.astype(complex_dtype(matrices, dtype), copy=False)
+        if matrices.shape[-2:] != (2, 2):
+            raise ValueError(
+                'Expected an array of shape (..., 2, 2), got {}'.format(
+                    matrices.shape))
+        self.matrices = matrices
+
+    @classmethod
+    def from_clines(cls, clines):
+        """
+        Pack a list of Cline objects into a 1D ClineArray
+        """
+        return cls([[[x.a, x.b], [x.c, x.d]] for x in clines])
+
+    @classmethod
+    def from_circles(cls, centers, radii, dtype=complex):
+        """
+        Vectorized version of Cline.from_circle
+        """
+        dtype = complex_dtype(None, dtype)
+        centers = np.asarray(centers, dtype=dtype)
+        radii = np.asarray(radii, dtype=np.finfo(dtype).dtype)
+        centers, radii = np.broadcast_arrays(centers, radii)
+        matrices = np.empty(centers.shape + (2, 2), dtype=dtype)
+        matrices[..., 0, 0] = 1
+        matrices[..., 0, 1] = -centers.conj()
+        matrices[..., 1, 0] = -centers
+        matrices[..., 1, 1] = centers * centers.conj() - radii * radii
+        return cls(matrices)
+
+    def to_list(self):
+        """
+        Unpack a 1D ClineArray into a list of Cline objects
+        """
+        return [self[i] for i in range(len(self))]
+
+    def __repr__(self):
+        return 'ClineArray(shape={})'.format(self.shape)
+
+    @property
+    def shape(self):
+        return self.matrices.shape[:-2]
+
+    @property
+    def dtype(self):
+        return self.matrices.dtype
+
+    def astype(self, dtype):
+        return ClineArray(self.matrices, dtype)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, index):
+        """
+        Selecting a single cline returns a Cline, anything else returns
+        a ClineArray
+        """
+        result = self.matrices[index]
+        if result.ndim == 2:
+            return Cline(result[0, 0], result[0, 1], result[1, 0], result[1, 1])
+        return ClineArray(result)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def a(self):
+        return self.matrices[..., 0, 0]
+
+    @property
+    def b(self):
+        return self.matrices[..., 0, 1]
+
+    @property
+    def c(self):
+        return self.matrices[..., 1, 0]
+
+    @property
+    def d(self):
+        return self.matrices[..., 1, 1]
+
+    def transform(self, mobius):
+        """
+        Apply a Mobius map or a MobiusArray to every cline at once.
+
+        C' = M.inv.T * C * M.inv.conj
+
+        (see Cline.transform). The batch shapes broadcast, so a single map
+        transforms every cline, N maps transform N clines pairwise, and
+        maps of shape (M, 1) with clines of shape (N,) give all M * N images.
+        """
+        M_inv = MobiusArray.coerce(mobius, self.dtype).inv.matrices
+        M_inv_T = np.swapaxes(M_inv, -1, -2)
+        transformed = np.matmul(
+            np.matmul(M_inv_T, self.matrices), np.conjugate(M_inv))
+        return ClineArray(transformed)
+
+    @property
+    def discriminant(self):
+        """
+        discriminant = A * D - B * C
+        """
+        return self.a * self.d - self.b * self.c
+
+    @property
+    def classify(self):
+        """
+        Vectorized Cline.classify. This returns an array of the integer
+        codes CIRCLE, POINT, ... defined in this module. Clines with a
+        NaN or infinite A or discriminant are NON_FINITE
+        """
+        a = self.a
+        with np.errstate(invalid='ignore', over='ignore'):
+            disc = self.discriminant.real
+        finite = np.isfinite(disc) & np.isfinite(a)
+        is_circle = a != 0
+        sign = np.sign(np.where(finite, disc, 0)).astype(int) + 1
+        circle_types = np.array([CIRCLE, POINT, IMAG_CIRCLE])
+        line_types = np.array([LINE, NOT_CIRCLE, INVALID])
+        types = np.where(is_circle, circle_types[sign], line_types[sign])
+        return np.where(finite, types, NON_FINITE)
+
+    @property
+    def centers(self):
+        """
+        center = -C / A for circles and points, NaN otherwise
+        """
+        a = self.a
+        safe_a = np.where(a != 0, a, 1)
+        return np.where(a != 0, -self.c / safe_a, complex('nan'))
+
+    @property
+    def radii(self):
+        """
+        radius = sqrt(-disc) / |A| for real circles, 0 for point circles,
+        NaN otherwise. A is negative when the inside of the circle is the
+        outside of the disk it bounds, e.g. after a map that swaps them:
+
+        Cline.from_circle(1 + 1j, 2).transform(Mobius(1 + 1j, 2, 0.5j, 1))
+
+        is the circle about -4j of radius 4 with A < 0
+        """
+        a = np.abs(self.a.real)
+        disc = self.discriminant.real
+        safe_a = np.where(a != 0, a, 1)
+        radii = np.sqrt(np.maximum(-disc, 0)) / safe_a
+        return np.where((a != 0) & (disc <= 0), radii, np.nan)
+
+    @property
+    def line_coefficients(self):
+        """
+        For lines, return an array of shape (..., 3) of [A, B, C] such that
+        Ax + By = C, the same values as Cline.params. Rows that are not
+        lines are filled with NaN
+        """
+        coeffs = np.stack(
+            [self.c.real, self.c.imag, -self.d.real / 2.0], axis=-1)
+        is_line = (self.classify == LINE)[..., np.newaxis]
+        return np.where(is_line, coeffs, np.nan)
@@ -0,0 +1,164 @@
+"""
+Compressed text output with compression on a background thread, and
+transparent reading of compressed files.
+
+The compressors in zlib, bz2 and lzma release the GIL while they work, so
+serializing flames on the main thread and compressing on a worker thread
+really do overlap.
+"""
+import bz2
+import gzip
+import lzma
+import queue
+import threading
+import zlib
+
+# Compression chosen from the file extension
+EXTENSIONS = {
+    '.gz': 'gz',
+    '.xz': 'xz',
+    '.bz2': 'bz2',
+}
+
+# Magic numbers at the start of compressed files
+MAGIC = [
+    (b'\x1f\x8b', gzip.open),
+    (b'\xfd7zXZ\x00', lzma.open),
+    (b'BZh', bz2.open),
+]
+
+def compression_from_name(fname):
+    """
+    Guess the compression from a file extension, returning None for
+    uncompressed files
+    """
+    for ext, compression in EXTENSIONS.items():
+        if fname.endswith(ext):
+            return compression
+    return None
+
+def make_compressor(compression, level=None):
+    """
+    Make an incremental compressor object with compress() and flush()
+    methods
+    """
+    if compression == 'gz':
+        # wbits = 16 + 15 writes a gzip header and trailer
+        level = zlib.Z_DEFAULT_COMPRESSION if level is None else level
+        return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    elif compression == 'xz':
+        preset = lzma.PRESET_DEFAULT if level is None else level
+        return lzma.LZMACompressor(preset=preset)
+    elif compression == 'bz2':
+        return bz2.BZ2Compressor(9 if level is None else level)
+    raise ValueError("{} is not a valid compression!".format(compression))
+
+class ThreadedCompressedWriter(object):
+    """
+    Write-only text file object that compresses on a background thread.
+
+    Text is buffered until BUFFER_SIZE characters are collected, then handed
+    to the worker through a bounded queue, so a slow disk or compressor
+    applies backpressure instead of using unbounded memory.
+    """
+    BUFFER_SIZE = 1 << 16
+    MAX_QUEUED = 16
+
+    def __init__(self, fname, compression, level=None, encoding='utf-8'):
+        self.encoding = encoding
+        self.compressor = make_compressor(compression, level)
+        self.f = open(fname, 'wb')
+        self.buffer = []
+        self.buffered = 0
+        self.error = None
+        self.closed = False
+        self.chunks = queue.Queue(maxsize=self.MAX_QUEUED)
+        self.thread = threading.Thread(target=self.compress_chunks)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def compress_chunks(self):
+        """
+        Worker thread: compress and write chunks until None is received
+        """
+        finished = False
+        try:
+            while True:
+                text = self.chunks.get()
+                if text is None:
+                    finished = True
+                    break
+                data = self.compressor.compress(text.encode(self.encoding))
+                if data:
+                    self.f.write(data)
+            self.f.write(self.compressor.flush())
+        except Exception as e:
+            self.error = e
+            # Keep draining so the producer never blocks forever, unless
+            # the None from close() has already arrived
+            while not finished and self.chunks.get() is not None:
+                pass
+
+    def check_error(self):
+        if self.error is not None:
+            raise self.error
+
+    def write(self, text):
+        self.buffer.append(text)
+        self.buffered += len(text)
+        if self.buffered >= self.BUFFER_SIZE:
+            self.flush_buffer()
+        return len(text)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush_buffer(self):
+        self.check_error()
+        if self.buffer:
+            self.chunks.put("".join(self.buffer))
+            self.buffer = []
+            self.buffered = 0
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.flush_buffer()
+        finally:
+            self.chunks.put(None)
+            self.thread.join()
+            self.f.close()
+        self.check_error()
+
+def open_output(fname, compression=None, level=None):
+    """
+    Open a text file for writing. The compression ('gz', 'xz' or 'bz2') is
+    chosen from the file extension unless given explicitly. Use
+    compression='none' to force an uncompressed file
+    """
+    if compression is None:
+        compression = compression_from_name(fname)
+    if compression is None or compression == 'none':
+        return open(fname, 'w')
+    return ThreadedCompressedWriter(fname, compression, level)
+
+def open_input(fname):
+    """
+    Open a text file for reading, decompressing it transparently if it
+    starts with a gzip, xz or bz2 header
+    """
+    with open(fname, 'rb') as f:
+        header = f.read(6)
+    for magic, opener in MAGIC:
+        if header.startswith(magic):
+            return opener(fname, 'rt')
+    return open(fname, 'r')
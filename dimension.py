@@ -0,0 +1,301 @@
+"""
+Box-counting dimension of limit sets
+
+The plane is covered with grids of 2^k x 2^k boxes for k = 1 ... max_level
+and the boxes hit by limit points are counted at every level. For a
+fractal, the count grows like N(k) ~ 2^(k * D), so the dimension D is the
+slope of log2 N(k) against k.
+
+Points are streamed in batches and only occupancy bits are kept, so the
+memory use is fixed no matter how many points are counted:
+
+- Coarse levels are exact bitsets with one bit per box.
+- Fine levels have too many boxes for that, so box indices are hashed
+  into a fixed size bitmap and the number of distinct boxes is estimated
+  from the fraction of bits still zero (linear counting).
+
+counter = BoxCounter()
+for points, _ in chaos_game.iterate(xforms, start, 100):
+    counter.add(points.to_complex)
+print(counter.estimate())
+"""
+import math
+
+import numpy as np
+
+import chaos_game
+
+# Two-sided 95% quantiles of Student's t distribution by degrees of
+# freedom. Larger degrees of freedom use t_95()
+T_95 = {
+    1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571,
+    6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262, 10: 2.228,
+    11: 2.201, 12: 2.179, 13: 2.160, 14: 2.145, 15: 2.131,
+    16: 2.120, 17: 2.110, 18: 2.101, 19: 2.093, 20: 2.086,
+    21: 2.080, 22: 2.074, 23: 2.069, 24: 2.064, 25: 2.060,
+    26: 2.056, 27: 2.052, 28: 2.048, 29: 2.045, 30: 2.042,
+}
+Z_95 = 1.959964
+
+# Bits per byte, for popcounts
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.int64)
+
+# Multiplier for Fibonacci hashing of 64-bit box indices
+HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+def t_95(dof):
+    """
+    Two-sided 95% quantile of Student's t distribution. Beyond the table
+    this uses the Cornish-Fisher expansion around the normal quantile,
+    which is good to about 1e-5 from 30 degrees of freedom on. NaN
+    without any degrees of freedom
+    """
+    if dof < 1:
+        return float('nan')
+    if dof in T_95:
+        return T_95[dof]
+    z = Z_95
+    g1 = (z ** 3 + z) / 4.0
+    g2 = (5 * z ** 5 + 16 * z ** 3 + 3 * z) / 96.0
+    g3 = (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / 384.0
+    return z + g1 / dof + g2 / dof ** 2 + g3 / dof ** 3
+
+class Bitset(object):
+    """
+    Fixed size set of bits stored 8 per byte
+    """
+    def __init__(self, num_bits):
+        self.num_bits = num_bits
+        self.bytes = np.zeros((num_bits + 7) // 8, dtype=np.uint8)
+
+    def add(self, indices):
+        """
+        Set the bits at the given indices. Duplicates are fine
+        """
+        indices = np.unique(indices)
+        if len(indices) == 0:
+            return
+        byte_indices = indices >> 3
+        bits = np.left_shift(1, indices & 7).astype(np.uint8)
+
+        # Combine the bits that fall in the same byte, then set them all
+        # at once
+        starts = np.flatnonzero(np.diff(byte_indices, prepend=-1))
+        self.bytes[byte_indices[starts]] |= np.bitwise_or.reduceat(
+            bits, starts)
+
+    def count(self):
+        return int(POPCOUNT[self.bytes].sum())
+
+class BoxCounter(object):
+    """
+    Count the boxes hit by streamed points at every level of a dyadic
+    grid over a square region
+    """
+    MAX_LEVEL = 16
+
+    # Levels with at most this many boxes are counted exactly, finer
+    # levels are hashed into bitmaps of this many bits
+    BITMAP_BITS = 1 << 24
+
+    # Linear counting becomes unreliable as the bitmap fills up
+    MAX_FILL = 0.95
+
+    def __init__(self, bounds=(-2.0, -2.0, 2.0, 2.0), max_level=MAX_LEVEL):
+        """
+        bounds: (x_min, y_min, x_max, y_max). The grids cover the smallest
+        square containing it, points outside are ignored
+        """
+        x_min, y_min, x_max, y_max = bounds
+        self.size = max(x_max - x_min, y_max - y_min)
+        self.corner = complex(x_min, y_min)
+        self.max_level = max_level
+        self.samples = 0
+        self.outside = 0
+
+        # (samples, box counts) every time the number of samples doubles,
+        # to tell which levels have stopped growing
+        self.snapshots = []
+
+        self.dense_levels = int(math.log(self.BITMAP_BITS, 4))
+        self.bitsets = [
+            Bitset(min(4 ** level, self.BITMAP_BITS))
+            for level in range(1, max_level + 1)]
+
+    def add(self, z):
+        """
+        Add a batch of complex points. Points at infinity or outside the
+        bounds only count towards outside
+        """
+        z = np.asarray(z).ravel()
+        scaled = (z - self.corner) / self.size
+        with np.errstate(invalid='ignore'):
+            inside = (
+                (scaled.real >= 0) & (scaled.real < 1) &
+                (scaled.imag >= 0) & (scaled.imag < 1))
+        self.samples += z.size
+        self.outside += z.size - np.count_nonzero(inside)
+        scaled = scaled[inside]
+
+        # Box coordinates at the finest level. Coarser levels just drop
+        # low bits
+        side = 1 << self.max_level
+        cols = (scaled.real * side).astype(np.uint64)
+        rows = (scaled.imag * side).astype(np.uint64)
+        for level, bitset in enumerate(self.bitsets, 1):
+            shift = np.uint64(self.max_level - level)
+            indices = ((rows >> shift) << np.uint64(level)) | (cols >> shift)
+            if level > self.dense_levels:
+                indices = self.hash(indices)
+            bitset.add(indices.astype(np.int64))
+
+        if not self.snapshots or self.samples >= 2 * self.snapshots[-1][0]:
+            self.snapshots.append((self.samples, self.box_counts()[0]))
+
+    def hash(self, indices):
+        """
+        Map box indices to bitmap positions
+        """
+        bits = int(math.log(self.BITMAP_BITS, 2))
+        return (indices * HASH_MULTIPLIER) >> np.uint64(64 - bits)
+
+    def box_counts(self):
+        """
+        Number of occupied boxes at every level, and whether each count
+        can be trusted. Hashed levels are estimated with linear counting
+        """
+        counts = []
+        reliable = []
+        for level, bitset in enumerate(self.bitsets, 1):
+            ones = bitset.count()
+            if level <= self.dense_levels:
+                counts.append(float(ones))
+                reliable.append(True)
+                continue
+            fill = ones / float(bitset.num_bits)
+            if fill >= 1.0:
+                counts.append(float('inf'))
+            else:
+                counts.append(-bitset.num_bits * math.log(1.0 - fill))
+            reliable.append(fill <= self.MAX_FILL)
+        return counts, reliable
+
+    def growth(self, counts):
+        """
+        Relative growth of the box counts since the number of samples was
+        at most half of what it is now, or None if there were no
+        snapshots back then
+        """
+        previous = None
+        for samples, snapshot in self.snapshots:
+            if 2 * samples <= self.samples:
+                previous = snapshot
+        if previous is None:
+            return None
+        return [
+            count / old - 1.0 if old > 0 else float('inf')
+            for count, old in zip(counts, previous)]
+
+    def estimate(self, min_boxes=16, max_growth=0.05):
+        """
+        Fit the box-counting dimension. Only levels in the scaling range
+        are used: levels with fewer than min_boxes boxes are too coarse to
+        show any structure, and levels whose count still grew by more than
+        max_growth when the number of samples doubled are undersampled and
+        would bend the curve down
+        """
+        counts, reliable = self.box_counts()
+        growth = self.growth(counts) or [float('inf')] * len(counts)
+        levels = [
+            level for level, count, ok, grew in zip(
+                range(1, self.max_level + 1), counts, reliable, growth)
+            if ok and count >= min_boxes and grew <= max_growth]
+        return DimensionEstimate(
+            levels,
+            [counts[level - 1] for level in levels],
+            counts,
+            self.samples)
+
+class DimensionEstimate(object):
+    """
+    Least squares fit of log2 N(k) = D * k + c over the scaling range,
+    with a 95% confidence interval for D from the regression.
+    The dimension is NaN if fewer than two levels are usable
+    """
+    def __init__(self, levels, counts, all_counts, samples):
+        self.levels = levels
+        self.counts = counts
+        self.all_counts = all_counts
+        self.samples = samples
+        self.dimension = float('nan')
+        self.stderr = float('nan')
+        if len(levels) < 2:
+            return
+
+        k = np.array(levels, dtype=float)
+        log_counts = np.log2(counts)
+        slope, intercept = np.polyfit(k, log_counts, 1)
+        self.dimension = float(slope)
+        dof = len(levels) - 2
+        if dof > 0:
+            residuals = log_counts - (slope * k + intercept)
+            variance = (residuals ** 2).sum() / dof
+            self.stderr = math.sqrt(
+                variance / ((k - k.mean()) ** 2).sum())
+
+    @property
+    def interval(self):
+        """
+        (low, high) 95% confidence interval for the dimension
+        """
+        dof = len(self.levels) - 2
+        t = t_95(dof)
+        return (self.dimension - t * self.stderr,
+            self.dimension + t * self.stderr)
+
+    def to_dict(self):
+        low, high = self.interval
+        return {
+            'dimension': self.dimension,
+            'stderr': self.stderr,
+            'low': low,
+            'high': high,
+            'levels': self.levels,
+            'samples': self.samples,
+        }
+
+    def __str__(self):
+        low, high = self.interval
+        return "D = {:.4f} (95% CI {:.4f} - {:.4f}, levels {}, {} samples)".format(
+            self.dimension, low, high, self.levels, self.samples)
+
+def estimate_dimension(
+        xforms,
+        num_points=1 << 16,
+        iterations=200,
+        burn_in=20,
+        bounds=(-2.0, -2.0, 2.0, 2.0),
+        max_level=BoxCounter.MAX_LEVEL,
+        seed=None):
+    """
+    Estimate the box-counting dimension of the limit set of a group
+    (e.g. from group_recipes) by streaming chaos game points into a
+    BoxCounter
+    """
+    rng = chaos_game.make_rng(seed)
+    counter = BoxCounter(bounds, max_level)
+    points = chaos_game.random_points(num_points, seed=rng)
+    iterator = chaos_game.iterate(xforms, points, iterations, seed=rng)
+    for i, (points, _) in enumerate(iterator):
+        if i >= burn_in:
+            counter.add(points.to_complex)
+    return counter.estimate()
+
+def estimate_dimensions(flames, **kwargs):
+    """
+    Estimate the dimension of every flame in a stream, e.g. a whole atlas
+    read with flame_reader.read_flames(). Yields (name, DimensionEstimate).
+    Keyword arguments are passed to estimate_dimension()
+    """
+    for flame in flames:
+        yield (flame.name, estimate_dimension(flame.xforms, **kwargs))
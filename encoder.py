@@ -0,0 +1,337 @@
+"""
+Streaming animated GIF and APNG encoders
+
+Frames are written to the file as soon as they are rendered, so encoding
+an animation never needs more than one frame in memory and no intermediate
+PNGs (compare make_gif.sh, which loads every frame_*.png at once).
+
+Each frame is quantized to 256 colors derived from its flame's Palette
+(see PaletteQuantizer), so no per-frame color analysis is needed.
+
+with open('output/gasket.gif', 'wb') as f:
+    with GIFWriter(f, 500, 500) as gif:
+        for flame in flames:
+            gif.write_frame(render_flame(flame), flame.palette)
+"""
+import os
+import struct
+import weakref
+import zlib
+
+import numpy as np
+
+from flame import Palette
+from png import SIGNATURE, write_chunk
+
+# Frame delay in hundredths of a second, the same as make_gif.sh
+DELAY = 100
+
+class PaletteQuantizer(object):
+    """
+    Map RGB images to indices into a 256 color table built from a flame
+    palette.
+
+    Rendered pixels are palette colors scaled by their brightness, so the
+    table holds pure black plus HUES colors sampled evenly from the
+    palette at LEVELS brightness levels. Colors are matched through a
+    lookup table on the top LUT_BITS bits of each channel, which is
+    built once per palette
+    """
+    HUES = 51
+    LEVELS = 5
+    LUT_BITS = 5
+
+    # Rows of the lookup table matched against the color table at once
+    BATCH_SIZE = 4096
+
+    # Quantizers are cached per palette and dropped along with it
+    _quantizers = weakref.WeakKeyDictionary()
+
+    def __init__(self, palette):
+        samples = np.rint(
+            np.linspace(0, Palette.TOTAL_COLORS - 1, self.HUES)).astype(int)
+        hues = palette.array[samples].astype(float)
+        levels = np.arange(1, self.LEVELS + 1) / float(self.LEVELS)
+        shaded = levels[:, np.newaxis, np.newaxis] * hues
+        table = np.zeros((Palette.TOTAL_COLORS, 3))
+        table[1:] = shaded.reshape((-1, 3))
+        self.table = np.rint(table).astype(np.uint8)
+        self.lut = self.make_lut(table)
+
+    @classmethod
+    def for_palette(cls, palette):
+        quantizer = cls._quantizers.get(palette)
+        if quantizer is None:
+            quantizer = cls(palette)
+            cls._quantizers[palette] = quantizer
+        return quantizer
+
+    def make_lut(self, table):
+        """
+        For the center of every cell of the RGB cube, the index of the
+        nearest color in the table
+        """
+        size = 1 << self.LUT_BITS
+        step = 256 // size
+        centers = np.arange(size) * step + 0.5 * step
+        r, g, b = np.meshgrid(centers, centers, centers, indexing='ij')
+        cells = np.stack([r.ravel(), g.ravel(), b.ravel()], axis=-1)
+
+        lut = np.empty(len(cells), dtype=np.uint8)
+        for start in range(0, len(cells), self.BATCH_SIZE):
+            batch = cells[start:start + self.BATCH_SIZE]
+            distances = (
+                (batch[:, np.newaxis, :] - table[np.newaxis]) ** 2).sum(-1)
+            lut[start:start + self.BATCH_SIZE] = distances.argmin(axis=1)
+        return lut.reshape((size, size, size))
+
+    def quantize(self, image):
+        """
+        Convert a uint8 RGB image of shape (height, width, 3) to a uint8
+        array of color table indices of shape (height, width)
+        """
+        cells = np.asarray(image, dtype=np.uint8) >> (8 - self.LUT_BITS)
+        return self.lut[cells[..., 0], cells[..., 1], cells[..., 2]]
+
+def lzw_encode(data, min_code_size=8):
+    """
+    GIF flavored LZW compression of a bytes object of color indices.
+    Codes are packed least significant bit first
+    """
+    clear_code = 1 << min_code_size
+    end_code = clear_code + 1
+    output = bytearray()
+    bit_buffer = 0
+    bit_count = 0
+
+    code_size = min_code_size + 1
+    next_code = end_code + 1
+    table = {}
+
+    # Start with a clear code so decoders start from a known state
+    bit_buffer |= clear_code << bit_count
+    bit_count += code_size
+
+    prefix = data[0]
+    for k in data[1:]:
+        key = (prefix << 8) | k
+        code = table.get(key)
+        if code is not None:
+            prefix = code
+            continue
+
+        bit_buffer |= prefix << bit_count
+        bit_count += code_size
+        while bit_count >= 8:
+            output.append(bit_buffer & 0xff)
+            bit_buffer >>= 8
+            bit_count -= 8
+
+        if next_code < 4096:
+            table[key] = next_code
+            if next_code == 1 << code_size:
+                code_size += 1
+            next_code += 1
+        else:
+            # The table is full, start over
+            bit_buffer |= clear_code << bit_count
+            bit_count += code_size
+            table = {}
+            code_size = min_code_size + 1
+            next_code = end_code + 1
+        prefix = k
+
+    for code in (prefix, end_code):
+        bit_buffer |= code << bit_count
+        bit_count += code_size
+        # A new code may have been added for the last prefix
+        if code == prefix and next_code == 1 << code_size and code_size < 12:
+            code_size += 1
+    while bit_count > 0:
+        output.append(bit_buffer & 0xff)
+        bit_buffer >>= 8
+        bit_count -= 8
+    return bytes(output)
+
+class GIFWriter(object):
+    """
+    Write an animated GIF to a binary file object frame by frame. Every
+    frame gets its own color table, so the palette may change between
+    frames
+    """
+    def __init__(self, f, width, height, delay=DELAY, loop=0):
+        """
+        delay: time between frames in hundredths of a second
+        loop: number of times to play the animation, 0 loops forever
+        """
+        self.f = f
+        self.width = width
+        self.height = height
+        self.delay = delay
+        self.frames_written = 0
+
+        f.write(b'GIF89a')
+        # Logical screen descriptor without a global color table
+        f.write(struct.pack('<HHBBB', width, height, 0, 0, 0))
+        # Netscape extension for looping
+        f.write(b'\x21\xff\x0bNETSCAPE2.0\x03\x01')
+        f.write(struct.pack('<H', loop))
+        f.write(b'\x00')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write_frame(self, image, palette):
+        """
+        Quantize a uint8 RGB image of shape (height, width, 3) to the
+        palette and append it to the animation
+        """
+        quantizer = PaletteQuantizer.for_palette(palette)
+        indices = quantizer.quantize(image)
+        if indices.shape != (self.height, self.width):
+            raise ValueError("Frames must have shape ({}, {}, 3)".format(
+                self.height, self.width))
+
+        # Graphic control extension with the frame delay
+        self.f.write(struct.pack(
+            '<BBBBHBB', 0x21, 0xf9, 4, 0, self.delay, 0, 0))
+
+        # Image descriptor with a local color table of 2^(7 + 1) colors
+        self.f.write(struct.pack(
+            '<BHHHHB', 0x2c, 0, 0, self.width, self.height, 0x87))
+        self.f.write(quantizer.table.tobytes())
+
+        min_code_size = 8
+        data = lzw_encode(indices.tobytes(), min_code_size)
+        self.f.write(struct.pack('B', min_code_size))
+        for start in range(0, len(data), 255):
+            block = data[start:start + 255]
+            self.f.write(struct.pack('B', len(block)))
+            self.f.write(block)
+        self.f.write(b'\x00')
+        self.frames_written += 1
+
+    def close(self):
+        self.f.write(b'\x3b')
+
+class APNGWriter(object):
+    """
+    Write an animated PNG to a seekable binary file object frame by frame.
+
+    APNG only allows a single palette, so indexed frames are all quantized
+    to the palette of the first frame. Use indexed=False to store RGB
+    frames losslessly instead
+    """
+    def __init__(self, f, width, height, delay=DELAY, loop=0, indexed=True,
+            level=6):
+        """
+        delay: time between frames in hundredths of a second
+        loop: number of times to play the animation, 0 loops forever
+        """
+        self.f = f
+        self.width = width
+        self.height = height
+        self.delay = delay
+        self.loop = loop
+        self.indexed = indexed
+        self.level = level
+        self.quantizer = None
+        self.frames_written = 0
+        self.sequence = 0
+
+        f.write(SIGNATURE)
+        color_type = 3 if indexed else 2
+        write_chunk(f, b'IHDR', struct.pack(
+            '>IIBBBBB', width, height, 8, color_type, 0, 0, 0))
+
+        # The number of frames isn't known yet, it is filled in on close()
+        self.actl_position = f.tell()
+        write_chunk(f, b'acTL', struct.pack('>II', 0, loop))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+    def write_frame(self, image, palette):
+        """
+        Append a uint8 RGB image of shape (height, width, 3)
+        """
+        image = np.asarray(image, dtype=np.uint8)
+        if image.shape != (self.height, self.width, 3):
+            raise ValueError("Frames must have shape ({}, {}, 3)".format(
+                self.height, self.width))
+
+        if self.indexed:
+            if self.quantizer is None:
+                self.quantizer = PaletteQuantizer.for_palette(palette)
+                write_chunk(self.f, b'PLTE', self.quantizer.table.tobytes())
+            pixels = self.quantizer.quantize(image)
+        else:
+            pixels = image.reshape((self.height, -1))
+
+        # Every row starts with its filter type, 0 means unfiltered
+        rows = np.zeros((self.height, pixels.shape[1] + 1), dtype=np.uint8)
+        rows[:, 1:] = pixels
+        data = zlib.compress(rows.tobytes(), self.level)
+
+        write_chunk(self.f, b'fcTL', struct.pack(
+            '>IIIIIHHBB',
+            self.next_sequence(),
+            self.width,
+            self.height,
+            0,
+            0,
+            self.delay,
+            100,
+            0,
+            0))
+        # The first frame doubles as the still image for viewers without
+        # APNG support
+        if self.frames_written == 0:
+            write_chunk(self.f, b'IDAT', data)
+        else:
+            write_chunk(
+                self.f, b'fdAT', struct.pack('>I', self.next_sequence()) + data)
+        self.frames_written += 1
+
+    def next_sequence(self):
+        sequence = self.sequence
+        self.sequence += 1
+        return sequence
+
+    def close(self):
+        if self.frames_written == 0:
+            raise ValueError("An APNG needs at least one frame")
+        write_chunk(self.f, b'IEND', b'')
+        end = self.f.tell()
+        self.f.seek(self.actl_position)
+        write_chunk(self.f, b'acTL', struct.pack(
+            '>II', self.frames_written, self.loop))
+        self.f.seek(end)
+
+# Animation format chosen from the file extension
+FORMATS = {
+    '.gif': GIFWriter,
+    '.png': APNGWriter,
+    '.apng': APNGWriter,
+}
+
+def save_animation(fname, frames, width, height, delay=DELAY, loop=0):
+    """
+    Encode (image, palette) pairs as they arrive. The format is chosen
+    from the extension of fname, see FORMATS
+    """
+    ext = os.path.splitext(fname)[1].lower()
+    if ext not in FORMATS:
+        raise ValueError("{} is not a supported animation format!".format(
+            ext))
+    with open(fname, 'wb') as f:
+        with FORMATS[ext](f, width, height, delay, loop) as writer:
+            for image, palette in frames:
+                writer.write_frame(image, palette)
@@ -1,5 +1,10 @@
 import random
-import math
+import weakref
+
+import numpy as np
+
+from compressed_io import open_output
+import chaos_game
 
 def render_tag(tag_name, close_tag, **kwargs):
     """
@@ -30,6 +35,9 @@ class Palette(object):
             raise ValueError(
                 'Palettes must have {} colors'.format(self.TOTAL_COLORS))
         self.colors = colors
+        self._lines = None
+        self._block = None
+        self._array = None
 
     def color_row(self, i):
         """
@@ -46,60 +54,194 @@ class Palette(object):
     @property
     def lines(self):
         """
-        Format the palette tag including its 256 colors
+        Format the palette tag including its 256 colors. The colors never
+        change, so this is only formatted once per Palette
+        """
+        if self._lines is None:
+            start_tag = render_tag(
+                'palette',
+                close_tag=False,
+                count=self.TOTAL_COLORS,
+                format="RGB")
+            color_lines = [self.color_row(i) for i in range(self.ROWS)]
+            end_tag = "</palette>"
+            self._lines = (
+                [start_tag] + prefix_lines('   ', color_lines) + [end_tag])
+        return list(self._lines)
+
+    @property
+    def block(self):
+        """
+        The palette lines indented for a <flame> tag and joined into a
+        single string. This is also cached
+        """
+        if self._block is None:
+            self._block = "\n".join(prefix_lines('   ', self.lines))
+        return self._block
+
+    @property
+    def array(self):
+        """
+        The colors as a read-only uint8 array of shape (256, 3) for the
+        native renderer. This is also cached
         """
-        start_tag = render_tag(
-            'palette',
-            close_tag=False,
-            count=self.TOTAL_COLORS,
-            format="RGB")
-        color_lines = [self.color_row(i) for i in range(self.ROWS)]
-        end_tag = "</palette>"
-        return [start_tag] + prefix_lines('   ', color_lines) + [end_tag]
+        if self._array is None:
+            self._array = np.array(self.colors, dtype=np.uint8)
+            self._array.setflags(write=False)
+        return self._array
+
+    # Cosine palettes are interned by their parameters so identical
+    # palettes are built and formatted once and shared by reference.
+    # Entries are dropped once nothing refers to the palette anymore.
+    _cosine_palettes = weakref.WeakValueDictionary()
 
     @classmethod
-    def rand_component(cls, t, c, d):
+    def cosine(cls, red, green, blue):
         """
-        Compute a single color in a random cosine palette
+        Return the cosine palette where each channel is
+
+        0.5 + 0.5 * cos(2 * pi * (c * t + d)),  t in [0, 1)
+
+        red, green and blue are (c, d) pairs
         """
-        a = 0.5
-        b = 0.5
-        val = a + b * math.cos(2.0 * math.pi * (c * t + d))
-        return int(val * 255)
+        key = (tuple(red), tuple(green), tuple(blue))
+        palette = cls._cosine_palettes.get(key)
+        if palette is None:
+            params = np.array(key, dtype=float)
+            c = params[:, 0, np.newaxis]
+            d = params[:, 1, np.newaxis]
+            t = np.arange(cls.TOTAL_COLORS) / cls.TOTAL_COLORS
+            vals = 0.5 + 0.5 * np.cos(2.0 * np.pi * (c * t + d))
+            colors = (vals * 255).astype(int).T
+            palette = cls([tuple(rgb) for rgb in colors.tolist()])
+            cls._cosine_palettes[key] = palette
+        return palette
 
     @classmethod
-    def random(cls):
+    def random(cls, seed=None):
         """
         Return a random cosine palette
+
+        seed can be None to use the global random module, a
+        random.Random instance to draw from, or any value accepted by
+        random.Random for a reproducible palette
         """
-        pal = []
-
-        red_c = random.randint(0, 5)
-        red_d = random.random()
-        green_c = random.randint(0, 5)
-        green_d = random.random()
-        blue_c = random.randint(0, 5)
-        blue_d = random.random()
-        for i in range(cls.TOTAL_COLORS):
-            t = i / cls.TOTAL_COLORS
-            r = cls.rand_component(t, red_c, red_d)
-            g = cls.rand_component(t, green_c, green_d)
-            b = cls.rand_component(t, blue_c, blue_d)
-            pal.append((r, g, b))
-        return cls(pal)
+        if seed is None:
+            rng = random
+        elif isinstance(seed, random.Random):
+            rng = seed
+        else:
+            rng = random.Random(seed)
+
+        red_c = rng.randint(0, 5)
+        red_d = rng.random()
+        green_c = rng.randint(0, 5)
+        green_d = rng.random()
+        blue_c = rng.randint(0, 5)
+        blue_d = rng.random()
+        return cls.cosine((red_c, red_d), (green_c, green_d), (blue_c, blue_d))
 
 class Flame(object):
     """
     Class that represents a single flame fractal for
     Apophysis/Chaotica
     """
-    def __init__(self, name, xforms, palette=None, zoom=1.0, size="1500 2100"):
+    # Renderer settings written to the <flame> tag. These are also used by
+    # the native renderer, see render.py
+    SCALE = 200
+    OVERSAMPLE = 1
+    FILTER = 0.2
+    BRIGHTNESS = 4
+    GAMMA = 4
+    GAMMA_THRESHOLD = 0.01
+    ESTIMATOR_RADIUS = 9
+    ESTIMATOR_MINIMUM = 0
+    ESTIMATOR_CURVE = 0.4
+
+    # Only the name and size change from flame to flame in the <flame> tag,
+    # so the rest of the tag is formatted once up front. The same goes for
+    # the zoom in the <finalxform> tag
+    START_TEMPLATE = render_tag(
+        'flame',
+        close_tag=False,
+        name='{name}',
+        version="Apophysis 7x Version 15C.9",
+        size='{size}',
+        center="0 0",
+        scale=SCALE,
+        oversample=OVERSAMPLE,
+        filter=FILTER,
+        quality=1,
+        background="0 0 0",
+        brightness=BRIGHTNESS,
+        gamma=GAMMA,
+        gamma_threshold=GAMMA_THRESHOLD,
+        estimator_radius=ESTIMATOR_RADIUS,
+        estimator_minimum=ESTIMATOR_MINIMUM,
+        estimator_curve=ESTIMATOR_CURVE,
+        enable_de=0,
+        plugins="",
+        new_linear=1,
+        curves=(
+            "0 0 1 0 0 1 1 1 1 1 1 1 0 0 1 0 0 1 1 1 1 1 1 1 0 0 1 0 "
+            "0 1 1 1 1 1 1 1 0 0 1 0 0 1 1 1 1 1 1 1"))
+    ZOOM_TEMPLATE = render_tag(
+        'finalxform',
+        close_tag=True,
+        color='0',
+        symmetry='1',
+        linear='{zoom}',
+        coefs="1 0 0 1 0 0")
+    END_TAG = '</flame>'
+
+    def __init__(
+            self,
+            name,
+            xforms,
+            palette=None,
+            zoom=1.0,
+            size="1500 2100",
+            weights=None):
+        """
+        weights: optional list of xform weights, e.g. from
+        chaos_game.contraction_weights. By default every xform gets 0.5
+        """
         self.name = name
         self.xforms = xforms
         self.palette = palette or Palette.random()
         self.xforms = xforms
         self.size = size
         self.zoom = zoom
+        self.weights = weights
+
+    @property
+    def dimensions(self):
+        """
+        Image size in pixels as (width, height)
+        """
+        width, height = self.size.split()
+        return (int(width), int(height))
+
+    @property
+    def viewport(self):
+        """
+        The region of the plane that is visible in the rendered image as
+        (x_min, y_min, x_max, y_max), taking the zoom into account
+        """
+        width, height = self.dimensions
+        half_width = 0.5 * width / (self.SCALE * self.zoom)
+        half_height = 0.5 * height / (self.SCALE * self.zoom)
+        return (-half_width, -half_height, half_width, half_height)
+
+    def set_contraction_weights(self, **kwargs):
+        """
+        Weight the xforms by how much they stretch the visible part of the
+        attractor. Keyword arguments are passed to
+        chaos_game.contraction_weights
+        """
+        kwargs.setdefault('viewport', self.viewport)
+        self.weights = chaos_game.contraction_weights(
+            self.xforms, **kwargs).tolist()
 
     @property
     def xform_lines(self):
@@ -107,60 +249,56 @@ class Flame(object):
         Render each xforms to XML
         """
         N = len(self.xforms)
+        weights = self.weights or [0.5] * N
         return [
-            # Evenly space the color along the palette
-            xform.to_flame(i/(N + 1)) 
-            for i, xform in enumerate(self.xforms)]
+            xform.to_flame(color, weight) 
+            for xform, color, weight in zip(
+                self.xforms, self.xform_colors, weights)]
+
+    @property
+    def xform_colors(self):
+        """
+        Evenly space the color of each xform along the palette
+        """
+        N = len(self.xforms)
+        return [i/(N + 1) for i in range(N)]
+
+    @property
+    def start_tag(self):
+        return self.START_TEMPLATE.format(name=self.name, size=self.size)
+
+    @property
+    def zoom_tag(self):
+        """
+        Final transform for quick zooming
+        """
+        return self.ZOOM_TEMPLATE.format(zoom=self.zoom)
 
     @property
     def lines(self):
         """
         Render an XML <flame> tag
         """
-        start_tag = render_tag(
-            'flame',
-            close_tag=False,
-            name=self.name,
-            version="Apophysis 7x Version 15C.9",
-            size=self.size,
-            center="0 0",
-            scale=200,
-            oversample=1,
-            filter=0.2,
-            quality=1,
-            background="0 0 0",
-            brightness=4,
-            gamma=4,
-            gamma_threshold=0.01,
-            estimator_radius=9,
-            estimator_minimum=0,
-            estimator_curve=0.4,
-            enable_de=0,
-            plugins="",
-            new_linear=1,
-            curves=(
-                "0 0 1 0 0 1 1 1 1 1 1 1 0 0 1 0 0 1 1 1 1 1 1 1 0 0 1 0 "
-                "0 1 1 1 1 1 1 1 0 0 1 0 0 1 1 1 1 1 1 1"))
-
         # Format the neededtransformations
         xform_lines = prefix_lines('   ', self.xform_lines)
 
-        # Final transform for quick zooming
-        zoom_tag = render_tag(
-            'finalxform',
-            close_tag=True,
-            color='0',
-            symmetry='1',
-            linear=self.zoom,
-            coefs="1 0 0 1 0 0")
-
         # Palettes and the end tag
         palette_lines = prefix_lines('   ', self.palette.lines)
-        end_tag = '</flame>'
 
         # Combine all the lines into one big list
         return (
-            [start_tag] + xform_lines + [zoom_tag] + palette_lines + [end_tag])
+            [self.start_tag] + xform_lines + [self.zoom_tag] +
+            palette_lines + [self.END_TAG])
+
+    @property
+    def text(self):
+        """
+        Same as "\n".join(self.lines) but reuses the cached palette block
+        """
+        xform_lines = prefix_lines('   ', self.xform_lines)
+        return "\n".join(
+            [self.start_tag] + xform_lines +
+            [self.zoom_tag, self.palette.block, self.END_TAG])
 
 class FlamePack(object):
     """
@@ -170,14 +308,46 @@ class FlamePack(object):
         self.name = name
         self.flames = flames
 
+    @classmethod
+    def join_chunks(cls, name, texts):
+        """
+        Generate the text of a .flame file from the already serialized
+        text of each flame (see Flame.text)
+        """
+        yield '<flames name={}>\n'.format(name)
+        for i, text in enumerate(texts):
+            if i > 0:
+                yield '\n'
+            yield text
+        yield '\n</flames>\n'
+
+    @classmethod
+    def save_texts(cls, name, texts, fname, compression=None, level=None):
+        """
+        Save a .flame file from the already serialized text of each flame.
+        See save() for the compression options
+        """
+        with open_output(fname, compression, level) as f:
+            f.writelines(cls.join_chunks(name, texts))
+
+    def chunks(self):
+        """
+        Generate the text of the .flame file one flame at a time
+        """
+        return self.join_chunks(
+            self.name, (flame.text for flame in self.flames))
+
     def __str__(self):
-        flame_lines = sum([flame.lines for flame in self.flames], [])
-        return (
-            '<flames name={pack_name}>\n'
-            '{flames}\n'
-            '</flames>\n'
-        ).format(pack_name=self.name, flames="\n".join(flame_lines))
-
-    def save(self, fname):
-        with open(fname, 'w') as f:
-            f.write(str(self))
+        return "".join(self.chunks())
+
+    def save(self, fname, compression=None, level=None):
+        """
+        Save the .flame file. Names ending in .gz, .xz or .bz2 are
+        compressed on a background thread, see compressed_io.open_output
+        """
+        self.save_texts(
+            self.name,
+            (flame.text for flame in self.flames),
+            fname,
+            compression,
+            level)
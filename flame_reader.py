@@ -0,0 +1,156 @@
+"""
+Streaming reader for .flame files written by FlamePack.save. Compressed
+packs (.gz, .xz, .bz2) are decompressed transparently.
+
+Flames are parsed incrementally and yielded one at a time, so packs with
+thousands of flames can be filtered, merged, re-zoomed or re-paletted in
+constant memory without recomputing any groups:
+
+reader = FlameReader('output/atlas.flame')
+FlamePack(reader.name, (f for f in reader if ...)).save('filtered.flame')
+"""
+import re
+import xml.etree.ElementTree as ET
+
+from mobius import Mobius
+from flame import Flame, Palette
+from compressed_io import open_input
+
+# FlamePack writes the pack name without quotes, which is not valid XML.
+# This matches the unquoted value so it can be quoted before parsing
+UNQUOTED_NAME = re.compile(r'(<flames\s+name=)([^"\'>]*)>')
+
+class FlameReader(object):
+    """
+    Iterate over the flames in a .flame file
+    """
+    # How many characters to read from the file at a time
+    CHUNK_SIZE = 1 << 16
+
+    # Limit on how many distinct palettes to remember. Animation packs
+    # usually share one palette, so this lets the Palette objects (and
+    # their cached XML) be reused across flames
+    MAX_PALETTES = 1024
+
+    def __init__(self, fname):
+        self.fname = fname
+        self.palettes = {}
+        self._name = None
+
+    @property
+    def name(self):
+        """
+        The pack name from the <flames> tag. Reading it before iterating
+        only parses the opening tag
+        """
+        if self._name is None:
+            with open_input(self.fname) as f:
+                for event, elem in self.parse(f):
+                    self._name = elem.get('name')
+                    break
+        return self._name
+
+    def __iter__(self):
+        with open_input(self.fname) as f:
+            for flame in self.read(f):
+                yield flame
+
+    def parse(self, f):
+        """
+        Feed a text file object to a pull parser one chunk at a time and
+        yield its (event, element) pairs
+        """
+        parser = ET.XMLPullParser(events=('start', 'end'))
+        header = ''
+        for chunk in iter(lambda: f.read(self.CHUNK_SIZE), ''):
+            # Quote the pack name before anything reaches the parser
+            if header is not None:
+                header += chunk
+                if '>' not in header:
+                    continue
+                chunk = UNQUOTED_NAME.sub(
+                    lambda m: '{}"{}">'.format(
+                        m.group(1), m.group(2).replace('"', '&quot;')),
+                    header,
+                    count=1)
+                header = None
+
+            parser.feed(chunk)
+            for event, elem in parser.read_events():
+                yield (event, elem)
+        parser.close()
+
+    def read(self, f):
+        """
+        Parse flames from a text file object
+        """
+        root = None
+        for event, elem in self.parse(f):
+            if event == 'start' and root is None:
+                root = elem
+                self._name = elem.get('name')
+            elif event == 'end' and elem.tag == 'flame':
+                yield self.make_flame(elem)
+
+                # Drop the parsed flame so memory use stays constant
+                root.clear()
+
+    def make_flame(self, elem):
+        """
+        Reconstruct a Flame from a <flame> element
+        """
+        xform_elems = list(elem.iter('xform'))
+        xforms = [self.make_mobius(x) for x in xform_elems]
+        weights = [float(x.get('weight', 0.5)) for x in xform_elems]
+        final = elem.find('finalxform')
+        zoom = float(final.get('linear')) if final is not None else 1.0
+        return Flame(
+            elem.get('name'),
+            xforms,
+            palette=self.make_palette(elem.find('palette')),
+            zoom=zoom,
+            size=elem.get('size'),
+            weights=weights)
+
+    def make_mobius(self, elem):
+        """
+        Reconstruct a Mobius map from the attributes written by
+        Mobius.to_flame
+        """
+        if elem.get('mobius') is None:
+            raise ValueError('Only mobius xforms can be read')
+
+        def coefficient(name):
+            return complex(
+                float(elem.get('Re_' + name)), float(elem.get('Im_' + name)))
+        return Mobius(
+            coefficient('A'),
+            coefficient('B'),
+            coefficient('C'),
+            coefficient('D'))
+
+    def make_palette(self, elem):
+        """
+        Parse the hex colors of a <palette> tag. Palettes that were already
+        seen are reused
+        """
+        if elem is None:
+            return None
+
+        hex_colors = "".join(elem.text.split())
+        palette = self.palettes.get(hex_colors)
+        if palette is None:
+            values = bytearray.fromhex(hex_colors)
+            colors = [
+                tuple(values[i:i + 3]) for i in range(0, len(values), 3)]
+            palette = Palette(colors)
+            if len(self.palettes) >= self.MAX_PALETTES:
+                self.palettes.clear()
+            self.palettes[hex_colors] = palette
+        return palette
+
+def read_flames(fname):
+    """
+    Iterate over the flames in a .flame file
+    """
+    return iter(FlameReader(fname))
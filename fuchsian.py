@@ -0,0 +1,526 @@
+"""
+Real arithmetic for Fuchsian groups and hyperbolic tilings
+
+A Fuchsian group is a group of Mobius maps in SL(2, R), like the ones
+made by mobius_recipes.upper_half_plane. They map the upper half plane to
+itself, and conjugating by mobius_recipes.cayley_map turns them into maps
+of the unit disk to itself.
+
+Since the entries are real, RealMobius and RealMobiusArray store them as
+four floats instead of four complex numbers. That halves the memory of a
+batch and a product takes 8 real multiplications instead of 32. Maps are
+only converted to complex Mobius maps (and conjugated to the disk) when
+needed.
+
+The tiling generator enumerates the images of a fundamental domain under
+the group, working in the upper half plane with real arithmetic
+throughout, and returns the edges of the tiles in the disk as a
+ClineArray for svg.save_svg():
+
+generators, sides = gamma_2()
+edges = tile_disk(generators, sides, width=1000)
+save_svg('output/gamma_2.svg', edges, viewport=DISK_VIEWPORT, width=1000,
+    clip_circle=UNIT_DISK)
+"""
+import numpy as np
+
+from mobius import Mobius
+from mobius_array import MobiusArray
+from mobius_recipes import cayley_map
+from cline_array import ClineArray
+
+# The unit disk with a small margin, for save_svg()
+DISK_VIEWPORT = (-1.05, -1.05, 1.05, 1.05)
+
+# (center, radius) of the unit disk, to clip geodesics to it in save_svg()
+UNIT_DISK = (0, 1)
+
+class RealMobius(object):
+    """
+    A Mobius transformation with real coefficients
+
+    [a b]
+    [c d]
+    """
+    def __init__(self, a, b, c, d):
+        self.a = float(a)
+        self.b = float(b)
+        self.c = float(c)
+        self.d = float(d)
+
+    def __repr__(self):
+        return 'RealMobius({}, {}, {}, {})'.format(
+            self.a, self.b, self.c, self.d)
+
+    @classmethod
+    def from_mobius(cls, mobius, tolerance=1e-12):
+        """
+        Convert a Mobius map whose coefficients are real, up to a
+        tolerance relative to the largest coefficient
+        """
+        coeffs = [complex(x) for x in (mobius.a, mobius.b, mobius.c, mobius.d)]
+        scale = max(abs(x) for x in coeffs)
+        if any(abs(x.imag) > tolerance * scale for x in coeffs):
+            raise ValueError("{} does not have real coefficients".format(
+                mobius))
+        return cls(*[x.real for x in coeffs])
+
+    def to_mobius(self):
+        return Mobius(self.a, self.b, self.c, self.d)
+
+    def to_disk(self):
+        """
+        The same map acting on the unit disk, conjugated by the Cayley map
+        """
+        return self.to_mobius().conjugate_by(cayley_map)
+
+    def __call__(self, z):
+        """
+        Apply the map to a point. Points that land on the pole map to
+        complex infinity
+        """
+        top = self.a * z + self.b
+        bottom = self.c * z + self.d
+        if bottom == 0:
+            return complex('inf')
+        return top / bottom
+
+    def __mul__(self, other):
+        """
+        Compose two real maps
+        """
+        if not isinstance(other, RealMobius):
+            return NotImplemented
+        return RealMobius(
+            self.a * other.a + self.b * other.c,
+            self.a * other.b + self.b * other.d,
+            self.c * other.a + self.d * other.c,
+            self.c * other.b + self.d * other.d)
+
+    @property
+    def inv(self):
+        return RealMobius(self.d, -self.b, -self.c, self.a)
+
+    @property
+    def det(self):
+        return self.a * self.d - self.b * self.c
+
+    @property
+    def tr(self):
+        return self.a + self.d
+
+    @property
+    def normalize(self):
+        """
+        Scale the matrix to determinant 1. Maps with a negative
+        determinant swap the half planes and can't be normalized with
+        real numbers
+        """
+        det = self.det
+        if det <= 0:
+            raise ValueError("{} is not in GL+(2, R)".format(self))
+        sdet = det ** 0.5
+        return RealMobius(
+            self.a / sdet, self.b / sdet, self.c / sdet, self.d / sdet)
+
+class RealMobiusArray(object):
+    """
+    A batch of real Mobius maps stored as a float array of shape
+    (..., 2, 2). See mobius_array.MobiusArray for the broadcasting rules
+    """
+    # Coefficients closer than this are considered equal by keys
+    KEY_RESOLUTION = 1e-7
+
+    def __init__(self, matrices):
+        matrices = np.asarray(matrices, dtype=float)
+        if matrices.shape[-2:] != (2, 2):
+            raise ValueError(
+                'Expected an array of shape (..., 2, 2), got {}'.format(
+                    matrices.shape))
+        self.matrices = matrices
+
+    @classmethod
+    def from_real_mobius(cls, xforms):
+        """
+        Pack a list of RealMobius objects into a 1D RealMobiusArray
+        """
+        return cls([[[x.a, x.b], [x.c, x.d]] for x in xforms])
+
+    @classmethod
+    def from_mobius_array(cls, xforms, tolerance=1e-12):
+        """
+        Convert a MobiusArray whose coefficients are all real
+        """
+        matrices = MobiusArray.coerce(xforms).matrices
+        scale = np.abs(matrices).max(axis=(-1, -2), keepdims=True)
+        if np.any(np.abs(matrices.imag) > tolerance * scale):
+            raise ValueError("The maps do not have real coefficients")
+        return cls(matrices.real)
+
+    @classmethod
+    def identity(cls, shape=()):
+        if isinstance(shape, int):
+            shape = (shape,)
+        matrices = np.zeros(tuple(shape) + (2, 2))
+        matrices[..., 0, 0] = 1
+        matrices[..., 1, 1] = 1
+        return cls(matrices)
+
+    def to_mobius_array(self):
+        return MobiusArray(self.matrices)
+
+    def to_disk(self):
+        """
+        The same maps acting on the unit disk, conjugated by the Cayley map
+        """
+        return self.to_mobius_array().conjugate_by(cayley_map)
+
+    def __repr__(self):
+        return 'RealMobiusArray(shape={})'.format(self.shape)
+
+    @property
+    def shape(self):
+        return self.matrices.shape[:-2]
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, index):
+        """
+        Selecting a single map returns a RealMobius, anything else returns
+        a RealMobiusArray
+        """
+        result = self.matrices[index]
+        if result.ndim == 2:
+            return RealMobius(
+                result[0, 0], result[0, 1], result[1, 0], result[1, 1])
+        return RealMobiusArray(result)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def a(self):
+        return self.matrices[..., 0, 0]
+
+    @property
+    def b(self):
+        return self.matrices[..., 0, 1]
+
+    @property
+    def c(self):
+        return self.matrices[..., 1, 0]
+
+    @property
+    def d(self):
+        return self.matrices[..., 1, 1]
+
+    @classmethod
+    def coerce(cls, other):
+        """
+        Accept either a RealMobius or a RealMobiusArray, and return a
+        RealMobiusArray
+        """
+        if isinstance(other, RealMobiusArray):
+            return other
+        elif isinstance(other, RealMobius):
+            return cls([[other.a, other.b], [other.c, other.d]])
+        raise TypeError(
+            'Expected RealMobius or RealMobiusArray, got {}'.format(
+                type(other).__name__))
+
+    def __call__(self, z):
+        """
+        Apply the maps to complex points, broadcasting z against the batch
+        shape. Points that land on a pole map to complex infinity
+        """
+        z = np.asarray(z, dtype=complex)
+        top = self.a * z + self.b
+        bottom = self.c * z + self.d
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = top / bottom
+        return np.where(bottom == 0, complex('inf'), result)
+
+    def apply_real(self, x):
+        """
+        Apply the maps to points on the extended real line, which they
+        preserve. x may contain +-inf, and points that land on a pole map
+        to inf
+        """
+        x = np.asarray(x, dtype=float)
+        finite = np.isfinite(x)
+        safe_x = np.where(finite, x, 0.0)
+        top = np.where(finite, self.a * safe_x + self.b, self.a)
+        bottom = np.where(finite, self.c * safe_x + self.d, self.c)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = top / bottom
+        return np.where(bottom == 0, np.inf, result)
+
+    def __mul__(self, other):
+        if not isinstance(other, (RealMobius, RealMobiusArray)):
+            return NotImplemented
+        return RealMobiusArray(
+            np.matmul(self.matrices, self.coerce(other).matrices))
+
+    def __rmul__(self, other):
+        if not isinstance(other, RealMobius):
+            return NotImplemented
+        return RealMobiusArray(
+            np.matmul(self.coerce(other).matrices, self.matrices))
+
+    @property
+    def inv(self):
+        inverse = np.empty_like(self.matrices)
+        inverse[..., 0, 0] = self.d
+        inverse[..., 0, 1] = -self.b
+        inverse[..., 1, 0] = -self.c
+        inverse[..., 1, 1] = self.a
+        return RealMobiusArray(inverse)
+
+    @property
+    def det(self):
+        return self.a * self.d - self.b * self.c
+
+    @property
+    def tr(self):
+        return self.a + self.d
+
+    @property
+    def normalize(self):
+        """
+        Scale every matrix to determinant 1, see RealMobius.normalize
+        """
+        det = self.det
+        if np.any(det <= 0):
+            raise ValueError("Not every map is in GL+(2, R)")
+        sdet = np.sqrt(det)
+        return RealMobiusArray(self.matrices / sdet[..., np.newaxis, np.newaxis])
+
+    @property
+    def keys(self):
+        """
+        Hashable keys that are equal for numerically equal maps. M and -M
+        are the same map, so the sign is fixed first
+        """
+        flat = self.normalize.matrices.reshape((-1, 4))
+        first = np.argmax(np.abs(flat) > self.KEY_RESOLUTION, axis=1)
+        signs = np.sign(flat[np.arange(len(flat)), first])
+        rounded = np.rint(flat * signs[:, np.newaxis] / self.KEY_RESOLUTION)
+        return [row.tobytes() for row in rounded.astype(np.int64)]
+
+class GeodesicArray(object):
+    """
+    A batch of complete geodesics of the upper half plane, stored as the
+    endpoints (x1, x2) on the extended real line. Either endpoint may be
+    inf, making the geodesic a vertical line.
+
+    Real Mobius maps move the endpoints, so the geodesics never have to
+    be stored as clines until they are drawn
+    """
+    def __init__(self, x1, x2):
+        self.x1, self.x2 = np.broadcast_arrays(
+            np.asarray(x1, dtype=float), np.asarray(x2, dtype=float))
+
+    def __repr__(self):
+        return 'GeodesicArray(shape={})'.format(self.shape)
+
+    @property
+    def shape(self):
+        return self.x1.shape
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, index):
+        return GeodesicArray(self.x1[index], self.x2[index])
+
+    def transform(self, xforms):
+        """
+        Images of the geodesics under a RealMobius or RealMobiusArray.
+        The batch shapes broadcast like ClineArray.transform
+        """
+        xforms = RealMobiusArray.coerce(xforms)
+        return GeodesicArray(xforms.apply_real(self.x1),
+            xforms.apply_real(self.x2))
+
+    @property
+    def disk_angles(self):
+        """
+        Angles of the endpoints after the Cayley map, which sends x on the
+        real line to (x - i) / (x + i) on the unit circle
+        """
+        return (-2 * np.arctan2(1.0, self.x1), -2 * np.arctan2(1.0, self.x2))
+
+    @property
+    def disk_radii(self):
+        """
+        Euclidean radius of each geodesic in the disk, without leaving
+        real arithmetic. A geodesic whose endpoints are a chord of length
+        2s apart is a circle of radius s / sqrt(1 - s^2), and diameters
+        have infinite radius
+        """
+        x1 = self.x1
+        x2 = self.x2
+        finite1 = np.isfinite(x1)
+        finite2 = np.isfinite(x2)
+        safe_x1 = np.where(finite1, x1, 0.0)
+        safe_x2 = np.where(finite2, x2, 0.0)
+
+        # Half the chord length, |K(x1) - K(x2)| / 2
+        half_chord = np.abs(safe_x1 - safe_x2) / np.sqrt(
+            (1 + safe_x1 ** 2) * (1 + safe_x2 ** 2))
+        half_chord = np.where(finite2, half_chord, 1 / np.sqrt(1 + safe_x1 ** 2))
+        half_chord = np.where(finite1, half_chord, 1 / np.sqrt(1 + safe_x2 ** 2))
+        half_chord = np.where(finite1 | finite2, half_chord, 0.0)
+        half_chord = np.minimum(half_chord, 1.0)
+        with np.errstate(divide='ignore'):
+            return half_chord / np.sqrt(1 - half_chord ** 2)
+
+    @property
+    def keys(self):
+        """
+        Hashable keys that are equal for numerically equal geodesics,
+        whichever way round the endpoints are
+        """
+        angles = np.sort(np.stack(self.disk_angles, axis=-1).reshape((-1, 2)))
+        rounded = np.rint(angles / RealMobiusArray.KEY_RESOLUTION)
+        return [row.tobytes() for row in rounded.astype(np.int64)]
+
+    def to_clines(self):
+        """
+        The geodesics as clines in the upper half plane: semicircles
+        centered on the real axis, or vertical lines
+        """
+        x1 = self.x1.ravel()
+        x2 = self.x2.ravel()
+        vertical = ~(np.isfinite(x1) & np.isfinite(x2))
+        foot = np.where(np.isfinite(x1), x1, x2)
+        safe_x1 = np.where(vertical, 0.0, x1)
+        safe_x2 = np.where(vertical, 0.0, x2)
+        circles = ClineArray.from_circles(
+            0.5 * (safe_x1 + safe_x2), 0.5 * np.abs(safe_x1 - safe_x2))
+
+        # x = foot is the cline z + z.conj - 2 * foot = 0
+        matrices = circles.matrices
+        matrices[vertical, 0, 0] = 0
+        matrices[vertical, 0, 1] = 1
+        matrices[vertical, 1, 0] = 1
+        matrices[vertical, 1, 1] = -2 * foot[vertical]
+        return ClineArray(matrices.reshape(self.shape + (2, 2)))
+
+    def to_disk(self):
+        """
+        The geodesics as clines in the unit disk, scaled so circles have
+        A = 1
+        """
+        matrices = self.to_clines().transform(cayley_map).matrices
+        a = matrices[..., 0, 0].real
+        scale = np.where(np.abs(a) > 1e-12, a, 1.0)
+        return ClineArray(matrices / scale[..., np.newaxis, np.newaxis])
+
+def gamma_2():
+    """
+    The congruence subgroup Gamma(2) of the modular group, a free group
+    generated by z -> z + 2 and z -> z / (2z + 1). Its fundamental domain
+    is the ideal quadrilateral with vertices -1, 0, 1 and inf, and the
+    tiles form the Farey tessellation.
+
+    Returns (generators, sides)
+    """
+    generators = [RealMobius(1, 2, 0, 1), RealMobius(1, 0, 2, 1)]
+    sides = GeodesicArray([-1, 1, -1, 0], [np.inf, np.inf, 0, 1])
+    return (generators, sides)
+
+def enumerate_tiles(generators, sides, min_radius, max_tiles=1 << 20):
+    """
+    Breadth-first search over the group elements, yielding a
+    RealMobiusArray of new elements for every word length.
+
+    The tile of an element g is g applied to the fundamental domain. Its
+    neighbors across the sides are g * h for the generators h and their
+    inverses, so words are extended on the right and never by the inverse
+    of their last letter. A tile is pruned with all of its descendants
+    when every side is smaller than min_radius in the disk: further
+    tiles in that direction are even closer to the boundary circle.
+
+    Elements that were already reached through a different word (when the
+    group has relations) are skipped, and the search stops after
+    max_tiles tiles
+    """
+    letters = list(generators) + [g.inv for g in generators]
+    letters = RealMobiusArray.from_real_mobius(letters)
+    num_generators = len(generators)
+    inverse_letters = np.concatenate([
+        np.arange(num_generators, 2 * num_generators),
+        np.arange(num_generators)])
+
+    frontier = RealMobiusArray.identity(1)
+    last_letters = np.array([-1])
+    seen = set(frontier.keys)
+    num_tiles = 1
+    while len(frontier) > 0:
+        yield frontier
+        if num_tiles >= max_tiles:
+            return
+
+        # Every element times every letter, shape (N, letters)
+        words = RealMobiusArray(
+            np.matmul(frontier.matrices[:, np.newaxis], letters.matrices))
+        letter_indices = np.broadcast_to(
+            np.arange(len(letters)), words.shape)
+        allowed = letter_indices != inverse_letters[last_letters][:, np.newaxis]
+        allowed[last_letters < 0] = True
+
+        # Keep tiles that still have a visible side
+        radii = sides.transform(
+            RealMobiusArray(words.matrices[:, :, np.newaxis])).disk_radii
+        allowed &= radii.max(axis=-1) >= min_radius
+
+        words = words[allowed]
+        letter_indices = letter_indices[allowed]
+        keep = []
+        for i, key in enumerate(words.keys):
+            if key not in seen:
+                seen.add(key)
+                keep.append(i)
+        keep = keep[:max_tiles - num_tiles]
+        frontier = words[np.array(keep, dtype=int)]
+        last_letters = letter_indices[keep]
+        num_tiles += len(keep)
+
+def tile_disk(
+        generators,
+        sides,
+        width=1000,
+        min_size=0.5,
+        viewport=DISK_VIEWPORT,
+        max_tiles=1 << 20):
+    """
+    Tile the unit disk with the images of a fundamental domain, returning
+    the distinct tile edges as a ClineArray in the disk.
+
+    generators: RealMobius maps in SL(2, R) pairing the sides
+    sides: GeodesicArray of the sides of the fundamental domain in the
+        upper half plane. They must be complete geodesics (as for ideal
+        polygons or Schottky groups), since the exporters draw whole
+        clines rather than arcs
+    width, viewport: the SVG size the tiling is for, see SVGWriter.
+        Tiles with every side smaller than min_size pixels are pruned
+    """
+    x_min, _, x_max, _ = viewport
+    min_radius = min_size * (x_max - x_min) / float(width)
+
+    seen = set()
+    x1 = []
+    x2 = []
+    for elements in enumerate_tiles(generators, sides, min_radius, max_tiles):
+        edges = sides.transform(
+            RealMobiusArray(elements.matrices[:, np.newaxis]))
+        edges = edges[edges.disk_radii >= min_radius]
+        for i, key in enumerate(edges.keys):
+            if key not in seen:
+                seen.add(key)
+                x1.append(edges.x1[i])
+                x2.append(edges.x2[i])
+    return GeodesicArray(x1, x2).to_disk()
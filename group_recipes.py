@@ -5,25 +5,31 @@ These return lists of transformations including inverses.
 Most of these are from Indra's Pearls by David Mumford et al.
 """
 from mobius import Mobius
+from mobius_array import MobiusArray, complex_dtype
 import cmath
 
+import numpy as np
+
 def make_group(*xforms):
     """
     Add inverses to a list of transformations
     """
     return list(xforms) + [xform.inv for xform in xforms]
 
-def solve_quadratic(a, b, c):
+def solve_quadratic(a, b, c, sqrt=cmath.sqrt):
     """
     Solve the quadratic equation returning
     (root+, root-) even if they are the same
+
+    Pass np.sqrt to solve arrays of equations, or mpmath.sqrt for
+    mpmath numbers
     """
     top_left = -b
     discriminant = b * b - 4 * a * c
     bottom = 2 * a
 
-    sol_plus = (top_left + cmath.sqrt(discriminant)) / bottom
-    sol_minus = (top_left - cmath.sqrt(discriminant)) / bottom
+    sol_plus = (top_left + sqrt(discriminant)) / bottom
+    sol_minus = (top_left - sqrt(discriminant)) / bottom
     return (sol_plus, sol_minus)
 
 def grandmas_recipe(trace_a, trace_b, plus_root=True):
@@ -47,6 +53,16 @@ def grandmas_recipe(trace_a, trace_b, plus_root=True):
     # when Tab is complex
     trace_ab = plus if plus_root else minus
 
+    a, b = grandmas_coefficients(trace_a, trace_b, trace_ab)
+    return make_group(Mobius(*a), Mobius(*b))
+
+def grandmas_coefficients(trace_a, trace_b, trace_ab):
+    """
+    The coefficients (A, B, C, D) of the generators a and b of
+    grandmas_recipe() given all three traces. This is plain arithmetic, so
+    the traces may be complex numbers, NumPy arrays of any complex dtype
+    or mpmath numbers
+    """
     # Compute z0
     z0_top = (trace_ab - 2) * trace_b
     z0_bottom = trace_b * trace_ab - 2 * trace_a + 2j * trace_ab
@@ -57,17 +73,37 @@ def grandmas_recipe(trace_a, trace_b, plus_root=True):
     B = (trace_a * trace_ab - 2 * trace_b + 4j) / ((2 * trace_ab + 4) * z0)
     C = (trace_a * trace_ab - 2 * trace_b - 4j) * z0 / (2 * trace_ab - 4)
     D = A
-    a = Mobius(A, B, C, D)
+    a = (A, B, C, D)
 
     # Compute the coeffients of b
     A = (trace_b - 2j) / 2
     B = trace_b / 2
     C = B
     D = (trace_b + 2j) / 2
-    b = Mobius(A, B, C, D)
+    b = (A, B, C, D)
+    return (a, b)
+
+def grandmas_recipe_array(trace_a, trace_b, plus_root=True, dtype=complex):
+    """
+    Batched grandmas_recipe() for arrays of traces, computed in the given
+    complex dtype. plus_root may be an array too.
+
+    Returns a MobiusArray of shape (..., 4) holding a, b, a^-1, b^-1, the
+    same order as make_group()
+    """
+    dtype = complex_dtype(None, dtype)
+    trace_a, trace_b = np.broadcast_arrays(
+        np.asarray(trace_a, dtype=dtype), np.asarray(trace_b, dtype=dtype))
+    plus, minus = solve_quadratic(
+        1, -trace_a * trace_b, trace_a ** 2 + trace_b ** 2, np.sqrt)
+    trace_ab = np.where(plus_root, plus, minus)
 
-    # Finally, return it as a group
-    return make_group(a, b)
+    a, b = grandmas_coefficients(trace_a, trace_b, trace_ab)
+    generators = MobiusArray.from_coefficients(
+        *[np.stack(x, axis=-1) for x in zip(a, b)], dtype=dtype)
+    matrices = np.concatenate(
+        [generators.matrices, generators.inv.matrices], axis=-3)
+    return MobiusArray(matrices)
 
 # The Glowing Gasket of Chapter 7 fame
 apollonian_gasket = make_group(
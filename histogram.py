@@ -0,0 +1,209 @@
+"""
+Accumulation buffers for the native renderer
+
+A histogram has one cell per (supersampled) pixel. Every cell holds the
+sum of the palette colors of the points that landed in it and the number
+of points, the same four channels flam3 accumulates. The finishing stage
+(see tonemap.py) turns this into an image, reading it a band of rows at a
+time with read_rows().
+
+Histogram keeps the buffer in memory. TiledHistogram keeps it in a
+memory-mapped file on disk, so posters can be rendered at resolutions
+that wouldn't fit in RAM.
+
+As in flam3, row 0 is at the top of the viewport.
+"""
+import os
+import tempfile
+
+import numpy as np
+
+# Channels of the accumulation buffer
+RED, GREEN, BLUE, COUNT = range(4)
+CHANNELS = 4
+
+class Histogram(object):
+    """
+    In-memory accumulation buffer of shape (height, width, 4)
+    """
+    def __init__(self, width, height, viewport):
+        """
+        viewport: (x_min, y_min, x_max, y_max) region of the plane mapped
+        onto the buffer
+        """
+        self.width = width
+        self.height = height
+        self.viewport = viewport
+        self.buffer = np.zeros((height, width, CHANNELS))
+        self.total_samples = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def num_pixels(self):
+        return self.width * self.height
+
+    def pixel_coords(self, z):
+        """
+        Map complex points to (rows, cols, inside), where inside masks the
+        points that land in the buffer. Non-finite points are outside
+        """
+        x_min, y_min, x_max, y_max = self.viewport
+        with np.errstate(invalid='ignore'):
+            cols = np.floor(
+                (z.real - x_min) * (self.width / (x_max - x_min)))
+            rows = np.floor(
+                (y_max - z.imag) * (self.height / (y_max - y_min)))
+            inside = (
+                (cols >= 0) & (cols < self.width) &
+                (rows >= 0) & (rows < self.height))
+        return (rows[inside].astype(np.intp), cols[inside].astype(np.intp),
+            inside)
+
+    def accumulate(self, z, colors):
+        """
+        Add a batch of points.
+
+        z: complex array of points. Points outside the viewport (or at
+            infinity) still count towards total_samples, since the
+            brightness is relative to the number of points iterated
+        colors: float array of shape (len(z), 3), the RGB palette color of
+            each point on a 0-255 scale
+        """
+        z = np.asarray(z)
+        self.total_samples += z.size
+        rows, cols, inside = self.pixel_coords(z.ravel())
+        if len(rows) == 0:
+            return
+        indices = rows * self.width + cols
+        colors = np.asarray(colors).reshape((-1, 3))[inside]
+
+        # bincount sums the colors of points that share a pixel, which a
+        # fancy-indexed += would not
+        flat = self.buffer.reshape((-1, CHANNELS))
+        for channel in (RED, GREEN, BLUE):
+            flat[:, channel] += np.bincount(
+                indices, colors[:, channel], minlength=self.num_pixels)
+        flat[:, COUNT] += np.bincount(indices, minlength=self.num_pixels)
+
+    def read_rows(self, start, stop):
+        """
+        The cells of rows [start, stop) as a float array of shape
+        (stop - start, width, 4)
+        """
+        return self.buffer[start:stop]
+
+    def close(self):
+        pass
+
+class TiledHistogram(Histogram):
+    """
+    Accumulation buffer stored on disk in square tiles.
+
+    The file is a memory map of shape
+    (tile rows, tile columns, tile_size, tile_size, 4), so every tile is
+    contiguous. Points are queued up and binned in batches of
+    BATCH_SIZE: sorting a batch by cell means the updates sweep through
+    the file once, tile by tile, instead of jumping around in it.
+
+    The buffer is float32 by default to halve the disk space. The file is
+    deleted on close()
+    """
+    BATCH_SIZE = 1 << 21
+
+    def __init__(
+            self,
+            width,
+            height,
+            viewport,
+            tile_size=256,
+            dirname=None,
+            dtype=np.float32):
+        """
+        dirname: where to put the buffer file, by default the system
+        temporary directory
+        """
+        self.width = width
+        self.height = height
+        self.viewport = viewport
+        self.tile_size = tile_size
+        self.tile_rows = -(-height // tile_size)
+        self.tile_cols = -(-width // tile_size)
+        self.total_samples = 0
+        self.pending = []
+        self.num_pending = 0
+
+        fd, self.fname = tempfile.mkstemp(suffix='.hist', dir=dirname)
+        os.close(fd)
+        self.tiles = np.memmap(
+            self.fname,
+            dtype=dtype,
+            mode='w+',
+            shape=(self.tile_rows, self.tile_cols, tile_size, tile_size,
+                CHANNELS))
+
+    def accumulate(self, z, colors):
+        """
+        Queue a batch of points, see Histogram.accumulate()
+        """
+        z = np.asarray(z)
+        self.total_samples += z.size
+        rows, cols, inside = self.pixel_coords(z.ravel())
+        if len(rows) == 0:
+            return
+        colors = np.asarray(colors).reshape((-1, 3))[inside]
+        self.pending.append((rows, cols, colors))
+        self.num_pending += len(rows)
+        if self.num_pending >= self.BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """
+        Bin the queued points into the tiles
+        """
+        if not self.pending:
+            return
+        rows, cols, colors = [np.concatenate(x) for x in zip(*self.pending)]
+        self.pending = []
+        self.num_pending = 0
+
+        # Index of every cell in the tiled layout, so sorted indices are
+        # grouped by tile
+        size = self.tile_size
+        tiles = (rows // size) * self.tile_cols + cols // size
+        indices = tiles * (size * size) + (rows % size) * size + cols % size
+
+        cells, inverse = np.unique(indices, return_inverse=True)
+        sums = np.empty((len(cells), CHANNELS))
+        for channel in (RED, GREEN, BLUE):
+            sums[:, channel] = np.bincount(
+                inverse, colors[:, channel], minlength=len(cells))
+        sums[:, COUNT] = np.bincount(inverse, minlength=len(cells))
+
+        # The cells are unique, so a fancy-indexed += is safe here
+        flat = self.tiles.reshape((-1, CHANNELS))
+        flat[cells] += sums
+
+    def read_rows(self, start, stop):
+        self.flush()
+        size = self.tile_size
+        bands = []
+        for tile_row in range(start // size, (stop - 1) // size + 1):
+            # (tile columns, size, size, 4) -> (size, all columns, 4)
+            band = self.tiles[tile_row].transpose((1, 0, 2, 3)).reshape(
+                (size, self.tile_cols * size, CHANNELS))
+            first = max(start - tile_row * size, 0)
+            last = min(stop - tile_row * size, size)
+            bands.append(band[first:last, :self.width])
+        return np.concatenate(bands).astype(float)
+
+    def close(self):
+        if self.tiles is None:
+            return
+        self.pending = []
+        self.tiles = None
+        os.remove(self.fname)
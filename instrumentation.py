@@ -0,0 +1,175 @@
+"""
+Opt-in instrumentation of the animation and atlas pipelines
+
+Turn it on with the INSTRUMENT environment variable or enable():
+
+INSTRUMENT=1 python main.py params/gears.json
+
+Every FractalAnimation.make_animation() and atlas.make_atlas() call then
+writes a JSON report next to its output file (output.flame.report.json)
+with:
+
+- wall and CPU time of the whole run and of each pipeline stage. The
+  stages are the curve evaluation ('params' or 'traces'), the group
+  recipe ('flames' or 'recipe'), XML formatting ('serialize') and the disk
+  writes ('write'), see pipeline.StageStats for the other fields
+- counters: frames produced and skipped, bytes written
+- the peak memory (resident set size) of the process so far
+
+When it is off, run() hands out a shared do-nothing object and count()
+returns after checking one global, so the instrumented code costs the
+same as before.
+"""
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    # Not on Windows
+    resource = None
+
+ENV_VAR = 'INSTRUMENT'
+
+_enabled = bool(os.environ.get(ENV_VAR))
+
+# The Run being recorded, if any
+_current = None
+
+def enable():
+    global _enabled
+    _enabled = True
+
+def disable():
+    global _enabled
+    _enabled = False
+
+def is_enabled():
+    return _enabled
+
+def count(name, n=1):
+    """
+    Add n to a counter of the run being recorded, if there is one
+    """
+    run = _current
+    if run is not None:
+        run.count(name, n)
+
+def peak_memory():
+    """
+    Peak resident set size of the process in bytes, or None where the
+    platform doesn't say
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def run(name, fname=None):
+    """
+    Record a run that writes fname, as a context manager:
+
+    with instrumentation.run('make_animation', fname) as stats:
+        pipeline.run()
+        stats.add_pipeline(pipeline)
+
+    Returns a do-nothing NullRun unless instrumentation is enabled
+    """
+    if not _enabled:
+        return NULL_RUN
+    return Run(name, fname)
+
+class NullRun(object):
+    """
+    Stands in for Run when instrumentation is disabled
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def count(self, name, n=1):
+        pass
+
+    def add_pipeline(self, pipeline):
+        pass
+
+NULL_RUN = NullRun()
+
+class Run(object):
+    """
+    Timings and counters of one run. On a clean exit the report is saved
+    to report_fname, by default fname + '.report.json' or
+    name + '.report.json' if there is no output file
+    """
+    COUNTERS = ('frames_produced', 'frames_skipped', 'bytes_written')
+
+    def __init__(self, name, fname=None, report_fname=None):
+        self.name = name
+        self.fname = fname
+        self.report_fname = report_fname or '{}.report.json'.format(
+            fname or name)
+        self.counters = dict((counter, 0) for counter in self.COUNTERS)
+        self.stages = {}
+        self.started = None
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.lock = threading.Lock()
+        self.previous = None
+
+    def __enter__(self):
+        global _current
+        self.previous = _current
+        _current = self
+        self.started = time.time()
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global _current
+        self.wall = time.perf_counter() - self.wall_start
+        self.cpu = time.process_time() - self.cpu_start
+        _current = self.previous
+        if exc_type is None:
+            if self.fname is not None and os.path.exists(self.fname):
+                self.count('bytes_written', os.path.getsize(self.fname))
+            self.save()
+        return False
+
+    def count(self, name, n=1):
+        # Pipeline stages count from their own threads
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_pipeline(self, pipeline):
+        """
+        Record the stage statistics of a finished pipeline. Every item
+        that reached the sink is a frame produced
+        """
+        for stats in pipeline.stats:
+            self.stages[stats.name] = stats.to_dict()
+        self.count('frames_produced', pipeline.stats[-1].items)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'output': self.fname,
+            'started': time.strftime(
+                '%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+            'wall': self.wall,
+            'cpu': self.cpu,
+            'peak_memory': peak_memory(),
+            'counters': self.counters,
+            'stages': self.stages,
+        }
+
+    def save(self):
+        with open(self.report_fname, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+            f.write('\n')
@@ -175,12 +175,64 @@ class Mobius(object):
         [a b] * [e f] = [ae + bg  af + bh]
         [c d]   [g h]   [ce + dg  cf + dh]
         """
+        if not isinstance(other, Mobius):
+            # Let batched types like MobiusArray handle the product
+            return NotImplemented
         a = self.a * other.a + self.b * other.c
         b = self.a * other.b + self.b * other.d
         c = self.c * other.a + self.d * other.c
         d = self.c * other.b + self.d * other.d
         return Mobius(a, b, c, d)
 
+    def power(self, t):
+        """
+        Compute M^t in closed form for any real (or even complex) exponent t.
+
+        Away from the parabolic case, M is conjugate to S(z) = kz with
+        k = M.scaling_factor, and M^t is the conjugate of S^t(z) = k^t z by
+        the same map. Writing k = e^(2 * mu) with cosh(mu) = (Tr M) / 2
+        (after normalizing), this works out to
+
+        M^t = s(t) * M - s(t - 1) * I,    s(t) = sinh(t * mu) / sinh(mu)
+
+        which never needs the fixed points explicitly. In the parabolic
+        case mu = 0 and s(t) = t, so M^t = t * M + (1 - t) * I, the
+        conjugate of the translation z + t.
+
+        M and -M are the same map, so the sign is chosen to make
+        Re(Tr M) >= 0, which picks the shortest path from the identity.
+
+        See MobiusArray.power for a vectorized version
+        """
+        N = self.normalize
+        if N.tr.real < 0:
+            N = Mobius(-N.a, -N.b, -N.c, -N.d)
+        mu = cmath.acosh(N.tr / 2.0)
+        sinh_mu = cmath.sinh(mu)
+        if sinh_mu == 0:
+            s_t = t
+            s_prev = t - 1
+        else:
+            s_t = cmath.sinh(t * mu) / sinh_mu
+            s_prev = cmath.sinh((t - 1) * mu) / sinh_mu
+        return Mobius(
+            s_t * N.a - s_prev, s_t * N.b, s_t * N.c, s_t * N.d - s_prev)
+
+    def __pow__(self, t):
+        return self.power(t)
+
+    def interpolate(self, t, target=None):
+        """
+        Move along a one-parameter subgroup. With no target, this goes
+        from the identity (t = 0) to M (t = 1), i.e. M^t. Otherwise this
+        goes from M (t = 0) to the target (t = 1):
+
+        M * (M^-1 * target)^t
+        """
+        if target is None:
+            return self.power(t)
+        return self * (self.inv * target).power(t)
+
     def conjugate_by(self, other):
         """
         If this transform is T and the other is M,
@@ -331,24 +383,40 @@ class Mobius(object):
         else:
             return 'parabolic'
 
-    def to_flame(self, color=0.0):
-        """
-        Format a XML line for use in Apophysis/Chaotica
-        """
-        attributes = {
-            'weight': 0.5,
-            'color': color,
-            'mobius': 1,
-            'coefs': '1 0 0 1 0 0',
-            'Re_A': self.a.real,
-            'Im_A': self.a.imag,
-            'Re_B': self.b.real,
-            'Im_B': self.b.imag,
-            'Re_C': self.c.real,
-            'Im_C': self.c.imag,
-            'Re_D': self.d.real,
-            'Im_D': self.d.imag,
-            'opacity': 1,
-        }
-        attrs = ['{}="{}"'.format(key, val) for key, val in attributes.items()]
-        return "<xform {} />".format(" ".join(attrs))
+    # The <xform> tag for Apophysis/Chaotica. Only the weight, color and
+    # coefficients change between transformations, so everything else is
+    # formatted once when the class is defined.
+    FLAME_TEMPLATE = "<xform {} />".format(" ".join(
+        '{}="{}"'.format(key, val) for key, val in [
+            ('weight', '{0}'),
+            ('color', '{1}'),
+            ('mobius', 1),
+            ('coefs', '1 0 0 1 0 0'),
+            ('Re_A', '{2}'),
+            ('Im_A', '{3}'),
+            ('Re_B', '{4}'),
+            ('Im_B', '{5}'),
+            ('Re_C', '{6}'),
+            ('Im_C', '{7}'),
+            ('Re_D', '{8}'),
+            ('Im_D', '{9}'),
+            ('opacity', 1),
+        ]))
+
+    def to_flame(self, color=0.0, weight=0.5):
+        """
+        Format a XML line for use in Apophysis/Chaotica. weight is the
+        relative probability of the renderer choosing this transformation,
+        see chaos_game.contraction_weights
+        """
+        return self.FLAME_TEMPLATE.format(
+            weight,
+            color,
+            self.a.real,
+            self.a.imag,
+            self.b.real,
+            self.b.imag,
+            self.c.real,
+            self.c.imag,
+            self.d.real,
+            self.d.imag)
@@ -0,0 +1,291 @@
+"""
+Batches of Mobius maps stored in a single NumPy array.
+
+Each map is stored in matrix form
+
+[a b]
+[c d]
+
+so a batch of maps is a complex array of shape (..., 2, 2). All operations
+broadcast like NumPy arrays, so a single map can be composed with a whole
+batch, or a batch of N maps with a batch of M maps laid out as (N, 1) and
+(M,) to get all N * M products at once.
+
+The matrices may be stored in any complex dtype: complex64 halves the
+memory of huge batches, and np.clongdouble gives extended precision where
+the platform has it (see precision.py). Products and other operations
+keep the dtype of the batch.
+"""
+import numpy as np
+
+from mobius import Mobius
+
+def complex_dtype(array, dtype=None):
+    """
+    The complex dtype to store an array in. A real dtype is promoted to
+    the complex dtype of the same precision. Without a dtype, this is the
+    complex dtype matching the array itself, complex128 for Python numbers
+    """
+    if dtype is None:
+        dtype = np.asarray(array).dtype
+    return np.result_type(dtype, np.complex64)
+
+class MobiusArray(object):
+    """
+    An array of Mobius transformations.
+    """
+    def __init__(self, matrices, dtype=None):
+        """
+        Wrap an array of shape (..., 2, 2). This does NOT normalize
+        the matrices. dtype defaults to the complex dtype matching the
+        array, see complex_dtype()
+        """
+        matrices = np.asarray(matrices)
+        matrices = matrices.astype(complex_dtype(matrices, dtype), copy=False)
+        if matrices.shape[-2:] != (2, 2):
+            raise ValueError(
+                'Expected an array of shape (..., 2, 2), got {}'.format(
+                    matrices.shape))
+        self.matrices = matrices
+
+    @classmethod
+    def from_coefficients(cls, a, b, c, d, dtype=None):
+        """
+        Build a batch from arrays of coefficients. The four arrays are
+        broadcast against each other.
+        """
+        if dtype is None:
+            dtype = np.result_type(*[np.asarray(x) for x in (a, b, c, d)])
+        dtype = complex_dtype(None, dtype)
+        a, b, c, d = np.broadcast_arrays(
+            *[np.asarray(x, dtype=dtype) for x in (a, b, c, d)])
+        matrices = np.empty(a.shape + (2, 2), dtype=dtype)
+        matrices[..., 0, 0] = a
+        matrices[..., 0, 1] = b
+        matrices[..., 1, 0] = c
+        matrices[..., 1, 1] = d
+        return cls(matrices)
+
+    @classmethod
+    def from_mobius(cls, xforms, dtype=complex):
+        """
+        Pack a list of Mobius objects into a 1D MobiusArray
+        """
+        return cls([[[x.a, x.b], [x.c, x.d]] for x in xforms], dtype)
+
+    @classmethod
+    def identity(cls, shape=(), dtype=complex):
+        """
+        A batch of identity maps of the given shape
+        """
+        if isinstance(shape, int):
+            shape = (shape,)
+        matrices = np.zeros(
+            tuple(shape) + (2, 2), dtype=complex_dtype(None, dtype))
+        matrices[..., 0, 0] = 1
+        matrices[..., 1, 1] = 1
+        return cls(matrices)
+
+    def to_list(self):
+        """
+        Unpack a 1D MobiusArray into a list of Mobius objects
+        """
+        return [self[i] for i in range(len(self))]
+
+    def __repr__(self):
+        return 'MobiusArray(shape={})'.format(self.shape)
+
+    @property
+    def shape(self):
+        """
+        The shape of the batch, not including the 2x2 matrix axes
+        """
+        return self.matrices.shape[:-2]
+
+    @property
+    def dtype(self):
+        return self.matrices.dtype
+
+    def astype(self, dtype):
+        """
+        Copy of the batch stored in another complex dtype
+        """
+        return MobiusArray(self.matrices, dtype)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, index):
+        """
+        Index into the batch. Selecting a single map returns a Mobius
+        object, anything else returns a MobiusArray
+        """
+        result = self.matrices[index]
+        if result.ndim == 2:
+            return Mobius(result[0, 0], result[0, 1], result[1, 0], result[1, 1])
+        return MobiusArray(result)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def a(self):
+        return self.matrices[..., 0, 0]
+
+    @property
+    def b(self):
+        return self.matrices[..., 0, 1]
+
+    @property
+    def c(self):
+        return self.matrices[..., 1, 0]
+
+    @property
+    def d(self):
+        return self.matrices[..., 1, 1]
+
+    @classmethod
+    def coerce(cls, other, dtype=complex):
+        """
+        Accept either a Mobius or a MobiusArray, and return a MobiusArray.
+        A single Mobius is stored in dtype, so that combining it with a
+        batch keeps the dtype of the batch
+        """
+        if isinstance(other, MobiusArray):
+            return other
+        elif isinstance(other, Mobius):
+            return cls([[other.a, other.b], [other.c, other.d]], dtype)
+        raise TypeError('Expected Mobius or MobiusArray, got {}'.format(
+            type(other).__name__))
+
+    def __call__(self, z):
+        """
+        Apply the transformations to points. z is broadcast against the
+        batch shape. Points that land on a pole map to complex infinity
+        rather than raising, and infinity maps to A / C (infinity when
+        C = 0), like ProjectivePoints
+        """
+        z = np.asarray(z)
+        z = z.astype(np.result_type(z.dtype, self.dtype), copy=False)
+        at_infinity = np.isinf(z)
+        finite_z = np.where(at_infinity, 0, z)
+        top = self.a * finite_z + self.b
+        bottom = self.c * finite_z + self.d
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = np.where(bottom == 0, complex('inf'), top / bottom)
+            image_of_infinity = np.where(
+                self.c == 0, complex('inf'), self.a / self.c)
+        return np.where(at_infinity, image_of_infinity, result)
+
+    def __mul__(self, other):
+        """
+        Compose the transformations with matrix multiplication, broadcasting
+        over the batch shape
+        """
+        if not isinstance(other, (Mobius, MobiusArray)):
+            return NotImplemented
+        return MobiusArray(np.matmul(
+            self.matrices, self.coerce(other, self.dtype).matrices))
+
+    def __rmul__(self, other):
+        if not isinstance(other, Mobius):
+            return NotImplemented
+        return MobiusArray(np.matmul(
+            self.coerce(other, self.dtype).matrices, self.matrices))
+
+    def conjugate_by(self, other):
+        """
+        Batched version of Mobius.conjugate_by: T' = MTM^(-1)
+        """
+        other = self.coerce(other, self.dtype)
+        return other * self * other.inv
+
+    @property
+    def inv(self):
+        """
+        Find the inverse transformations:
+
+        M^-1 = [d -b]
+               [-c a]
+        """
+        return MobiusArray.from_coefficients(self.d, -self.b, -self.c, self.a)
+
+    @property
+    def det(self):
+        """
+        det M = a * d - b * c
+        """
+        return self.a * self.d - self.b * self.c
+
+    @property
+    def normalize(self):
+        """
+        Normalize each matrix to have determinant 1
+
+        M' = M / sqrt(det M)
+        """
+        sdet = np.sqrt(self.det)
+        return MobiusArray(self.matrices / sdet[..., np.newaxis, np.newaxis])
+
+    @property
+    def drift(self):
+        """
+        |det M - 1|, how far each matrix has drifted from determinant 1
+        through rounding since it was last normalized
+        """
+        return np.abs(self.det - 1)
+
+    @property
+    def tr(self):
+        """
+        tr M = a + d
+        """
+        return self.a + self.d
+
+    @property
+    def T(self):
+        """
+        Transpose of each matrix
+        """
+        return MobiusArray(np.swapaxes(self.matrices, -1, -2))
+
+    @property
+    def conj(self):
+        """
+        Complex conjugate of each matrix
+        """
+        return MobiusArray(np.conjugate(self.matrices))
+
+    def power(self, t):
+        """
+        Vectorized Mobius.power. t may be a scalar or an array; it is
+        broadcast against the batch shape, so a single map with an array
+        of exponents gives one map per exponent.
+        """
+        t = np.asarray(t)
+        N = self.normalize.matrices
+        flip = N[..., 0, 0].real + N[..., 1, 1].real < 0
+        N = np.where(flip[..., np.newaxis, np.newaxis], -N, N)
+
+        mu = np.arccosh((N[..., 0, 0] + N[..., 1, 1]) / 2.0)
+        sinh_mu = np.sinh(mu)
+        parabolic = sinh_mu == 0
+        safe_sinh = np.where(parabolic, 1.0, sinh_mu)
+        s_t = np.where(parabolic, t, np.sinh(t * mu) / safe_sinh)
+        s_prev = np.where(parabolic, t - 1, np.sinh((t - 1) * mu) / safe_sinh)
+
+        s_t = s_t[..., np.newaxis, np.newaxis]
+        s_prev = s_prev[..., np.newaxis, np.newaxis]
+        return MobiusArray(s_t * N - s_prev * np.eye(2), self.dtype)
+
+    def __pow__(self, t):
+        return self.power(t)
+
+    def interpolate(self, t, target=None):
+        """
+        Vectorized Mobius.interpolate
+        """
+        if target is None:
+            return self.power(t)
+        return self * (self.inv * target).power(t)
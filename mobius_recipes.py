@@ -3,8 +3,13 @@ Recipes from the book Indra's Pearls by David Mumford et al.
 plus some of my own variations
 """
 import cmath
+import math
+
+import numpy as np
 
 from mobius import Mobius
+from mobius_array import MobiusArray
+from projective import ProjectivePoints
 import basic_maps
 
 def upper_half_plane(a, b, c, d):
@@ -77,14 +82,50 @@ def cross_ratio_map(p, q, r):
          Q -> 1
          R -> infinity
     """
-    P = complex(P)
-    Q = complex(Q)
-    R = complex(R)
+    P = complex(p)
+    Q = complex(q)
+    R = complex(r)
 
     a = Q - R
     b = Q - P
     return Mobius(a, -P * a, b, -R * b).normalize
 
+def cross_ratio_maps(points):
+    """
+    Batched version of cross_ratio_map.
+
+    points is an array of shape (N, 3) of (P, Q, R) triples. Any of the
+    points may be complex infinity. Working in homogeneous coordinates
+    P = (p1, p2), etc. the cross ratio map is
+
+    S = [(Q x R) * p2   -(Q x R) * p1]
+        [(Q x P) * r2   -(Q x P) * r1]
+
+    where Q x R = q1 * r2 - q2 * r1. When p2 = q2 = r2 = 1 this is the
+    same matrix as cross_ratio_map. det S = (Q x R)(Q x P)(P x R) vanishes
+    exactly when two of the points coincide.
+
+    Returns (maps, valid) where maps is a normalized MobiusArray of shape
+    (N,) and valid is a boolean mask that is False for degenerate triples.
+    Degenerate entries are set to the identity.
+    """
+    homogeneous = ProjectivePoints.from_complex(points)
+    u, v = homogeneous.u, homogeneous.v
+    p1, q1, r1 = u[..., 0], u[..., 1], u[..., 2]
+    p2, q2, r2 = v[..., 0], v[..., 1], v[..., 2]
+
+    q_cross_r = q1 * r2 - q2 * r1
+    q_cross_p = q1 * p2 - q2 * p1
+    maps = MobiusArray.from_coefficients(
+        q_cross_r * p2, -q_cross_r * p1, q_cross_p * r2, -q_cross_p * r1)
+
+    det = maps.det
+    valid = det != 0
+    sdet = np.sqrt(np.where(valid, det, 1.0))
+    matrices = maps.matrices / sdet[..., np.newaxis, np.newaxis]
+    matrices[~valid] = np.eye(2)
+    return (MobiusArray(matrices), valid)
+
 def circle_inversion(center, radius, z):
     """
     Invert a point in an arbitrary circle
@@ -143,6 +184,21 @@ def find_mobius_xform(p1, q1, r1, p2, q2, r2):
     T = cross_ratio_map(p2, q2, r2)
     return T.inv * S
 
+def find_mobius_xforms(sources, targets):
+    """
+    Batched version of find_mobius_xform.
+
+    sources and targets are arrays of shape (N, 3) of point triples
+    (P, Q, R) and (P', Q', R'). Points may be complex infinity.
+
+    Returns (maps, valid) where maps is a MobiusArray of shape (N,) and
+    valid is False wherever either triple is degenerate. Degenerate
+    entries are set to the identity.
+    """
+    S, valid_s = cross_ratio_maps(sources)
+    T, valid_t = cross_ratio_maps(targets)
+    return (T.inv * S, valid_s & valid_t)
+
 
 def centered_parabolic(translate_amount):
     """
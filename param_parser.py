@@ -1,12 +1,16 @@
 import json
 from flame import Palette
+from mobius import Mobius
 import animation
+import group_recipes
 import parametric
 
 class ParamParser(object):
     # Which animation class to use
     ANIMATORS = {
-        'grandma': animation.GrandmasAnimation
+        'grandma': animation.GrandmasAnimation,
+        'keyframe': animation.KeyframeAnimation,
+        'camera': animation.CameraAnimation
     }
 
     """
@@ -30,7 +34,8 @@ class ParamParser(object):
         """
         self.params['params'] but all the properties beginning with
         'curve_' are replaced with a ParametricCurve object
-        and 'palette' is replaced with a Palette object
+        and 'palette' is replaced with a Palette object. 'keyframes' is
+        replaced with a list of groups and 'group' with a single group
         """
         params = self.params['params']
         result = {}
@@ -40,15 +45,36 @@ class ParamParser(object):
                 result[key] = self.make_curve(value)
             elif key == 'palette':
                 result[key] = self.make_palette(value)
+            elif key == 'keyframes':
+                result[key] = [self.make_group(group) for group in value]
+            elif key == 'group':
+                result[key] = self.make_group(value)
             else:
                 # Pass other keys through unaltered
                 result[key] = value
         return result
 
-    def make_palette(self, palette_type):
-        if palette_type == 'random':
+    def make_palette(self, data):
+        """
+        palette = "random"                                -> Palette.random
+                | ["random", seed]                        -> Palette.random
+                | ["cosine", [c_r, d_r], [c_g, d_g], [c_b, d_b]]
+                                                          -> Palette.cosine
+        """
+        if data == 'random':
             return Palette.random()
 
+        palette_type = data[0]
+        args = data[1:]
+        if palette_type == 'random':
+            [seed] = args
+            return Palette.random(seed)
+        elif palette_type == 'cosine':
+            red, green, blue = args
+            return Palette.cosine(red, green, blue)
+        else:
+            raise ValueError("{} is not a valid palette!".format(data))
+
     def make_curve(self, data):
         """
         curve = const_float                        -> ConstCurve (real)
@@ -88,6 +114,31 @@ class ParamParser(object):
         else:
             raise ValueError("{} is not a valid curve!".format(data))
 
+    def make_group(self, data):
+        """
+        group = ["grandma", trace_a, trace_b, plus_root] -> grandmas_recipe
+              | ["gasket"]                               -> apollonian_gasket
+              | ["mobius", [a, b, c, d]...]              -> make_group
+        where the Mobius coefficients are real or [real, imag]
+        """
+        group_type = data[0]
+        args = data[1:]
+        if group_type == 'grandma':
+            trace_a, trace_b, plus_root = args
+            return group_recipes.grandmas_recipe(
+                self.parse_complex(trace_a),
+                self.parse_complex(trace_b),
+                plus_root)
+        elif group_type == 'gasket':
+            return group_recipes.apollonian_gasket
+        elif group_type == 'mobius':
+            xforms = [
+                Mobius(*[self.parse_complex(x) for x in coeffs])
+                for coeffs in args]
+            return group_recipes.make_group(*xforms)
+        else:
+            raise ValueError("{} is not a valid group!".format(data))
+
     def parse_circle(self, args):
         """
         Handle the arguments for a circle
@@ -121,3 +172,7 @@ class ParamParser(object):
         pack_name = self.params['pack_name']
         anim.make_animation(pack_name, fname)
 
+        # Optionally render it natively to an animated GIF or APNG
+        if 'video' in self.params:
+            anim.make_video("output/{}".format(self.params['video']))
+
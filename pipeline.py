@@ -0,0 +1,255 @@
+"""
+Producer/consumer pipeline for overlapping computation and disk I/O
+
+Each stage runs on its own thread and the stages are connected by bounded
+queues, so a slow stage applies backpressure to the ones before it instead
+of letting work pile up in memory. The queue depths and per-stage timings
+show which stage is the bottleneck: the queue in front of the slowest
+stage stays full while the others stay near empty.
+
+pipeline = Pipeline()
+pipeline.add_source('params', animation.animate_params())
+pipeline.add_stage('recipe', make_flame)
+pipeline.add_stage('serialize', lambda flame: flame.text)
+pipeline.add_sink('write', write_texts)
+pipeline.run()
+print(pipeline.report())
+"""
+import queue
+import threading
+import time
+
+# Marks the end of a stream of items
+DONE = object()
+
+class StageStats(object):
+    """
+    Timings and counters for one stage, plus the depth of the queue that
+    feeds it. cpu is the CPU time of the stage's thread, which unlike busy
+    doesn't count time spent waiting on the GIL or the disk
+    """
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.elapsed = 0.0
+        self.waiting = 0.0
+        self.blocked = 0.0
+        self.cpu = 0.0
+        self.max_depth = 0
+        self.total_depth = 0
+        self.depth_samples = 0
+
+    @property
+    def busy(self):
+        """
+        Time spent working, i.e. not waiting on input or blocked on output
+        """
+        return self.elapsed - self.waiting - self.blocked
+
+    @property
+    def mean_depth(self):
+        if self.depth_samples == 0:
+            return 0.0
+        return self.total_depth / float(self.depth_samples)
+
+    def to_dict(self):
+        return {
+            'items': self.items,
+            'elapsed': self.elapsed,
+            'busy': self.busy,
+            'waiting': self.waiting,
+            'blocked': self.blocked,
+            'cpu': self.cpu,
+            'max_queue_depth': self.max_depth,
+            'mean_queue_depth': self.mean_depth,
+        }
+
+class MonitoredQueue(queue.Queue):
+    """
+    Bounded queue that samples its depth every time an item is added
+    """
+    def __init__(self, maxsize, stats):
+        queue.Queue.__init__(self, maxsize)
+        self.stats = stats
+
+    def put(self, item, block=True, timeout=None):
+        queue.Queue.put(self, item, block, timeout)
+        depth = self.qsize()
+        self.stats.max_depth = max(self.stats.max_depth, depth)
+        self.stats.total_depth += depth
+        self.stats.depth_samples += 1
+
+class Pipeline(object):
+    """
+    A linear pipeline: one source, any number of map stages and one sink
+    """
+    def __init__(self, max_queued=64):
+        self.max_queued = max_queued
+        self.source = None
+        self.stages = []
+        self.sink = None
+        self.stats = []
+        self.queues = []
+        self.errors = []
+
+    def add_source(self, name, iterable):
+        """
+        The first stage produces items by iterating over iterable
+        """
+        self.source = (name, iterable)
+
+    def add_stage(self, name, func):
+        """
+        A map stage calls func(item) for every item. If func returns None
+        the item is dropped
+        """
+        self.stages.append((name, func))
+
+    def add_sink(self, name, consume):
+        """
+        The last stage calls consume(items) once with an iterator over
+        every item that reaches the end of the pipeline
+        """
+        self.sink = (name, consume)
+
+    def queue_depths(self):
+        """
+        Snapshot of the number of items waiting in front of each stage
+        """
+        return dict((s.name, q.qsize()) for s, q in zip(self.stats[1:], self.queues))
+
+    def report(self):
+        """
+        Human-readable summary of the stage timings and queue depths
+        """
+        lines = ['{:<12} {:>8} {:>9} {:>9} {:>9} {:>9} {:>11}'.format(
+            'stage', 'items', 'busy(s)', 'cpu(s)', 'wait(s)', 'block(s)',
+            'queue max/avg')]
+        for s in self.stats:
+            lines.append('{:<12} {:>8} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f} {:>7}/{:.1f}'.format(
+                s.name, s.items, s.busy, s.cpu, s.waiting, s.blocked,
+                s.max_depth, s.mean_depth))
+        return "\n".join(lines)
+
+    def run(self):
+        """
+        Run every stage to completion. If any stage raises, the rest of the
+        pipeline is drained and the first exception is re-raised here
+        """
+        if self.source is None or self.sink is None:
+            raise ValueError("A pipeline needs a source and a sink")
+
+        names = [self.source[0]] + [name for name, _ in self.stages] + [
+            self.sink[0]]
+        self.stats = [StageStats(name) for name in names]
+        self.queues = [
+            MonitoredQueue(self.max_queued, stats) for stats in self.stats[1:]]
+        self.errors = []
+
+        threads = [threading.Thread(
+            target=self.run_source,
+            args=(self.source[1], self.queues[0], self.stats[0]))]
+        for i, (name, func) in enumerate(self.stages):
+            threads.append(threading.Thread(
+                target=self.run_stage,
+                args=(func, self.queues[i], self.queues[i + 1],
+                    self.stats[i + 1])))
+        threads.append(threading.Thread(
+            target=self.run_sink,
+            args=(self.sink[1], self.queues[-1], self.stats[-1])))
+
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self.errors:
+            raise self.errors[0]
+
+    def put(self, output, item, stats):
+        start = time.perf_counter()
+        output.put(item)
+        stats.blocked += time.perf_counter() - start
+
+    def get(self, input_queue, stats):
+        start = time.perf_counter()
+        item = input_queue.get()
+        stats.waiting += time.perf_counter() - start
+        return item
+
+    def drain(self, input_queue):
+        """
+        After an error, keep consuming input so upstream stages never block
+        """
+        while input_queue.get() is not DONE:
+            pass
+
+    def run_source(self, iterable, output, stats):
+        start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            iterator = iter(iterable)
+            while True:
+                # Time spent in the iterator counts as busy time
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                self.put(output, item, stats)
+                stats.items += 1
+        except Exception as e:
+            self.errors.append(e)
+        finally:
+            output.put(DONE)
+            stats.elapsed = time.perf_counter() - start
+            stats.cpu = time.thread_time() - cpu_start
+
+    def run_stage(self, func, input_queue, output, stats):
+        start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            while True:
+                item = self.get(input_queue, stats)
+                if item is DONE:
+                    break
+                result = func(item)
+                stats.items += 1
+                if result is not None:
+                    self.put(output, result, stats)
+        except Exception as e:
+            self.errors.append(e)
+            self.drain(input_queue)
+        finally:
+            output.put(DONE)
+            stats.elapsed = time.perf_counter() - start
+            stats.cpu = time.thread_time() - cpu_start
+
+    def run_sink(self, consume, input_queue, stats):
+        start = time.perf_counter()
+        cpu_start = time.thread_time()
+        finished = []
+
+        def items():
+            while True:
+                item = self.get(input_queue, stats)
+                if item is DONE:
+                    finished.append(True)
+                    return
+                stats.items += 1
+                yield item
+
+        iterator = items()
+        try:
+            consume(iterator)
+            # Make sure the upstream stages can finish even if consume()
+            # stopped early
+            for _ in iterator:
+                pass
+        except Exception as e:
+            self.errors.append(e)
+            if not finished:
+                self.drain(input_queue)
+        finally:
+            stats.elapsed = time.perf_counter() - start
+            stats.cpu = time.thread_time() - cpu_start
@@ -0,0 +1,84 @@
+"""
+Minimal PNG writer for 8-bit RGB images, using only zlib.
+
+Rows can be written in batches as they are produced, so an image never has
+to be held in memory all at once.
+"""
+import struct
+import zlib
+
+import numpy as np
+
+SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# Bit depth 8, color type 2 (RGB), then compression, filter and
+# interlace methods 0
+BIT_DEPTH = 8
+COLOR_TYPE_RGB = 2
+
+def write_chunk(f, chunk_type, data):
+    """
+    Write a length-prefixed PNG chunk with its CRC
+    """
+    f.write(struct.pack('>I', len(data)))
+    f.write(chunk_type)
+    f.write(data)
+    f.write(struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff))
+
+class PNGWriter(object):
+    """
+    Stream an RGB image to a binary file object row by row
+
+    with PNGWriter(f, width, height) as png:
+        png.write_rows(rows)
+        ...
+    """
+    def __init__(self, f, width, height, level=6):
+        self.f = f
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+        self.compressor = zlib.compressobj(level)
+        f.write(SIGNATURE)
+        write_chunk(f, b'IHDR', struct.pack(
+            '>IIBBBBB', width, height, BIT_DEPTH, COLOR_TYPE_RGB, 0, 0, 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+    def write_rows(self, rows):
+        """
+        Append a uint8 array of shape (rows, width, 3) to the image
+        """
+        rows = np.asarray(rows, dtype=np.uint8)
+        if rows.shape[1:] != (self.width, 3):
+            raise ValueError("Rows must have shape (n, {}, 3)".format(
+                self.width))
+
+        # Every row starts with its filter type, 0 means unfiltered
+        filtered = np.zeros((len(rows), 3 * self.width + 1), dtype=np.uint8)
+        filtered[:, 1:] = rows.reshape((len(rows), -1))
+        data = self.compressor.compress(filtered.tobytes())
+        if data:
+            write_chunk(self.f, b'IDAT', data)
+        self.rows_written += len(rows)
+
+    def close(self):
+        if self.rows_written != self.height:
+            raise ValueError("Expected {} rows, {} were written".format(
+                self.height, self.rows_written))
+        write_chunk(self.f, b'IDAT', self.compressor.flush())
+        write_chunk(self.f, b'IEND', b'')
+
+def save_png(fname, image):
+    """
+    Save a uint8 RGB image of shape (height, width, 3)
+    """
+    height, width = image.shape[:2]
+    with open(fname, 'wb') as f:
+        with PNGWriter(f, width, height) as png:
+            png.write_rows(image)
@@ -0,0 +1,271 @@
+"""
+Numeric precision of the batch engines
+
+MobiusArray, ClineArray, ProjectivePoints, the chaos game and
+group_recipes.grandmas_recipe_array all take a complex dtype:
+
+- complex64 halves memory and bandwidth, good enough for previews
+- complex128 is the default, the same precision as Python's complex
+- np.clongdouble is extended precision (80-bit on x86) where the platform
+  has it. EXTENDED is None where it is no better than complex128
+
+Where even that isn't enough (near cusps, deep in word trees) there is an
+optional arbitrary precision path through mpmath, used as a reference
+here. mpmath is not required for anything else.
+
+Products of normalized matrices drift away from determinant 1 through
+rounding, which is why long products get renormalized now and then (see
+Mobius.normalize). compose() reports how far they drifted between
+renormalizations, and precision_report() compares every dtype against a
+high precision reference:
+
+xforms = group_recipes.grandmas_recipe_array(1.91 + 0.05j, 2.1 - 0.02j)
+words = random_words(4, 1000, 24)
+print(precision_report(xforms, words))
+
+The entries of products grow exponentially with the word length while
+the determinant stays 1, so a * d - b * c cancels. In complex64 it is
+lost to rounding after a couple of dozen letters of the example above,
+and dividing by its square root would give garbage or NaN. renormalize()
+scales those products by their size instead; the map they stand for is
+still accurate, which is what the errors measure.
+"""
+import numpy as np
+
+from mobius_array import MobiusArray, complex_dtype
+
+try:
+    import mpmath
+except ImportError:
+    mpmath = None
+
+# Extended precision complex dtype, or None if long double is just double
+EXTENDED = (
+    np.dtype(np.clongdouble)
+    if np.finfo(np.longdouble).eps < np.finfo(np.float64).eps else None)
+
+# dtypes by name, for command lines and reports
+DTYPES = {
+    'complex64': np.dtype(np.complex64),
+    'complex128': np.dtype(np.complex128),
+}
+if EXTENDED is not None:
+    DTYPES['longdouble'] = EXTENDED
+
+# Decimal digits of the mpmath reference
+MP_DIGITS = 50
+
+# A determinant is trusted if it is this many times larger than the
+# rounding error of a * d - b * c
+DET_NOISE = 64
+
+def resolve_dtype(dtype):
+    """
+    Accept a name from DTYPES or anything NumPy understands as a dtype
+    """
+    if dtype in DTYPES:
+        return DTYPES[dtype]
+    return complex_dtype(None, dtype)
+
+def as_mobius_array(xforms):
+    """
+    Accept a list of Mobius maps or a MobiusArray
+    """
+    if isinstance(xforms, MobiusArray):
+        return xforms
+    return MobiusArray.from_mobius(xforms)
+
+def random_words(num_letters, num_words, length, seed=None):
+    """
+    Random words of the given length as an int array of shape
+    (num_words, length) of indices into a list of generators
+    """
+    rng = np.random.default_rng(seed)
+    return rng.integers(num_letters, size=(num_words, length))
+
+def trusted_det(products):
+    """
+    Where the determinant of a MobiusArray is well above the rounding error
+    of a * d - b * c
+    """
+    size = (
+        np.abs(products.a * products.d) + np.abs(products.b * products.c))
+    noise = DET_NOISE * np.finfo(products.dtype).eps * size
+    return np.abs(products.det) > noise
+
+def renormalize(products):
+    """
+    Normalize a MobiusArray to determinant 1 where the determinant can be
+    trusted. Products whose determinant has cancelled to rounding noise are
+    scaled so their entries are of order 1 instead, which keeps the map
+    without relying on det
+    """
+    trusted = trusted_det(products)
+    size = np.abs(products.matrices).max(axis=(-1, -2))
+    scale = np.where(
+        trusted,
+        np.sqrt(np.where(trusted, products.det, 1)),
+        np.where(size > 0, size, 1))
+    return MobiusArray(products.matrices / scale[..., np.newaxis, np.newaxis])
+
+def compose(xforms, words, dtype=complex, renormalize_every=8):
+    """
+    Multiply out words in the given dtype, one letter at a time for all
+    words at once, renormalizing the products every renormalize_every
+    letters (None never renormalizes).
+
+    Returns (products, drift, excluded) where products is a MobiusArray of
+    shape (num_words,), normalized where its determinant can be trusted
+    (see renormalize), and drift is the largest |det - 1| found at each
+    renormalization (see MobiusArray.drift). Drift is only measured on
+    products that had determinant 1 and whose determinant can still be
+    trusted; excluded is the number of words left out of it at some step
+    """
+    xforms = as_mobius_array(xforms).astype(resolve_dtype(dtype))
+    generators = xforms.normalize.matrices
+    words = np.asarray(words)
+    products = MobiusArray.identity(len(words), xforms.dtype)
+    normalized = np.ones(len(words), dtype=bool)
+    excluded = np.zeros(len(words), dtype=bool)
+    drift = []
+
+    def measure_drift():
+        trusted = trusted_det(products)
+        measured = normalized & trusted
+        excluded[~measured] = True
+        drift.append(float(np.max(products.drift[measured], initial=0.0)))
+        return trusted
+
+    for i in range(words.shape[1]):
+        products = MobiusArray(np.matmul(
+            products.matrices, generators[words[:, i]]))
+        if renormalize_every and (i + 1) % renormalize_every == 0:
+            normalized = measure_drift()
+            products = renormalize(products)
+    measure_drift()
+    return (
+        renormalize(products), np.array(drift), int(excluded.sum()))
+
+def compose_mp(xforms, words, digits=MP_DIGITS):
+    """
+    Reference products of words computed with mpmath at the given number
+    of decimal digits. Returns a list of 2x2 nested lists of mpmath.mpc
+    """
+    if mpmath is None:
+        raise ImportError("compose_mp() needs mpmath")
+    matrices = as_mobius_array(xforms).matrices
+    with mpmath.workdps(digits):
+        generators = []
+        for matrix in matrices:
+            # Exact conversion, then normalized in high precision
+            m = [[to_mpc(x) for x in row] for row in matrix]
+            sdet = mpmath.sqrt(m[0][0] * m[1][1] - m[0][1] * m[1][0])
+            generators.append([[x / sdet for x in row] for row in m])
+
+        products = []
+        for word in np.asarray(words):
+            one = mpmath.mpc(1)
+            zero = mpmath.mpc(0)
+            p = [[one, zero], [zero, one]]
+            for letter in word:
+                g = generators[letter]
+                p = [
+                    [p[0][0] * g[0][0] + p[0][1] * g[1][0],
+                        p[0][0] * g[0][1] + p[0][1] * g[1][1]],
+                    [p[1][0] * g[0][0] + p[1][1] * g[1][0],
+                        p[1][0] * g[0][1] + p[1][1] * g[1][1]]]
+            products.append(p)
+    return products
+
+def to_mpc(x):
+    """
+    Convert a NumPy complex scalar of any precision to mpmath.mpc without
+    losing digits
+    """
+    x = np.clongdouble(x)
+    return mpmath.mpc(
+        mpmath.mpf(np.format_float_scientific(x.real, unique=True)),
+        mpmath.mpf(np.format_float_scientific(x.imag, unique=True)))
+
+def to_array(products, dtype=EXTENDED):
+    """
+    Round mpmath products from compose_mp() to a complex array of shape
+    (N, 2, 2) in the given dtype, correctly rounded for long double too
+    """
+    dtype = resolve_dtype(np.complex128 if dtype is None else dtype)
+    real_dtype = np.finfo(dtype).dtype
+    matrices = np.empty((len(products), 2, 2), dtype=dtype)
+    for i, product in enumerate(products):
+        for j in range(2):
+            for k in range(2):
+                x = product[j][k]
+                matrices[i, j, k] = (
+                    real_dtype.type(mpmath.nstr(x.real, 30)) +
+                    1j * real_dtype.type(mpmath.nstr(x.imag, 30)))
+    return matrices
+
+def relative_error(matrices, reference):
+    """
+    Distance between the maps of each matrix and the reference, ignoring
+    scale and sign since cM is the same map as M for any c != 0. Both are
+    scaled to unit Frobenius norm and the best phase is taken, which for
+    small errors is the relative Frobenius distance
+    """
+    reference = np.asarray(reference, dtype=np.clongdouble)
+    matrices = np.asarray(matrices, dtype=np.clongdouble)
+    reference = reference / np.sqrt(
+        (np.abs(reference) ** 2).sum(axis=(-1, -2), keepdims=True))
+    matrices = matrices / np.sqrt(
+        (np.abs(matrices) ** 2).sum(axis=(-1, -2), keepdims=True))
+    overlap = np.abs((matrices * np.conjugate(reference)).sum(axis=(-1, -2)))
+    return np.sqrt(np.maximum(2 - 2 * overlap, 0)).astype(float)
+
+def precision_report(
+        xforms, words, dtypes=None, renormalize_every=8, digits=MP_DIGITS):
+    """
+    Compare compose() in every dtype (all of DTYPES by default) against a
+    reference: mpmath if installed, otherwise EXTENDED. Without either
+    there is no reference and only the drift is reported.
+
+    Returns a dict by dtype name of
+    {'max_error', 'mean_error', 'max_drift', 'drift_excluded',
+     'bytes_per_map'}
+    and the name of the reference under 'reference'. The errors of the
+    dtype that is the reference are None, as there is nothing to compare
+    it with. drift_excluded counts the words whose determinant was lost to
+    cancellation at some point, so they are not in max_drift (see
+    compose). Without renormalization the entries of long products
+    overflow, complex64 first, and show up as NaN
+    """
+    dtypes = dtypes or list(DTYPES)
+    words = np.asarray(words)
+    if mpmath is not None:
+        reference = to_array(compose_mp(xforms, words, digits))
+        reference_name = 'mpmath ({} digits)'.format(digits)
+    elif EXTENDED is not None:
+        reference = compose(xforms, words, EXTENDED, renormalize_every)[0]
+        reference = reference.matrices
+        reference_name = 'longdouble'
+    else:
+        reference = None
+        reference_name = None
+    reference_dtype = EXTENDED if reference_name == 'longdouble' else None
+
+    report = {'reference': reference_name}
+    for name in dtypes:
+        dtype = resolve_dtype(name)
+        products, drift, excluded = compose(
+            xforms, words, dtype, renormalize_every)
+        result = {
+            'max_drift': float(drift.max()),
+            'drift_excluded': excluded,
+            'bytes_per_map': products.matrices[0].nbytes,
+            'max_error': None,
+            'mean_error': None,
+        }
+        if reference is not None and dtype != reference_dtype:
+            error = relative_error(products.matrices, reference)
+            result['max_error'] = float(error.max())
+            result['mean_error'] = float(error.mean())
+        report[str(name)] = result
+    return report
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+"""
+Quick, progressive previews of a whole animation
+
+Every frame of a param file is rendered natively at thumbnail size with
+very few samples, in parallel over all CPU cores. After the first pass
+(usually a few seconds) a contact sheet and a low-res GIF are written.
+Each further pass adds more samples to every frame and rewrites both
+files, so the preview keeps sharpening until the last pass or until it
+is interrupted with Ctrl-C. The files are replaced atomically, so they
+can be kept open in a viewer the whole time.
+
+python preview.py params/gears.json
+"""
+import math
+import multiprocessing
+import os
+import signal
+import sys
+import time
+
+import numpy as np
+
+import encoder
+from flame import Flame
+from histogram import Histogram
+import param_parser
+import render
+import tonemap
+from png import save_png
+
+# Samples per pixel added by each pass, so the total quality after each
+# pass is 1, 4, 16, 64
+PASSES = (1, 3, 12, 48)
+
+# Thumbnails are few pixels, so fewer points in parallel are enough
+NUM_POINTS = 4096
+
+# Thumbnails don't need double precision, and single precision halves
+# the memory traffic of the chaos game
+DTYPE = np.complex64
+
+# Consecutive frames rendered by one worker, warm-starting each frame
+# from the previous one
+CHUNK_SIZE = 8
+
+# Pixels between thumbnails on the contact sheet
+GAP = 2
+
+def thumbnail_flame(flame, width):
+    """
+    Copy of the flame scaled down to the given width, showing the same
+    region of the plane
+    """
+    flame_width, flame_height = flame.dimensions
+    scale = width / float(flame_width)
+    height = max(int(round(flame_height * scale)), 1)
+    return Flame(
+        flame.name,
+        flame.xforms,
+        palette=flame.palette,
+        zoom=flame.zoom * scale,
+        size="{} {}".format(width, height),
+        weights=flame.weights)
+
+def render_chunk(args):
+    """
+    Worker: render a run of consecutive thumbnails, returning the
+    histogram buffers and sample counts
+    """
+    flames, quality, seed = args
+    warm_start = render.WarmStart()
+    results = []
+    for i, flame in enumerate(flames):
+        histogram = render.render_histogram(
+            flame,
+            quality=quality,
+            num_points=NUM_POINTS,
+            seed=seed + (i,),
+            warm_start=warm_start,
+            dtype=DTYPE)
+        results.append((histogram.buffer, histogram.total_samples))
+    return results
+
+def ignore_interrupts():
+    """
+    Leave Ctrl-C to the main process, which stops the workers
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def contact_sheet(images, columns=None):
+    """
+    Tile equally sized images in a grid
+    """
+    columns = columns or int(math.ceil(math.sqrt(len(images))))
+    rows = int(math.ceil(len(images) / float(columns)))
+    height, width = images[0].shape[:2]
+    sheet = np.zeros(
+        (rows * (height + GAP) - GAP, columns * (width + GAP) - GAP, 3),
+        dtype=np.uint8)
+    for i, image in enumerate(images):
+        y = (i // columns) * (height + GAP)
+        x = (i % columns) * (width + GAP)
+        sheet[y:y + height, x:x + width] = image
+    return sheet
+
+def replace_file(fname, write):
+    """
+    Write a file through write(temp_fname) and move it into place, so
+    viewers never see a half written file
+    """
+    base, ext = os.path.splitext(fname)
+    temp_fname = base + '.partial' + ext
+    write(temp_fname)
+    os.replace(temp_fname, fname)
+
+class Preview(object):
+    """
+    Progressive preview of a list of flames
+    """
+    def __init__(self, flames, width=96, delay=10):
+        self.thumbnails = [thumbnail_flame(flame, width) for flame in flames]
+        self.delay = delay
+
+        # Shrink the density estimation kernel along with the image
+        self.estimator_radii = [
+            Flame.ESTIMATOR_RADIUS * width / float(flame.dimensions[0])
+            for flame in flames]
+        self.histograms = []
+        for flame in self.thumbnails:
+            width, height = flame.dimensions
+            self.histograms.append(Histogram(width, height, flame.viewport))
+        self.quality = 0
+
+    def render_pass(self, quality, pool, seed):
+        """
+        Add quality samples per pixel to every frame. seed is a tuple of
+        integers
+        """
+        chunks = [
+            (self.thumbnails[i:i + CHUNK_SIZE], quality, seed + (i,))
+            for i in range(0, len(self.thumbnails), CHUNK_SIZE)]
+        for i, results in enumerate(pool.imap(render_chunk, chunks)):
+            start = i * CHUNK_SIZE
+            for histogram, (buffer, samples) in zip(
+                    self.histograms[start:], results):
+                histogram.buffer += buffer
+                histogram.total_samples += samples
+        self.quality += quality
+
+    def images(self):
+        return [
+            tonemap.finish(histogram, estimator_radius=radius)
+            for histogram, radius in zip(
+                self.histograms, self.estimator_radii)]
+
+    def save(self, sheet_fname, gif_fname):
+        """
+        Write the contact sheet and the animation at the current quality
+        """
+        images = self.images()
+        replace_file(
+            sheet_fname, lambda fname: save_png(fname, contact_sheet(images)))
+        height, width = images[0].shape[:2]
+        frames = [
+            (image, flame.palette)
+            for image, flame in zip(images, self.thumbnails)]
+        replace_file(
+            gif_fname,
+            lambda fname: encoder.save_animation(
+                fname, frames, width, height, self.delay))
+
+def preview(
+        param_fname,
+        dirname='output/preview',
+        width=96,
+        passes=PASSES,
+        processes=None,
+        seed=None):
+    """
+    Preview every frame of a param file, see the module docstring. The
+    contact sheet and GIF are named after the param file
+    """
+    parser = param_parser.ParamParser(param_fname)
+    anim = parser.animator_type(**parser.animator_params)
+    flames = list(anim.make_flames())
+    if anim.weighted:
+        flames = [anim.weight_flame(flame) for flame in flames]
+    if not flames:
+        raise ValueError("{} has no valid frames".format(param_fname))
+
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    name = os.path.splitext(os.path.basename(param_fname))[0]
+    sheet_fname = os.path.join(dirname, name + '_sheet.png')
+    gif_fname = os.path.join(dirname, name + '.gif')
+
+    seed = np.random.SeedSequence(seed).entropy
+    preview = Preview(flames, width)
+    start = time.perf_counter()
+    pool = multiprocessing.Pool(processes, ignore_interrupts)
+    try:
+        for i, quality in enumerate(passes):
+            preview.render_pass(quality, pool, (seed, i))
+            preview.save(sheet_fname, gif_fname)
+            print("Pass {}: {} samples per pixel, {:.1f}s, {}".format(
+                i + 1, preview.quality, time.perf_counter() - start,
+                sheet_fname))
+    except KeyboardInterrupt:
+        print("Stopped at {} samples per pixel".format(preview.quality))
+    finally:
+        pool.terminate()
+        pool.join()
+    return preview
+
+if __name__ == '__main__':
+    preview(sys.argv[1])
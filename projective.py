@@ -0,0 +1,212 @@
+"""
+Points on the Riemann sphere in homogeneous coordinates
+
+A point z is stored as a pair (u, v) with z = u / v. Infinity is simply
+(1, 0), so applying a Mobius map is a plain 2x2 matrix multiplication
+
+[a b] [u]   [a * u + b * v]
+[c d] [v] = [c * u + d * v]
+
+with no division, no branches and no exceptions at the poles. Conversion
+to the plane or to the sphere only happens on demand.
+"""
+import cmath
+
+import numpy as np
+
+from mobius_array import MobiusArray, complex_dtype
+
+class ProjectivePoint(object):
+    """
+    A single point on the Riemann sphere, z = u / v
+    """
+    def __init__(self, u, v=1.0):
+        self.u = complex(u)
+        self.v = complex(v)
+
+    def __repr__(self):
+        return "[{} : {}]".format(self.u, self.v)
+
+    @classmethod
+    def from_complex(cls, z):
+        """
+        Convert a complex number to homogeneous coordinates. Complex infinity
+        becomes [1 : 0]
+        """
+        z = complex(z)
+        if cmath.isinf(z):
+            return cls(1.0, 0.0)
+        return cls(z, 1.0)
+
+    @classmethod
+    def from_sphere(cls, x, y, z):
+        """
+        Inverse of to_sphere. Pick the better conditioned of the two
+        equivalent representations so the north pole maps to [1 : 0]
+        """
+        if z >= 0:
+            return cls(1.0 + z, complex(x, -y))
+        return cls(complex(x, y), 1.0 - z)
+
+    def transform(self, mobius):
+        """
+        Apply a Mobius map with a 2x2 matrix multiplication
+        """
+        return ProjectivePoint(
+            mobius.a * self.u + mobius.b * self.v,
+            mobius.c * self.u + mobius.d * self.v)
+
+    @property
+    def is_infinity(self):
+        return self.v == 0
+
+    @property
+    def normalize(self):
+        """
+        Rescale (u, v) so the larger coordinate has magnitude 1. This
+        keeps long orbits from overflowing and does not change the point
+        """
+        scale = max(abs(self.u), abs(self.v))
+        return ProjectivePoint(self.u / scale, self.v / scale)
+
+    @property
+    def to_complex(self):
+        """
+        Convert to a point in the plane, returning complex infinity for
+        [u : 0]
+        """
+        if self.v == 0:
+            return complex('inf')
+        return self.u / self.v
+
+    @property
+    def to_sphere(self):
+        """
+        Inverse stereographic projection to the unit sphere, with infinity
+        at the north pole (0, 0, 1):
+
+        X + iY = 2 * u * v.conj / (|u|^2 + |v|^2)
+        Z = (|u|^2 - |v|^2) / (|u|^2 + |v|^2)
+        """
+        uu = abs(self.u) ** 2
+        vv = abs(self.v) ** 2
+        norm = uu + vv
+        xy = 2.0 * self.u * self.v.conjugate() / norm
+        return (xy.real, xy.imag, (uu - vv) / norm)
+
+class ProjectivePoints(object):
+    """
+    A batch of points in homogeneous coordinates, stored as a complex array
+    of shape (..., 2) holding (u, v) pairs. Like MobiusArray, any complex
+    dtype can be used
+    """
+    def __init__(self, coords, dtype=None):
+        coords = np.asarray(coords)
+        coords = coords.astype(complex_dtype(coords, dtype), copy=False)
+        if coords.shape[-1:] != (2,):
+            raise ValueError(
+                'Expected an array of shape (..., 2), got {}'.format(
+                    coords.shape))
+        self.coords = coords
+
+    def __repr__(self):
+        return 'ProjectivePoints(shape={})'.format(self.shape)
+
+    @classmethod
+    def from_complex(cls, z, dtype=None):
+        """
+        Convert an array of complex numbers. Infinite entries become [1 : 0]
+        """
+        z = np.asarray(z)
+        z = z.astype(complex_dtype(z, dtype), copy=False)
+        at_inf = np.isinf(z)
+        coords = np.empty(z.shape + (2,), dtype=z.dtype)
+        coords[..., 0] = np.where(at_inf, 1.0, z)
+        coords[..., 1] = np.where(at_inf, 0.0, 1.0)
+        return cls(coords)
+
+    @classmethod
+    def from_sphere(cls, xyz, dtype=complex):
+        """
+        Inverse of to_sphere for an array of shape (..., 3)
+        """
+        xyz = np.asarray(xyz, dtype=float)
+        x, y, z = xyz[..., 0], xyz[..., 1], xyz[..., 2]
+        north = z >= 0
+        coords = np.empty(z.shape + (2,), dtype=complex_dtype(None, dtype))
+        coords[..., 0] = np.where(north, 1.0 + z, x + 1j * y)
+        coords[..., 1] = np.where(north, x - 1j * y, 1.0 - z)
+        return cls(coords)
+
+    @property
+    def shape(self):
+        return self.coords.shape[:-1]
+
+    @property
+    def dtype(self):
+        return self.coords.dtype
+
+    def astype(self, dtype):
+        return ProjectivePoints(self.coords, dtype)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, index):
+        result = self.coords[index]
+        if result.ndim == 1:
+            return ProjectivePoint(result[0], result[1])
+        return ProjectivePoints(result)
+
+    @property
+    def u(self):
+        return self.coords[..., 0]
+
+    @property
+    def v(self):
+        return self.coords[..., 1]
+
+    def transform(self, mobius):
+        """
+        Apply a Mobius or MobiusArray. The batch shapes broadcast the same
+        way they do for MobiusArray products
+        """
+        matrices = MobiusArray.coerce(mobius, self.dtype).matrices
+        result = np.matmul(matrices, self.coords[..., np.newaxis])
+        return ProjectivePoints(result[..., 0])
+
+    @property
+    def is_infinity(self):
+        return self.v == 0
+
+    @property
+    def normalize(self):
+        """
+        Rescale each (u, v) so the larger coordinate has magnitude 1
+        """
+        scale = np.maximum(np.abs(self.u), np.abs(self.v))
+        scale = np.where(scale == 0, 1.0, scale)
+        return ProjectivePoints(self.coords / scale[..., np.newaxis])
+
+    @property
+    def to_complex(self):
+        """
+        Convert to points in the plane. Points at infinity become
+        complex infinity
+        """
+        v = self.v
+        at_inf = v == 0
+        safe_v = np.where(at_inf, 1.0, v)
+        return np.where(at_inf, complex('inf'), self.u / safe_v)
+
+    @property
+    def to_sphere(self):
+        """
+        Inverse stereographic projection, returning an array of shape
+        (..., 3). See ProjectivePoint.to_sphere
+        """
+        uu = np.abs(self.u) ** 2
+        vv = np.abs(self.v) ** 2
+        norm = uu + vv
+        xy = 2.0 * self.u * np.conjugate(self.v) / norm
+        return np.stack([xy.real, xy.imag, (uu - vv) / norm], axis=-1)
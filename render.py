@@ -0,0 +1,309 @@
+"""
+Native renderer for Flame objects, so frames can be previewed and
+animations made without an external flame renderer.
+
+The chaos game (chaos_game.py) is accumulated into a supersampled
+histogram (histogram.py), which is then finished into an image with the
+renderer settings of the <flame> tag (tonemap.py) and saved as a PNG.
+
+image = render_flame(flame)
+render_flame(flame, 'output/frame.png')
+render_poster(poster_flame, 'output/poster.png', oversample=3)
+"""
+import math
+import os
+
+import numpy as np
+
+import chaos_game
+import tonemap
+from flame import Flame
+from histogram import Histogram, TiledHistogram
+from png import PNGWriter, save_png
+from projective import ProjectivePoints
+
+# Points iterated in parallel
+NUM_POINTS = 1 << 16
+
+# Iterations before points are considered close enough to the attractor
+# to be plotted
+BURN_IN = 20
+
+# Average number of samples per output pixel
+QUALITY = 10
+
+def cold_start(num_points, rng, dtype=complex):
+    """
+    Random starting points and color coordinates
+    """
+    return (chaos_game.random_points(num_points, seed=rng, dtype=dtype),
+        rng.random(num_points))
+
+def run_chaos_game(flame, points, colors, iterations, rng, dtype=complex):
+    """
+    Iterate the flame's xforms, yielding (points, colors) after every
+    iteration. Like in flam3, every point carries a color coordinate that
+    moves halfway towards the color of each xform it applies
+    """
+    xform_colors = np.array(flame.xform_colors)
+    iterator = chaos_game.iterate(
+        flame.xforms, points, iterations, flame.weights, rng, dtype)
+    for points, choices in iterator:
+        colors = 0.5 * (colors + xform_colors[choices])
+        yield (points, colors)
+
+class WarmStart(object):
+    """
+    Carry attractor points over from one frame of an animation to the
+    next.
+
+    Consecutive frames are small perturbations of the same group, so
+    points on the attractor of one frame are already close to the
+    attractor of the next and only need a few iterations of burn-in
+    instead of the full BURN_IN.
+
+    When the group changes abruptly (e.g. near singular traces) the old
+    points are a bad start. This is detected by comparing the coarse
+    distribution of the points over the viewport before and after the
+    warm burn-in: for small perturbations it barely changes. If the total
+    variation distance is above THRESHOLD, the frame falls back to a cold
+    start. See compare_warm_start() for checking the results against cold
+    starts.
+
+    warm_start = WarmStart()
+    for flame in flames:
+        render_flame(flame, warm_start=warm_start)
+    """
+    BURN_IN = 8
+
+    # Distributions are compared on a GRID x GRID grid over the viewport
+    # plus one cell for everything outside it
+    GRID = 16
+    THRESHOLD = 0.2
+
+    def __init__(self, burn_in=BURN_IN, threshold=THRESHOLD):
+        self.burn_in = burn_in
+        self.threshold = threshold
+        self.points = None
+        self.colors = None
+        self.distance = None
+        self.warm_frames = 0
+        self.cold_frames = 0
+
+    def occupancy(self, z, viewport):
+        """
+        Fraction of the points in each cell of the grid
+        """
+        x_min, y_min, x_max, y_max = viewport
+        with np.errstate(invalid='ignore'):
+            cols = np.floor((z.real - x_min) * (self.GRID / (x_max - x_min)))
+            rows = np.floor((z.imag - y_min) * (self.GRID / (y_max - y_min)))
+            inside = (
+                (cols >= 0) & (cols < self.GRID) &
+                (rows >= 0) & (rows < self.GRID))
+        cells = np.where(inside, rows * self.GRID + cols, self.GRID ** 2)
+        counts = np.bincount(cells.astype(int), minlength=self.GRID ** 2 + 1)
+        return counts / float(len(z))
+
+    def seed(self, flame, num_points, burn_in, rng, dtype=complex):
+        """
+        Starting (points, colors, burn_in) for the next frame. Warm points
+        have already had their few iterations of burn-in, so the
+        remaining burn-in is 0
+        """
+        if self.points is None:
+            return self.fall_back(num_points, burn_in, rng, dtype)
+
+        # The number of points may change between frames
+        chosen = rng.choice(len(self.colors), num_points)
+        start = ProjectivePoints(self.points[chosen], dtype)
+        colors = self.colors[chosen]
+        # With burn_in=0 the stored points are used as they are
+        points = start
+        for points, colors in run_chaos_game(
+                flame, start, colors, self.burn_in, rng, dtype):
+            pass
+
+        self.distance = 0.5 * np.abs(
+            self.occupancy(start.to_complex, flame.viewport) -
+            self.occupancy(points.to_complex, flame.viewport)).sum()
+        if self.distance > self.threshold:
+            return self.fall_back(num_points, burn_in, rng, dtype)
+
+        self.warm_frames += 1
+        return (points, colors, 0)
+
+    def fall_back(self, num_points, burn_in, rng, dtype=complex):
+        self.cold_frames += 1
+        points, colors = cold_start(num_points, rng, dtype)
+        return (points, colors, burn_in)
+
+    def store(self, points, colors):
+        """
+        Remember the final points of a frame
+        """
+        self.points = points.coords
+        self.colors = colors
+
+def render_histogram(
+        flame,
+        quality=QUALITY,
+        num_points=NUM_POINTS,
+        burn_in=BURN_IN,
+        oversample=Flame.OVERSAMPLE,
+        seed=None,
+        histogram=None,
+        warm_start=None,
+        dtype=complex):
+    """
+    Run the chaos game for a flame and accumulate it in a Histogram at
+    oversample times the flame size. Pass histogram to accumulate into an
+    existing buffer instead, such as a TiledHistogram.
+
+    Points are plotted with the palette color at their color coordinate.
+    warm_start is an optional WarmStart to start from the points of the
+    previous frame. dtype is the complex dtype the chaos game runs in,
+    complex64 is enough for previews
+    """
+    width, height = flame.dimensions
+    if histogram is None:
+        histogram = Histogram(
+            width * oversample, height * oversample, flame.viewport)
+
+    rng = chaos_game.make_rng(seed)
+    if warm_start is None:
+        points, colors = cold_start(num_points, rng, dtype)
+    else:
+        points, colors, burn_in = warm_start.seed(
+            flame, num_points, burn_in, rng, dtype)
+
+    samples = quality * width * height
+    iterations = burn_in + int(math.ceil(samples / float(num_points)))
+    palette = flame.palette.array.astype(float)
+    iterator = run_chaos_game(flame, points, colors, iterations, rng, dtype)
+    for i, (points, colors) in enumerate(iterator):
+        if i < burn_in:
+            continue
+        indices = np.minimum(
+            (colors * len(palette)).astype(int), len(palette) - 1)
+        histogram.accumulate(points.to_complex, palette[indices])
+
+    if warm_start is not None:
+        warm_start.store(points, colors)
+    return histogram
+
+def render_flame(
+        flame,
+        fname=None,
+        quality=QUALITY,
+        oversample=Flame.OVERSAMPLE,
+        density_estimation=True,
+        seed=None,
+        warm_start=None,
+        **kwargs):
+    """
+    Render a flame to a uint8 RGB image of shape (height, width, 3), and
+    save it as a PNG if fname is given. See WarmStart for warm_start.
+
+    Extra keyword arguments override the other renderer settings, see
+    tonemap.finish()
+    """
+    histogram = render_histogram(
+        flame,
+        quality=quality,
+        oversample=oversample,
+        seed=seed,
+        warm_start=warm_start)
+    image = tonemap.finish(
+        histogram,
+        oversample=oversample,
+        density_estimation=density_estimation,
+        **kwargs)
+    if fname is not None:
+        save_png(fname, image)
+    return image
+
+def render_poster(
+        flame,
+        fname,
+        quality=QUALITY,
+        oversample=Flame.OVERSAMPLE,
+        band_height=256,
+        tile_size=256,
+        dirname=None,
+        seed=None,
+        **kwargs):
+    """
+    Render a flame straight to a PNG without ever holding the whole image
+    or histogram in memory, so the size is limited by disk space instead
+    of RAM. The histogram is a TiledHistogram in dirname (the system
+    temporary directory by default) and the image is finished and written
+    band_height rows at a time.
+
+    Extra keyword arguments override the other renderer settings, see
+    tonemap.finish_bands()
+    """
+    width, height = flame.dimensions
+    histogram = TiledHistogram(
+        width * oversample,
+        height * oversample,
+        flame.viewport,
+        tile_size=tile_size,
+        dirname=dirname)
+    with histogram:
+        render_histogram(
+            flame,
+            quality=quality,
+            oversample=oversample,
+            seed=seed,
+            histogram=histogram)
+        bands = tonemap.finish_bands(
+            histogram, band_height, oversample=oversample, **kwargs)
+        with open(fname, 'wb') as f:
+            with PNGWriter(f, width, height) as png:
+                for band in bands:
+                    png.write_rows(band)
+
+def render_frames(
+        flames,
+        dirname,
+        name_format='frame_{:04}.png',
+        warm_start=True,
+        **kwargs):
+    """
+    Render a sequence of flames to numbered PNGs in a directory, in the
+    form make_gif.sh expects. Each frame starts from the points of the
+    previous one unless warm_start is False. Keyword arguments are passed
+    to render_flame()
+    """
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    warm_start = WarmStart() if warm_start else None
+    for i, flame in enumerate(flames):
+        render_flame(
+            flame,
+            os.path.join(dirname, name_format.format(i)),
+            warm_start=warm_start,
+            **kwargs)
+
+def compare_warm_start(flames, quality=QUALITY, seed=None, **kwargs):
+    """
+    Check the quality of warm-started renders against cold starts. For
+    every flame this yields (warm error, noise floor, warm), where the
+    warm error is the mean absolute difference between the warm-started
+    frame and a cold-started one, the noise floor is the same difference
+    between two cold starts with different seeds, and warm is False if the
+    frame fell back to a cold start
+    """
+    rng = chaos_game.make_rng(seed)
+    warm_start = WarmStart()
+    for flame in flames:
+        warm_frames = warm_start.warm_frames
+        warm = render_flame(
+            flame, quality=quality, seed=rng, warm_start=warm_start, **kwargs)
+        cold = render_flame(flame, quality=quality, seed=rng, **kwargs)
+        other = render_flame(flame, quality=quality, seed=rng, **kwargs)
+        yield (
+            np.abs(warm.astype(float) - cold).mean(),
+            np.abs(other.astype(float) - cold).mean(),
+            warm_start.warm_frames > warm_frames)
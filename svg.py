@@ -0,0 +1,264 @@
+"""
+Streaming SVG export for collections of Clines
+
+Shapes are written to the file one at a time (or one chunk at a time
+for a ClineArray), so a huge circle packing never has to be held in memory
+as a string. Anything outside the viewport or too small to see is culled
+before it is formatted, so the output only grows with what is visible.
+"""
+import numpy as np
+
+from cline_array import ClineArray, CIRCLE, POINT, LINE
+
+class SVGWriter(object):
+    """
+    Write Clines to an SVG file incrementally. Use it as a context manager
+    so the header and footer are written:
+
+    with open('packing.svg', 'w') as f:
+        with SVGWriter(f, viewport=(-2, -2, 2, 2)) as svg:
+            svg.write_clines(clines)
+    """
+    # How many shapes of a ClineArray to format per f.write() call
+    CHUNK_SIZE = 4096
+
+    def __init__(
+            self,
+            f,
+            viewport=(-2.0, -2.0, 2.0, 2.0),
+            width=1000,
+            min_size=0.5,
+            stroke='black',
+            stroke_width=1.0,
+            background=None,
+            clip_circle=None):
+        """
+        f: a writable text file object
+        viewport: (x_min, y_min, x_max, y_max) of the region of the complex
+            plane to draw
+        width: width of the image in pixels. The height is chosen to keep
+            the aspect ratio of the viewport
+        min_size: circles with a radius smaller than this many pixels
+            are culled
+        clip_circle: optional (center, radius) in the plane. Only the
+            parts of shapes inside this circle are drawn, e.g. the unit
+            disk for hyperbolic tilings
+        """
+        self.f = f
+        self.x_min, self.y_min, self.x_max, self.y_max = [
+            float(x) for x in viewport]
+        self.scale = width / (self.x_max - self.x_min)
+        self.width = width
+        self.height = (self.y_max - self.y_min) * self.scale
+        self.min_size = min_size
+        self.stroke = stroke
+        self.stroke_width = stroke_width
+        self.background = background
+        self.clip_circle = clip_circle
+        self.written = 0
+        self.culled = 0
+
+    def __enter__(self):
+        self.write_header()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.write_footer()
+
+    def write_header(self):
+        self.f.write(
+            '<svg xmlns="http://www.w3.org/2000/svg" '
+            'width="{0:.3f}" height="{1:.3f}" '
+            'viewBox="0 0 {0:.3f} {1:.3f}">\n'.format(self.width, self.height))
+        if self.background:
+            self.f.write('<rect width="100%" height="100%" fill="{}" />\n'.format(
+                self.background))
+        clip = ''
+        if self.clip_circle is not None:
+            center, radius = self.clip_circle
+            cx, cy = self.to_pixels(complex(center).real, complex(center).imag)
+            self.f.write(
+                '<defs><clipPath id="clip"><circle cx="{:.3f}" cy="{:.3f}" '
+                'r="{:.3f}" /></clipPath></defs>\n'.format(
+                    cx, cy, radius * self.scale))
+            clip = ' clip-path="url(#clip)"'
+        self.f.write(
+            '<g fill="none" stroke="{}" stroke-width="{}"{}>\n'.format(
+                self.stroke, self.stroke_width, clip))
+
+    def write_footer(self):
+        self.f.write('</g>\n</svg>\n')
+
+    def to_pixels(self, x, y):
+        """
+        Convert plane coordinates to pixel coordinates. The y axis is
+        flipped so the imaginary axis points up
+        """
+        return ((x - self.x_min) * self.scale, (self.y_max - y) * self.scale)
+
+    def write_cline(self, cline):
+        """
+        Write a single Cline
+        """
+        self.write_chunk(ClineArray.from_clines([cline]))
+
+    def write_params(self, params):
+        """
+        Write a shape in the form returned by Cline.params. Imaginary
+        circles and non-circles have nothing to draw and are skipped.
+        """
+        shape = params[0]
+        if shape == 'circle':
+            _, center, radius = params
+            self.write_circles(
+                np.array([center.real]),
+                np.array([center.imag]),
+                np.array([abs(radius)]))
+        elif shape == 'point':
+            _, center = params
+            self.write_points(np.array([center.real]), np.array([center.imag]))
+        elif shape == 'line':
+            _, A, B, C = params
+            self.write_lines(
+                np.array([A]), np.array([B]), np.array([complex(C).real]))
+        else:
+            self.culled += 1
+
+    def write_clines(self, clines):
+        """
+        Write an iterable of Clines or a ClineArray. Either way they are
+        packed into chunks and culled and formatted in bulk
+        """
+        if not isinstance(clines, ClineArray):
+            chunk = []
+            for cline in clines:
+                chunk.append(cline)
+                if len(chunk) == self.CHUNK_SIZE:
+                    self.write_chunk(ClineArray.from_clines(chunk))
+                    chunk = []
+            if chunk:
+                self.write_chunk(ClineArray.from_clines(chunk))
+            return
+
+        flat = ClineArray(clines.matrices.reshape(-1, 2, 2))
+        for start in range(0, len(flat), self.CHUNK_SIZE):
+            self.write_chunk(flat[start:start + self.CHUNK_SIZE])
+
+    def write_chunk(self, chunk):
+        """
+        Write a 1D ClineArray
+        """
+        types = chunk.classify
+
+        circles = types == CIRCLE
+        centers = chunk.centers[circles]
+        self.write_circles(centers.real, centers.imag, chunk.radii[circles])
+
+        points = types == POINT
+        centers = chunk.centers[points]
+        self.write_points(centers.real, centers.imag)
+
+        lines = types == LINE
+        coeffs = chunk.line_coefficients[lines]
+        self.write_lines(coeffs[:, 0], coeffs[:, 1], coeffs[:, 2])
+
+        self.culled += np.count_nonzero(~(circles | points | lines))
+
+    def write_circles(self, x, y, radius):
+        """
+        Write circles given arrays of center coordinates and radii.
+
+        A circle is culled if it is smaller than min_size pixels, if its
+        bounding box misses the viewport, or if the viewport lies entirely
+        inside the circle (so none of the outline is visible)
+        """
+        big_enough = radius * self.scale >= self.min_size
+        overlaps = (
+            (x + radius >= self.x_min) & (x - radius <= self.x_max) &
+            (y + radius >= self.y_min) & (y - radius <= self.y_max))
+
+        # Distance from the center to the farthest corner of the viewport
+        far_x = np.maximum(np.abs(x - self.x_min), np.abs(x - self.x_max))
+        far_y = np.maximum(np.abs(y - self.y_min), np.abs(y - self.y_max))
+        encloses_viewport = np.hypot(far_x, far_y) < radius
+
+        visible = big_enough & overlaps & ~encloses_viewport
+        self.culled += len(x) - np.count_nonzero(visible)
+
+        px, py = self.to_pixels(x[visible], y[visible])
+        pr = radius[visible] * self.scale
+        self.f.write("".join(
+            '<circle cx="{:.3f}" cy="{:.3f}" r="{:.3f}" />\n'.format(*row)
+            for row in zip(px, py, pr)))
+        self.written += len(pr)
+
+    def write_points(self, x, y):
+        """
+        Write point circles as small dots. Points outside the viewport
+        are culled
+        """
+        visible = (
+            (x >= self.x_min) & (x <= self.x_max) &
+            (y >= self.y_min) & (y <= self.y_max))
+        self.culled += len(x) - np.count_nonzero(visible)
+
+        px, py = self.to_pixels(x[visible], y[visible])
+        self.f.write("".join(
+            '<circle cx="{:.3f}" cy="{:.3f}" r="{}" fill="{}" />\n'.format(
+                cx, cy, self.stroke_width, self.stroke)
+            for cx, cy in zip(px, py)))
+        self.written += len(px)
+
+    def write_lines(self, A, B, C):
+        """
+        Write lines Ax + By = C clipped to the viewport. Lines that miss
+        the viewport are culled.
+        """
+        norm_squared = A * A + B * B
+        valid = norm_squared > 0
+        safe_norm = np.where(valid, norm_squared, 1.0)
+
+        # Parameterize the line as p0 + t * direction
+        x0 = A * C / safe_norm
+        y0 = B * C / safe_norm
+        dx = -B
+        dy = A
+
+        # Liang-Barsky clipping against the viewport
+        t_min = np.full(len(A), -np.inf)
+        t_max = np.full(len(A), np.inf)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for p0, dp, low, high in (
+                    (x0, dx, self.x_min, self.x_max),
+                    (y0, dy, self.y_min, self.y_max)):
+                t1 = (low - p0) / dp
+                t2 = (high - p0) / dp
+                parallel = dp == 0
+                inside = (p0 >= low) & (p0 <= high)
+                t_min = np.where(
+                    parallel, t_min, np.maximum(t_min, np.minimum(t1, t2)))
+                t_max = np.where(
+                    parallel, t_max, np.minimum(t_max, np.maximum(t1, t2)))
+                valid &= ~parallel | inside
+
+        visible = valid & (t_min <= t_max)
+        self.culled += len(A) - np.count_nonzero(visible)
+
+        x0, y0, dx, dy = x0[visible], y0[visible], dx[visible], dy[visible]
+        t_min, t_max = t_min[visible], t_max[visible]
+        px1, py1 = self.to_pixels(x0 + t_min * dx, y0 + t_min * dy)
+        px2, py2 = self.to_pixels(x0 + t_max * dx, y0 + t_max * dy)
+        self.f.write("".join(
+            '<line x1="{:.3f}" y1="{:.3f}" x2="{:.3f}" y2="{:.3f}" />\n'.format(
+                *row)
+            for row in zip(px1, py1, px2, py2)))
+        self.written += len(px1)
+
+def save_svg(fname, clines, **kwargs):
+    """
+    Write Clines (a list or a ClineArray) to an SVG file. Keyword
+    arguments are passed through to SVGWriter
+    """
+    with open(fname, 'w') as f:
+        with SVGWriter(f, **kwargs) as svg:
+            svg.write_clines(clines)
@@ -0,0 +1,275 @@
+"""
+Finishing stage of the native renderer: turn an accumulated histogram
+(see histogram.py) into an RGB image the way flam3 interprets the
+renderer settings of the <flame> tag.
+
+1. Log-density scaling. Every cell is scaled so its alpha becomes
+   k1 * log10(1 + count * k2), where k1 comes from the brightness and k2
+   is the number of pixels per sample.
+2. Density estimation. Sparse cells are noisy, so each cell is blurred
+   with a kernel whose width shrinks with the number of points in it,
+   estimator_radius / count^estimator_curve (never below
+   estimator_minimum). The spatial filter is folded into the same blur.
+3. The supersampled image is averaged down by the oversample factor.
+4. Gamma correction, with a linear ramp below gamma_threshold so dark
+   areas don't get noisy.
+
+A per-cell blur width would be expensive to apply directly. Instead the
+cells are grouped into levels of similar width, each level is blurred with
+a single Gaussian in the frequency domain, and the levels are summed
+before one inverse FFT. Everything is vectorized with NumPy, so a
+500x500 frame takes a fraction of a second.
+"""
+import math
+
+import numpy as np
+
+from flame import Flame
+from histogram import COUNT
+
+# Ratio between the kernel widths of consecutive density estimation levels
+LEVEL_RATIO = 1.5
+
+# Kernels narrower than this many (supersampled) pixels are not blurred
+MIN_KERNEL_WIDTH = 0.5
+
+# Gaussians are cut off this many standard deviations out
+GAUSSIAN_CUTOFF = 3.0
+
+def log_density(
+        buffer, total_samples, brightness=Flame.BRIGHTNESS, num_pixels=None):
+    """
+    Scale the color sums and counts of every cell by
+    k1 * log10(1 + count * k2) / count. Afterwards the COUNT channel holds
+    the alpha of the cell and the RGB channels hold its mean color times
+    its alpha.
+
+    num_pixels is the size of the whole histogram when buffer is only part
+    of it
+    """
+    counts = buffer[..., COUNT]
+    if num_pixels is None:
+        num_pixels = counts.size
+    k1 = brightness * 268.0 / 256.0
+    k2 = num_pixels / float(max(total_samples, 1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scale = np.where(
+            counts > 0, k1 * np.log10(1.0 + counts * k2) / counts, 0.0)
+    return buffer * scale[..., np.newaxis]
+
+def kernel_widths(counts, radius, minimum=0.0, curve=0.4):
+    """
+    Width of the density estimation kernel for each cell in pixels
+    """
+    with np.errstate(divide='ignore'):
+        widths = radius / np.maximum(counts, 1.0) ** curve
+    return np.clip(widths, minimum, radius)
+
+def fast_length(n):
+    """
+    Smallest length >= n with no prime factors above 5. FFTs of these
+    lengths are much faster than for lengths with large prime factors
+    """
+    while True:
+        m = n
+        for p in (2, 3, 5):
+            while m % p == 0:
+                m //= p
+        if m == 1:
+            return n
+        n += 1
+
+def kernel_transfer(freqs, sigma):
+    """
+    Discrete Fourier transform of a sampled, normalized 1D Gaussian cut
+    off at GAUSSIAN_CUTOFF * sigma, evaluated at the given frequencies.
+
+    Using the sampled kernel rather than the transform of the continuous
+    Gaussian keeps the blur local, so it doesn't depend on the FFT size
+    """
+    if sigma == 0.0:
+        return np.ones(len(freqs))
+    n = np.arange(1, int(math.ceil(GAUSSIAN_CUTOFF * sigma)) + 1)
+    weights = np.exp(-0.5 * (n / sigma) ** 2)
+    cosines = np.cos(2.0 * np.pi * n[:, np.newaxis] * freqs[np.newaxis, :])
+    return (1.0 + 2.0 * weights.dot(cosines)) / (1.0 + 2.0 * weights.sum())
+
+def gaussian_transfer(shape, sigma):
+    """
+    Transfer function of a Gaussian blur for an rfft2 of the given shape.
+    The blur is separable, so this is the outer product of the 1D
+    transforms
+    """
+    fy = kernel_transfer(np.fft.fftfreq(shape[0]), sigma)
+    fx = kernel_transfer(np.fft.rfftfreq(shape[1]), sigma)
+    return fy[:, np.newaxis] * fx[np.newaxis, :]
+
+def density_levels(widths, radius):
+    """
+    Group cells by kernel width. Level k has width radius / LEVEL_RATIO^k,
+    the last level collects every cell that is too narrow to blur.
+
+    Returns (level index of every cell, list of Gaussian sigmas)
+    """
+    if radius < MIN_KERNEL_WIDTH:
+        return np.zeros(widths.shape, dtype=int), [0.0]
+    num_levels = int(
+        math.ceil(math.log(radius / MIN_KERNEL_WIDTH, LEVEL_RATIO))) + 1
+    # The kernel width is its radius, where the Gaussian is cut off
+    sigmas = [
+        radius / (GAUSSIAN_CUTOFF * LEVEL_RATIO ** k)
+        for k in range(num_levels - 1)]
+    sigmas.append(0.0)
+    levels = np.rint(np.log(radius / widths) / math.log(LEVEL_RATIO))
+    levels = np.where(
+        widths < MIN_KERNEL_WIDTH,
+        num_levels - 1,
+        np.clip(levels, 0, num_levels - 2))
+    return levels.astype(int), sigmas
+
+def blur(buffer, counts, filter_sigma, estimator=None):
+    """
+    Blur every cell of buffer with a Gaussian. filter_sigma is the
+    spatial filter applied to every cell. estimator is None, or
+    (radius, minimum, curve) in pixels for the density estimation kernel
+    chosen from counts
+    """
+    if estimator is None:
+        levels = np.zeros(counts.shape, dtype=int)
+        de_sigmas = [0.0]
+    else:
+        radius, minimum, curve = estimator
+        widths = kernel_widths(counts, radius, minimum, curve)
+        levels, de_sigmas = density_levels(widths, radius)
+
+    # Both blurs are Gaussian, so applying one after the other is a single
+    # Gaussian with the variances added
+    sigmas = [math.hypot(s, filter_sigma) for s in de_sigmas]
+    if max(sigmas) == 0.0:
+        return buffer
+
+    # Pad so the circular convolution doesn't wrap around the edges
+    height, width = counts.shape
+    pad = blur_radius(filter_sigma, estimator)
+    shape = (fast_length(height + pad), fast_length(width + pad))
+
+    spectrum = None
+    for level, sigma in enumerate(sigmas):
+        mask = levels == level
+        if not np.any(mask):
+            continue
+        masked = np.where(mask[..., np.newaxis], buffer, 0.0)
+        level_spectrum = np.fft.rfft2(masked, s=shape, axes=(0, 1))
+        level_spectrum *= gaussian_transfer(shape, sigma)[..., np.newaxis]
+        if spectrum is None:
+            spectrum = level_spectrum
+        else:
+            spectrum += level_spectrum
+
+    if spectrum is None:
+        return buffer
+    blurred = np.fft.irfft2(spectrum, s=shape, axes=(0, 1))
+    return blurred[:height, :width]
+
+def downsample(buffer, oversample):
+    """
+    Average blocks of oversample x oversample cells
+    """
+    if oversample == 1:
+        return buffer
+    height = buffer.shape[0] // oversample
+    width = buffer.shape[1] // oversample
+    blocks = buffer[:height * oversample, :width * oversample].reshape(
+        (height, oversample, width, oversample) + buffer.shape[2:])
+    return blocks.mean(axis=(1, 3))
+
+def gamma_curve(alpha, gamma=Flame.GAMMA, threshold=Flame.GAMMA_THRESHOLD):
+    """
+    alpha^(1/gamma), replaced with a line through the origin below the
+    threshold since the power curve is very steep near 0
+    """
+    alpha = np.maximum(alpha, 0.0)
+    if threshold <= 0:
+        return alpha ** (1.0 / gamma)
+    slope = threshold ** (1.0 / gamma) / threshold
+    return np.where(
+        alpha < threshold, alpha * slope, alpha ** (1.0 / gamma))
+
+def tone_map(buffer, gamma=Flame.GAMMA, gamma_threshold=Flame.GAMMA_THRESHOLD):
+    """
+    Convert a log-scaled buffer to 8-bit RGB. Each pixel gets its mean
+    color scaled by the gamma corrected alpha
+    """
+    alpha = buffer[..., COUNT]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scale = np.where(
+            alpha > 0, gamma_curve(alpha, gamma, gamma_threshold) / alpha, 0.0)
+    rgb = buffer[..., :COUNT] * scale[..., np.newaxis]
+    return (np.clip(rgb, 0.0, 255.0) + 0.5).astype(np.uint8)
+
+def blur_radius(filter_sigma, estimator=None):
+    """
+    How far blur() can move light, in pixels
+    """
+    sigma = filter_sigma
+    if estimator is not None and estimator[0] >= MIN_KERNEL_WIDTH:
+        sigma = math.hypot(estimator[0] / GAUSSIAN_CUTOFF, filter_sigma)
+    return int(math.ceil(GAUSSIAN_CUTOFF * sigma))
+
+def finish_bands(
+        histogram,
+        band_height=None,
+        oversample=Flame.OVERSAMPLE,
+        filter=Flame.FILTER,
+        brightness=Flame.BRIGHTNESS,
+        gamma=Flame.GAMMA,
+        gamma_threshold=Flame.GAMMA_THRESHOLD,
+        estimator_radius=Flame.ESTIMATOR_RADIUS,
+        estimator_minimum=Flame.ESTIMATOR_MINIMUM,
+        estimator_curve=Flame.ESTIMATOR_CURVE,
+        density_estimation=True):
+    """
+    Finish a histogram accumulated at oversample times the output
+    resolution, yielding the uint8 RGB image in bands of band_height
+    output rows (by default the whole image at once).
+
+    Each band is read from the histogram together with enough rows above
+    and below for the blur, so only one band is ever in memory and the
+    result is the same as finishing the whole image at once.
+
+    The filter and estimator sizes are given in output pixels like in the
+    <flame> tag, they are scaled up by oversample internally
+    """
+    estimator = None
+    if density_estimation:
+        estimator = (
+            estimator_radius * oversample,
+            estimator_minimum * oversample,
+            estimator_curve)
+    filter_sigma = filter * oversample
+
+    # Keep the bands aligned to whole output pixels
+    halo = -(-blur_radius(filter_sigma, estimator) // oversample) * oversample
+    height = (histogram.height // oversample) * oversample
+    if band_height is None:
+        band_height = height
+    else:
+        band_height *= oversample
+
+    for start in range(0, height, band_height):
+        stop = min(start + band_height, height)
+        first = max(start - halo, 0)
+        last = min(stop + halo, histogram.height)
+        buffer = histogram.read_rows(first, last)
+        scaled = log_density(
+            buffer, histogram.total_samples, brightness, histogram.num_pixels)
+        blurred = blur(scaled, buffer[..., COUNT], filter_sigma, estimator)
+        band = blurred[start - first:stop - first]
+        yield tone_map(downsample(band, oversample), gamma, gamma_threshold)
+
+def finish(histogram, **kwargs):
+    """
+    Turn a histogram into a uint8 RGB image of shape (height, width, 3).
+    See finish_bands() for the keyword arguments
+    """
+    return np.concatenate(list(finish_bands(histogram, **kwargs)))
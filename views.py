@@ -2,7 +2,10 @@
 Transformations that rotate the Riemann sphere
 to get a different view
 """
+import numpy as np
+
 from mobius import Mobius
+from mobius_array import MobiusArray
 import basic_maps
 
 # 180 degree rotations of the sphere
@@ -31,3 +34,79 @@ def rotate_y(theta):
     Same idea as rotate_x, but this time we want to rotate around the y-axis
     """
     return basic_maps.rotate(theta).conjugate_by(Rx_90.inv)
+
+# Batched versions of the above. These take an array of real angles and
+# return a MobiusArray with one rotation per angle
+def real_angles(thetas):
+    """
+    Convert angles to a float array. Complex angles would not be rotations,
+    so they raise a ValueError instead of losing their imaginary part
+    """
+    thetas = np.asarray(thetas)
+    if np.iscomplexobj(thetas):
+        raise ValueError(
+            'Rotation angles must be real, got dtype {}'.format(thetas.dtype))
+    return thetas.astype(float)
+
+def rotations_z(thetas):
+    """
+    Rotations about the z axis, z -> e^(i * theta) * z, normalized to have
+    determinant 1
+    """
+    half = np.exp(0.5j * real_angles(thetas))
+    return MobiusArray.from_coefficients(half, 0, 0, half.conj())
+
+def rotations_x(thetas):
+    """
+    Batched rotate_x
+    """
+    return rotations_z(thetas).conjugate_by(Ry_90)
+
+def rotations_y(thetas):
+    """
+    Batched rotate_y
+    """
+    return rotations_z(thetas).conjugate_by(Rx_90.inv)
+
+class CameraPath(object):
+    """
+    A path of sphere rotations for an animation. Each angle is given by a
+    real-valued ParametricCurve of [0, 1] -> radians (complex values raise
+    a ValueError). The view at time t is
+
+    V(t) = Rz(z(t)) * Ry(y(t)) * Rx(x(t)) * base
+
+    where base is an optional fixed starting view like Rx_90.
+    """
+    def __init__(self, curve_x=None, curve_y=None, curve_z=None, base=None):
+        self.curve_x = curve_x
+        self.curve_y = curve_y
+        self.curve_z = curve_z
+        self.base = base or basic_maps.identity
+
+    def angles(self, curve, times):
+        if curve is None:
+            return np.zeros(len(times))
+        return real_angles([curve(t) for t in times])
+
+    def views(self, times):
+        """
+        Compute the view for every time in one batched call. Returns a
+        MobiusArray of shape (len(times),)
+        """
+        rx = rotations_x(self.angles(self.curve_x, times))
+        ry = rotations_y(self.angles(self.curve_y, times))
+        rz = rotations_z(self.angles(self.curve_z, times))
+        return rz * ry * rx * self.base
+
+    def conjugate(self, xforms, times):
+        """
+        Conjugate a fixed list of transformations by the view of every
+        frame in a single vectorized step:
+
+        T'(t) = V(t) * T * V(t)^-1
+
+        Returns a MobiusArray of shape (len(times), len(xforms))
+        """
+        views = self.views(times)[:, np.newaxis]
+        return MobiusArray.from_mobius(xforms).conjugate_by(views)
@@ -0,0 +1,495 @@
+"""
+Viewport-aware word trees for limit sets and circle orbits
+
+The limit set of a group is drawn by following the tree of reduced words
+in its generators (Indra's Pearls, chapter 7). The limit points whose
+words start with w lie in a bounding disk, and that disk shrinks as w
+gets longer, so a word is extended until it is smaller than a pixel.
+
+Every word whose disk misses the viewport is pruned with its whole
+subtree, so only the visible part of the tree is explored. Deep zooms
+then cost about the same as the full view, since the work grows with the
+number of pixels the limit set covers rather than with the zoom:
+
+xforms = group_recipes.grandmas_recipe(1.887 + .05j, 2, False)
+tree = WordTree(xforms)
+# The attracting fixed point of the first generator is a limit point
+center = tree.sinks[0]
+for i in range(100):
+    viewport = make_viewport(center, 4.0 * 0.9 ** i)
+    points = limit_set(tree, viewport, width=1000)
+
+Zooming into a point that is not on the limit set ends in an empty view.
+
+The letters are the generators followed by their inverses, in the order
+group_recipes.make_group() returns them. Unless disks are given, the
+bounding disks are fitted to sampled limit points with a wide margin, so
+in principle a word can be pruned while it still has a limit point in
+view. Near parabolic fixed points the words shrink slowly, so zooming
+right into a cusp runs into WordTree.MAX_LENGTH.
+
+The group only comes into the picture through the tree, unlike
+Flame.zoom, which just rescales the final image.
+"""
+import numpy as np
+
+from cline_array import ClineArray
+from mobius_array import MobiusArray
+
+DEFAULT_VIEWPORT = (-2.0, -2.0, 2.0, 2.0)
+
+def make_viewport(center, width, height=None):
+    """
+    (x_min, y_min, x_max, y_max) of the region of the given width (and
+    height, square by default) around a complex center
+    """
+    height = width if height is None else height
+    return (
+        center.real - 0.5 * width,
+        center.imag - 0.5 * height,
+        center.real + 0.5 * width,
+        center.imag + 0.5 * height)
+
+def inverse_letters(num_letters):
+    """
+    Index of the inverse of every letter, when the letters are the
+    generators followed by their inverses
+    """
+    half = num_letters // 2
+    return np.concatenate([
+        np.arange(half, num_letters), np.arange(half)])
+
+def reduced_words(num_letters, length):
+    """
+    Every reduced word of the given length (no letter next to its
+    inverse) as an int array of shape (num_words, length)
+    """
+    inverses = inverse_letters(num_letters)
+    words = np.arange(num_letters)[:, np.newaxis]
+    for _ in range(length - 1):
+        words = np.repeat(words, num_letters, axis=0)
+        letters = np.tile(np.arange(num_letters), len(words) // num_letters)
+        allowed = letters != inverses[words[:, -1]]
+        words = np.column_stack([words, letters])[allowed]
+    return words
+
+def word_codes(words, num_letters):
+    """
+    One integer per row of an int array of letters, increasing in the
+    same order as reduced_words() lists words of the same length
+    """
+    powers = num_letters ** np.arange(words.shape[1])[::-1]
+    return (words * powers).sum(axis=1)
+
+def transform_disks(xforms, centers, radii):
+    """
+    Images of the disks |z - center| <= radius under a batch of maps,
+    broadcasting like ClineArray.transform. Returns (centers, radii). An
+    image that isn't a bounded disk (the pole -d / c of the map is in the
+    disk) has an infinite radius and a NaN center.
+
+    With e = |c z0 + d|^2 - |c|^2 r^2, which is positive exactly when the
+    pole is outside the disk, the image of the disk about z0 of radius r
+    has radius r |det| / e and center
+    ((a z0 + b) conj(c z0 + d) - a conj(c) r^2) / e.
+    Unlike going through the cline matrix, this doesn't cancel when the
+    image is much smaller than its distance from 0
+    """
+    dtype = xforms.dtype
+    centers = np.asarray(centers, dtype=dtype)
+    radii = np.asarray(radii, dtype=np.finfo(dtype).dtype)
+    a, b, c, d = xforms.a, xforms.b, xforms.c, xforms.d
+    top = a * centers + b
+    bottom = c * centers + d
+    r_squared = radii * radii
+    e = np.abs(bottom) ** 2 - np.abs(c) ** 2 * r_squared
+    bounded = (e > 0) & np.isfinite(e)
+    safe_e = np.where(bounded, e, 1)
+    image_centers = (
+        top * np.conjugate(bottom) - a * np.conjugate(c) * r_squared) / safe_e
+    image_radii = radii * np.abs(xforms.det) / safe_e
+    return (
+        np.where(bounded, image_centers, complex('nan')),
+        np.where(bounded, image_radii, np.inf))
+
+def bounding_disks(points, margin=0.0):
+    """
+    Disks around the points along the last axis, centered on their
+    bounding box, with the distance to the farthest point plus the
+    relative margin as the radius. Returns (centers, radii). Sets of
+    points that reach infinity get an infinite radius
+    """
+    points = np.asarray(points)
+    with np.errstate(invalid='ignore'):
+        centers = 0.5 * (
+            points.real.min(axis=-1) + points.real.max(axis=-1) +
+            1j * (points.imag.min(axis=-1) + points.imag.max(axis=-1)))
+        radii = np.abs(points - centers[..., np.newaxis]).max(axis=-1)
+    finite = np.isfinite(points).all(axis=-1)
+    return (
+        np.where(finite, centers, complex('nan')),
+        np.where(finite, radii * (1 + margin), np.inf))
+
+def disks_meet_viewport(centers, radii, viewport):
+    """
+    Whether each disk intersects the rectangle viewport. Unbounded disks
+    always do
+    """
+    x_min, y_min, x_max, y_max = viewport
+    with np.errstate(invalid='ignore'):
+        dx = np.clip(centers.real, x_min, x_max) - centers.real
+        dy = np.clip(centers.imag, y_min, y_max) - centers.imag
+        return np.isinf(radii) | (dx * dx + dy * dy <= radii * radii)
+
+def pixel_size(viewport, width):
+    x_min, _, x_max, _ = viewport
+    return (x_max - x_min) / float(width)
+
+class WordTree(object):
+    """
+    The reduced words in a list of generators followed by their inverses,
+    with bounding disks for the limit points that start with every short
+    word.
+
+    Disks around the limit points of a single letter are too coarse: they
+    overlap the other letters, so the pole of a long product often lands
+    in one and its image isn't a disk any more. So the search uses the
+    disks of suffixes of SUFFIX_LENGTH letters instead, and the word
+    w = p s with a suffix s of that length gets the disk p(D_s).
+
+    Disks are only used to prune. They are much bigger than the limit
+    points they hold, so a word is a leaf when the images of the outline
+    of its suffix (a few sampled limit points, see fit_outlines()) are
+    within a pixel of each other
+    """
+    # Length of the suffixes with their own bounding disk
+    SUFFIX_LENGTH = 3
+
+    # The disks are fitted to the limit points of all words this many
+    # letters longer than the suffixes
+    SAMPLE_LETTERS = 6
+
+    # Relative margin added to the fitted disks. Sampling misses the far
+    # ends of spirals, which can reach past twice the sampled radius
+    MARGIN = 2.0
+
+    # Sampled limit points kept for every suffix, see fit_outlines()
+    OUTLINE_POINTS = 8
+
+    # Products are renormalized every so many letters to stop them
+    # drifting away from determinant 1
+    RENORMALIZE_EVERY = 8
+
+    # Near parabolic fixed points the words only shrink like 1 / n, so
+    # the search needs long words before giving up
+    MAX_LENGTH = 1000
+    MAX_WORDS = 1 << 22
+
+    def __init__(
+            self,
+            xforms,
+            disks=None,
+            dtype=complex,
+            suffix_length=SUFFIX_LENGTH):
+        """
+        xforms: a list of Mobius maps or a MobiusArray, the generators
+            followed by their inverses
+        disks: (centers, radii), one disk for each letter that contains
+            every limit point whose word starts with that letter. For a
+            Schottky group these are the pairing circles: the inside of
+            the circle that the generator x maps the outside of another
+            circle onto. By default disks are fitted to sampled limit
+            points, see fit_disks()
+        dtype: complex dtype of the products, see mobius_array
+        """
+        if not isinstance(xforms, MobiusArray):
+            xforms = MobiusArray.from_mobius(xforms)
+        if len(xforms) % 2 != 0:
+            raise ValueError(
+                "Expected generators followed by their inverses")
+        if suffix_length < 2:
+            raise ValueError("Suffixes need at least 2 letters")
+        self.letters = xforms.astype(dtype).normalize
+        self.inverses = inverse_letters(len(xforms))
+        self.sinks = np.array([x.sink for x in xforms.normalize])
+        self.suffix_length = suffix_length
+
+        # Every reduced word of 1 ... suffix_length letters, with the
+        # products of the words and of all but their last letter
+        self.short_words = [None] + [
+            reduced_words(len(self), length)
+            for length in range(1, suffix_length + 1)]
+        self.products = [None] + [
+            self.compose(words) for words in self.short_words[1:]]
+        self.heads = [None] + [
+            self.compose(words[:, :-1]) for words in self.short_words[1:]]
+
+        # Going from a word ending in the tail t (the last
+        # suffix_length - 1 letters) to the word with one more letter x
+        # makes the suffix next_suffix[t, x], or -1 if x cancels
+        tails = self.short_words[suffix_length - 1]
+        suffixes = self.short_words[suffix_length]
+        tail_lookup = dict(
+            (code, i) for i, code in enumerate(word_codes(tails, len(self))))
+        self.next_suffix = np.full((len(tails), len(self)), -1)
+        for i, code in enumerate(word_codes(suffixes[:, :-1], len(self))):
+            self.next_suffix[tail_lookup[code], suffixes[i, -1]] = i
+        self.suffix_tails = np.array([
+            tail_lookup[code]
+            for code in word_codes(suffixes[:, 1:], len(self))])
+
+        if disks is None:
+            self.disks = self.fit_disks()
+        else:
+            # The disk of a word p x is p(D_x)
+            centers, radii = disks
+            centers = np.asarray(centers, dtype=complex)
+            radii = np.asarray(radii, dtype=float)
+            self.disks = [None] + [
+                transform_disks(
+                    heads, centers[words[:, -1]], radii[words[:, -1]])
+                for words, heads in zip(self.short_words[1:], self.heads[1:])]
+        self.outlines = self.fit_outlines()
+
+    @property
+    def dtype(self):
+        return self.letters.dtype
+
+    def __len__(self):
+        return len(self.letters)
+
+    def compose(self, words):
+        """
+        Products of the rows of an int array of letters, as a MobiusArray
+        """
+        products = MobiusArray.identity(len(words), self.dtype)
+        for i in range(words.shape[1]):
+            products = products * self.letters[words[:, i]]
+        return products
+
+    def sample_points(self, length):
+        """
+        Limit points starting with every reduced word w of the given
+        length: w applied to the sinks of all the letters that can follow
+        it. Returns (words, points), with each word repeated once for
+        every point
+        """
+        words = reduced_words(len(self), length)
+        products = self.compose(words)
+        points = products.matrices[:, np.newaxis]
+        points = MobiusArray(points)(self.sinks)
+        allowed = np.arange(len(self)) != self.inverses[
+            words[:, -1]][:, np.newaxis]
+        rows, letters = np.nonzero(allowed)
+        return (words[rows], points[rows, letters])
+
+    def group_samples(self, words, length):
+        """
+        Indices of the sampled words that start with each reduced word of
+        the given length, in the order of self.short_words[length]
+        """
+        groups = np.searchsorted(
+            word_codes(self.short_words[length], len(self)),
+            word_codes(words[:, :length], len(self)))
+        return [
+            np.flatnonzero(groups == i)
+            for i in range(len(self.short_words[length]))]
+
+    def fit_disks(self, sample_letters=None, margin=None):
+        """
+        Bounding disks (see bounding_disks()) of the sampled limit points
+        that start with each short word, plus a relative margin (MARGIN by
+        default). Returns a list of (centers, radii) by word length
+        """
+        margin = self.MARGIN if margin is None else margin
+        words, points = self.sample_points(
+            self.suffix_length + (sample_letters or self.SAMPLE_LETTERS))
+        disks = [None]
+        for length in range(1, self.suffix_length + 1):
+            groups = self.group_samples(words, length)
+            centers = np.empty(len(groups), dtype=complex)
+            radii = np.empty(len(groups))
+            for i, group in enumerate(groups):
+                centers[i], radii[i] = bounding_disks(points[group], margin)
+            disks.append((centers, radii))
+        return disks
+
+    def fit_outlines(self, sample_letters=None):
+        """
+        For every suffix, the OUTLINE_POINTS sampled limit points starting
+        with it that reach farthest in evenly spaced directions, as a
+        complex array of shape (suffixes, OUTLINE_POINTS)
+        """
+        words, points = self.sample_points(
+            self.suffix_length + (sample_letters or self.SAMPLE_LETTERS))
+        angles = np.exp(
+            -2j * np.pi * np.arange(self.OUTLINE_POINTS) / self.OUTLINE_POINTS)
+        outlines = []
+        for group in self.group_samples(words, self.suffix_length):
+            z = points[group]
+            with np.errstate(invalid='ignore'):
+                reach = (z[:, np.newaxis] * angles).real
+                outlines.append(z[np.nanargmax(reach, axis=0)])
+        return np.array(outlines)
+
+    def word_disks(self, heads, suffixes):
+        """
+        Bounding disks and sizes of the words p s with heads p (a
+        MobiusArray) and suffix indices s. Returns (centers, radii, sizes)
+        where sizes are the radii of the images of the outlines.
+
+        Where the pole of p is inside D_s, the image of D_s isn't a disk,
+        which happens to every p = x^n near a parabolic fixed point of x.
+        Those words get an infinite radius and a NaN center, so they are
+        never pruned
+        """
+        centers, radii = self.disks[self.suffix_length]
+        word_centers, word_radii = transform_disks(
+            heads, centers[suffixes], radii[suffixes])
+        outlines = MobiusArray(heads.matrices[:, np.newaxis])(
+            self.outlines[suffixes])
+        return (word_centers, word_radii, bounding_disks(outlines)[1])
+
+    def explore(
+            self,
+            viewport=None,
+            min_size=0.0,
+            max_length=MAX_LENGTH,
+            max_words=MAX_WORDS):
+        """
+        Breadth-first search over the reduced words, yielding
+        (words, letters, centers, radii, sizes) for every word length:
+        the products as a MobiusArray, the last letter of each word, the
+        bounding disks of their limit points and the sizes of the words
+        (see word_disks()).
+
+        Words whose disk misses the viewport are pruned with all their
+        descendants. Words smaller than min_size are yielded but not
+        extended. The search stops at max_length letters or after
+        max_words words
+        """
+        num_words = 0
+        for length in range(1, min(self.suffix_length, max_length) + 1):
+            centers, radii = self.disks[length]
+            visible = np.ones(len(radii), dtype=bool)
+            if viewport is not None:
+                visible = disks_meet_viewport(centers, radii, viewport)
+            visible = np.flatnonzero(visible)[:max_words - num_words]
+            yield (
+                self.products[length][visible],
+                self.short_words[length][visible, -1],
+                centers[visible],
+                radii[visible],
+                radii[visible])
+            num_words += len(visible)
+            if num_words >= max_words:
+                return
+
+        # The frontier holds every word p t as the product of p and the
+        # index of the tail t. Extending it by x gives the suffix s = t x
+        suffix_letters = self.short_words[self.suffix_length]
+        suffix_products = self.products[self.suffix_length].matrices
+        centers, radii = self.disks[self.suffix_length]
+        keep = bounding_disks(self.outlines)[1] >= min_size
+        if viewport is not None:
+            keep &= disks_meet_viewport(centers, radii, viewport)
+        keep = np.flatnonzero(keep)
+        heads = MobiusArray(self.letters.matrices[suffix_letters[keep, 0]])
+        tails = self.suffix_tails[keep]
+
+        for length in range(self.suffix_length + 1, max_length + 1):
+            if len(tails) == 0:
+                return
+            parents, letters = np.nonzero(self.next_suffix[tails] >= 0)
+            suffixes = self.next_suffix[tails[parents], letters]
+            centers, radii, sizes = self.word_disks(
+                MobiusArray(heads.matrices[parents]), suffixes)
+            if viewport is not None:
+                visible = np.flatnonzero(
+                    disks_meet_viewport(centers, radii, viewport))
+                parents = parents[visible]
+                letters = letters[visible]
+                suffixes = suffixes[visible]
+                centers = centers[visible]
+                radii = radii[visible]
+                sizes = sizes[visible]
+
+            keep = max_words - num_words
+            words = MobiusArray(np.matmul(
+                heads.matrices[parents[:keep]],
+                suffix_products[suffixes[:keep]]))
+            yield (
+                words,
+                letters[:keep],
+                centers[:keep],
+                radii[:keep],
+                sizes[:keep])
+
+            num_words += len(words)
+            if num_words >= max_words:
+                return
+            extend = sizes >= min_size
+            heads = MobiusArray(np.matmul(
+                heads.matrices[parents[extend]],
+                self.letters.matrices[suffix_letters[suffixes[extend], 0]]))
+            if length % self.RENORMALIZE_EVERY == 0:
+                heads = heads.normalize
+            tails = self.suffix_tails[suffixes[extend]]
+
+def limit_set(
+        tree,
+        viewport=DEFAULT_VIEWPORT,
+        width=1000,
+        min_size=1.0,
+        max_length=WordTree.MAX_LENGTH,
+        max_words=WordTree.MAX_WORDS):
+    """
+    Limit points in the viewport, one for every word that has shrunk
+    below min_size pixels of an image of the given width. tree is a
+    WordTree or a list of generators followed by their inverses. Returns
+    a complex array
+    """
+    if not isinstance(tree, WordTree):
+        tree = WordTree(tree)
+    min_radius = 0.5 * min_size * pixel_size(viewport, width)
+    points = []
+    for words, letters, _, _, sizes in tree.explore(
+            viewport, min_radius, max_length, max_words):
+        leaves = sizes < min_radius
+        points.append(words[leaves](tree.sinks[letters[leaves]]))
+    points = np.concatenate(points) if points else np.zeros(0, complex)
+
+    x_min, y_min, x_max, y_max = viewport
+    visible = (
+        (points.real >= x_min) & (points.real <= x_max) &
+        (points.imag >= y_min) & (points.imag <= y_max))
+    return points[visible]
+
+def circle_orbit(
+        tree,
+        viewport=DEFAULT_VIEWPORT,
+        width=1000,
+        min_size=0.5,
+        max_length=WordTree.MAX_LENGTH,
+        max_words=WordTree.MAX_WORDS):
+    """
+    The images of the bounding disks under the words, nested like the
+    circles of a Schottky group, down to min_size pixels across. With
+    the pairing circles of a Schottky group as the disks of the tree
+    this is the classic picture of nested circles. Only circles that
+    meet the viewport are returned, as a ClineArray for svg.save_svg()
+    """
+    if not isinstance(tree, WordTree):
+        tree = WordTree(tree)
+    min_radius = 0.5 * min_size * pixel_size(viewport, width)
+    centers = []
+    radii = []
+    for _, _, level_centers, level_radii, _ in tree.explore(
+            viewport, min_radius, max_length, max_words):
+        visible = np.isfinite(level_radii) & (level_radii >= min_radius)
+        centers.append(level_centers[visible])
+        radii.append(level_radii[visible])
+    if not centers:
+        return ClineArray(np.zeros((0, 2, 2)))
+    return ClineArray.from_circles(
+        np.concatenate(centers), np.concatenate(radii), tree.dtype)